@@ -1,13 +1,17 @@
 import os
 import configparser
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, Response, jsonify
 from werkzeug.utils import secure_filename
-import collect_to_md
+import jobs
+import journal
 import md_to_pdf
+import metrics
+import progress_events
+import pdf_parts
+import render_cache
+import render_pool
 from datetime import datetime
 import threading
-import queue
-import time
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -18,9 +22,7 @@ os.makedirs('output', exist_ok=True)
 os.makedirs('uploads', exist_ok=True)
 
 CONFIG_FILE = 'config.txt'
-
-# Global message queue for progress updates
-progress_messages = {}
+JOBS_DB = os.path.join('data', 'jobs.sqlite3')
 
 # Add context processor for current year
 @app.context_processor
@@ -44,15 +46,14 @@ def load_config():
     return config
 
 def save_config(api_key, model_id, batch_size):
-    """Save configuration to config.txt"""
-    config = configparser.ConfigParser()
-    config['API'] = {
-        'api_key': api_key,
-        'model_id': model_id
-    }
-    config['Processing'] = {
-        'batch_size': batch_size
-    }
+    """Save configuration to config.txt, keeping any other settings already in the file"""
+    config = load_config()
+    for section in ('API', 'Processing'):
+        if not config.has_section(section):
+            config.add_section(section)
+    config['API']['api_key'] = api_key
+    config['API']['model_id'] = model_id
+    config['Processing']['batch_size'] = batch_size
     with open(CONFIG_FILE, 'w') as f:
         config.write(f)
 
@@ -93,83 +94,209 @@ def collect_to_md_route():
         # Get URLs from text area or file
         urls = request.form.get('urls', '')
         url_file = request.files.get('url_file')
+        # Input, output and journal are named after the job id, so simultaneous submissions never collide
+        task_id = jobs.new_job_id()
         
         if url_file and url_file.filename:
-            # Save uploaded file
-            filename = secure_filename(url_file.filename)
-            input_path = os.path.join('input', filename)
+            # Save uploaded file; it is only read when the queued job runs
+            input_path = os.path.join('input', f'{task_id}_{secure_filename(url_file.filename)}')
             url_file.save(input_path)
         elif urls:
             # Save text area content to file
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            input_path = os.path.join('input', f'urls_{timestamp}.txt')
+            input_path = os.path.join('input', f'{task_id}_urls.txt')
             with open(input_path, 'w', encoding='utf-8') as f:
                 f.write(urls)
         else:
             flash('Please provide URLs either in the text area or upload a file!', 'error')
             return redirect(url_for('collect_to_md_route'))
         
-        # Generate output filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_path = os.path.join('output', f'AI_news_summary_{timestamp}.md')
-        
-        # Create a unique task ID for this processing job
-        task_id = f"task_{timestamp}"
-        progress_messages[task_id] = queue.Queue()
+        output_path = os.path.join('output', f'AI_news_summary_{task_id}.md')
+        params = {'input': input_path, 'output': output_path}
         
-        # Start processing in a background thread
-        def process_task():
-            try:
-                # Define callback function to update progress
-                def progress_callback(message):
-                    progress_messages[task_id].put(message)
-                
-                # Call collect_to_md function with progress callback
-                collect_to_md.main(input_path, output_path, progress_callback)
-                
-                # Add a completion message with the download URL
-                progress_messages[task_id].put("COMPLETED:" + output_path)
-            except Exception as e:
-                progress_messages[task_id].put(f"ERROR: {str(e)}")
+        # Pipeline mode: convert the collected Markdown to PDF in the same job
+        if request.form.get('make_pdf'):
+            params['pdf'] = True
+            highlight_file = request.files.get('highlight_file')
+            if highlight_file and highlight_file.filename:
+                highlight_path = os.path.join('uploads', f'{task_id}_{secure_filename(highlight_file.filename)}')
+                highlight_file.save(highlight_path)
+                params['highlight'] = highlight_path
         
-        # Start the background thread
-        thread = threading.Thread(target=process_task)
-        thread.daemon = True
-        thread.start()
+        submit_collect_job(task_id, params)
         
         # Return the template with the task ID
-        return render_template('collect_to_md.html', task_id=task_id)
+        return render_template('collect_to_md.html', task_id=task_id,
+                               job_id=journal.job_id_for(output_path))
+    
+    return render_template('collect_to_md.html', resumable_jobs=journal.list_unfinished('output'))
+
+@app.route('/collect_to_md/resume/<job_id>', methods=['POST'])
+def resume_collect_to_md(job_id):
+    """Resume an interrupted collection job from its checkpoint journal"""
+    if not os.path.exists(journal.find_journal(job_id, 'output')):
+        flash(f'No checkpoint journal found for job {job_id}!', 'error')
+        return redirect(url_for('collect_to_md_route'))
     
-    return render_template('collect_to_md.html')
+    task_id = jobs.new_job_id()
+    submit_collect_job(task_id, {'resume': job_id})
+    return render_template('collect_to_md.html', task_id=task_id, job_id=job_id)
+
+def progress_callback(task_id):
+    """Return a callback that appends progress messages to the task's event log"""
+    return lambda message: event_log.append(task_id, message)
+
+def submit_collect_job(task_id, params):
+    """Queue a collection job; it runs when one of the job workers is free"""
+    event_log.append(task_id, '任务已加入队列，等待空闲的处理线程...')
+    job_queue.submit('collect', params, job_id=task_id)
+
+def run_collect_job(task_id, params, cancel_event):
+    """Job handler: run collect_to_md.main (or the whole pipeline when params['pdf'] is set),
+    reporting progress to the task's event log"""
+    report = progress_callback(task_id)
+    # Imported on first use: they pull in the openai SDK, which page requests never need
+    import collect_to_md
+    import pipeline
+    try:
+        if params.get('pdf'):
+            # URLs -> Markdown -> PDF in one job; the PDF link is announced before completion
+            results = pipeline.run(params.get('input'), params.get('output'), highlight_file=params.get('highlight'),
+                                   progress_callback=report, resume=params.get('resume'),
+                                   cancel_event=cancel_event, llm_slots=llm_slots,
+                                   pdf_cache=pdf_cache, pool=pdf_renderer, parts=pdf_part_renderer)
+            result_path = results[0] if results else None
+            if results and results[1]:
+                report("PDF_READY:" + results[1])
+        else:
+            # Call collect_to_md function with progress callback
+            result_path = collect_to_md.main(params.get('input'), params.get('output'), report,
+                                             resume=params.get('resume'), cancel_event=cancel_event,
+                                             llm_slots=llm_slots)
+    except BaseException as e:
+        # collect_to_md.main calls sys.exit() on fatal errors; report those too
+        report(f"ERROR: {str(e)}")
+        raise
+    
+    if cancel_event.is_set():
+        report("ERROR: Job cancelled")
+    else:
+        # Add a completion message with the download URL
+        report("COMPLETED:" + (result_path or params.get('output') or ''))
+    return result_path
+
+def recover_collect_job(job):
+    """Jobs interrupted by a server restart continue from their checkpoint journal"""
+    params = job['params']
+    output_path = params.get('output')
+    if output_path and os.path.exists(journal.journal_path(output_path)):
+        # Keep the pipeline settings (pdf, highlight) of the original submission
+        return dict(params, resume=output_path)
+    return params
+
+def report_cancelled(job_id):
+    """A job cancelled while still queued ends its event log too, so the stream closes and the reaper can drop it"""
+    event_log.append(job_id, "ERROR: Job cancelled")
+
+def observe_job_start(job, waited):
+    """Time a job spent queued before a worker picked it up, for /metrics"""
+    metrics.REGISTRY.observe('ai_news_job_queue_wait_seconds', waited, metrics.QUEUE_WAIT_BUCKETS, kind=job['kind'])
+
+server_config = load_config()
+job_queue = jobs.JobQueue(
+    JOBS_DB,
+    handlers={'collect': run_collect_job},
+    workers=server_config.getint('Server', 'job_workers', fallback=2),
+    on_recover=recover_collect_job,
+    on_start=observe_job_start,
+    on_cancel=report_cancelled,
+)
+# Global cap on LLM calls in flight across all running jobs
+llm_slots = threading.BoundedSemaphore(server_config.getint('Server', 'max_inflight_llm_calls', fallback=40))
+# Repeated conversions of the same digest are served from the render cache
+pdf_cache = render_cache.from_config(server_config)
+# PDFs are rendered by a bounded pool of render workers, fed by the PDF conversion jobs
+# (wkhtmltopdf itself is looked up at the first render, not at startup)
+pdf_renderer = render_pool.from_config(server_config)
+# Very large digests are rendered in parts in parallel; the download serves one file, so parts are always merged
+pdf_part_renderer = pdf_parts.from_config(server_config)
+if pdf_part_renderer is not None:
+    pdf_part_renderer.volumes = False
+# Progress events live next to the jobs so every server process can stream and replay them
+event_log = progress_events.EventLog(
+    JOBS_DB,
+    retention_seconds=server_config.getint('Server', 'event_retention_minutes', fallback=60) * 60,
+)
+SSE_KEEPALIVE_SECONDS = server_config.getfloat('Server', 'sse_keepalive_seconds', fallback=15)
+
+@app.before_request
+def start_job_workers():
+    """Start the job and render workers and the event reaper in the process that actually serves requests (not the reloader parent)"""
+    job_queue.start()
+    pdf_queue.start()
+    pdf_renderer.start()
+    event_log.start_reaper()
+
+@app.route('/jobs')
+def list_jobs():
+    """List recent jobs with their status"""
+    return jsonify(job_queue.list())
+
+@app.route('/jobs/<task_id>')
+def job_status(task_id):
+    """Status of a single job"""
+    job = job_queue.get(task_id)
+    if job is None:
+        return jsonify({'error': f'Job {task_id} not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<task_id>/cancel', methods=['POST'])
+def cancel_job(task_id):
+    """Cancel a queued job or stop a running one after its in-flight requests finish"""
+    return jsonify({'cancelled': job_queue.cancel(task_id) or pdf_queue.cancel(task_id)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics: LLM latency, tokens, errors, queue waits, PDF stage timings and job counts"""
+    job_counts = [({'kind': kind, 'status': status}, count)
+                  for queue in (job_queue, pdf_queue)
+                  for (kind, status), count in sorted(queue.status_counts().items())]
+    body = metrics.REGISTRY.render(extra=[('ai_news_jobs', 'gauge', 'Jobs by kind and status', job_counts)])
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/progress/<task_id>')
 def progress_stream(task_id):
-    """Stream progress updates for a specific task"""
+    """Stream progress updates for a specific task; reconnecting clients resume after Last-Event-ID"""
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+    
     def generate():
-        if task_id not in progress_messages:
-            yield f"data: Task {task_id} not found\n\n"
+        if not event_log.exists(task_id) and job_queue.get(task_id) is None:
+            yield f"data: ERROR: Task {task_id} not found\n\n"
             return
         
-        # Send any messages already in the queue
-        q = progress_messages[task_id]
+        # Tell the browser how long to wait before reconnecting
+        yield "retry: 3000\n\n"
+        seq = last_seq
         while True:
-            try:
-                # Non-blocking get with timeout
-                message = q.get(timeout=1)
-                yield f"data: {message}\n\n"
-                
-                # If this is a completion message, clean up
-                if message.startswith("COMPLETED:") or message.startswith("ERROR:"):
-                    # Keep the queue for a while before removing it
-                    time.sleep(60)  # Keep for 1 minute after completion
-                    if task_id in progress_messages:
-                        del progress_messages[task_id]
-                    break
-            except queue.Empty:
-                # Send a keep-alive message every second
-                yield f"data: KEEPALIVE\n\n"
+            events = event_log.wait(task_id, seq, timeout=SSE_KEEPALIVE_SECONDS)
+            if not events:
+                job = job_queue.get(task_id)
+                if job is not None and job['status'] in jobs.FINISHED_STATES and not event_log.read(task_id, seq):
+                    # Finished without a final event of its own (e.g. cancelled while still queued)
+                    yield f"data: ERROR: Job {job['status']}\n\n"
+                    return
+                # SSE comment: keeps proxies from closing the idle connection, ignored by EventSource
+                yield ": keepalive\n\n"
+                continue
+            for seq, message in events:
+                yield progress_events.format_sse(seq, message)
+                if progress_events.is_terminal(message):
+                    return
     
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
@@ -190,9 +317,11 @@ def md_to_pdf_route():
             flash('No markdown file selected!', 'error')
             return redirect(request.url)
         
-        # Save markdown file
+        # Uploads are named after the job id: the queued job reads them later, and another
+        # upload with the same file name must not replace them in the meantime
+        task_id = jobs.new_job_id()
         md_filename = secure_filename(md_file.filename)
-        md_path = os.path.join('uploads', md_filename)
+        md_path = os.path.join('uploads', f'{task_id}_{md_filename}')
         md_file.save(md_path)
         
         # Check for highlight file
@@ -201,62 +330,65 @@ def md_to_pdf_route():
             highlight_file = request.files['highlight_file']
             if highlight_file.filename != '':
                 highlight_filename = secure_filename(highlight_file.filename)
-                highlight_path = os.path.join('uploads', highlight_filename)
+                highlight_path = os.path.join('uploads', f'{task_id}_{highlight_filename}')
                 highlight_file.save(highlight_path)
         
-        try:
-            # Generate output filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_base = os.path.splitext(md_filename)[0]
-            output_path = os.path.join('output', f'{output_base}_{timestamp}.pdf')
-            
-            # Call md_to_pdf function
-            try:
-                pdf_path, md_with_toc_path = md_to_pdf.convert_md_to_pdf(md_path, output_path, highlight_path)
-                
-                # Check if PDF was generated
-                if os.path.exists(pdf_path):
-                    flash('Successfully generated PDF file!', 'success')
-                    # Get the filename from the path and ensure it has .pdf extension
-                    pdf_filename = os.path.basename(pdf_path)
-                    if not pdf_filename.lower().endswith('.pdf'):
-                        pdf_filename = f"{pdf_filename}.pdf"
-                    return send_file(
-                        pdf_path, 
-                        as_attachment=True,
-                        download_name=pdf_filename,
-                        mimetype='application/pdf'
-                    )
-                else:
-                    flash(f'PDF generation failed! PDF file not found at {pdf_path}', 'error')
-                    
-                    # If markdown with TOC was generated, offer it for download
-                    if os.path.exists(md_with_toc_path):
-                        flash(f'However, Markdown with TOC was generated successfully. You can download it.', 'info')
-                        # Get the filename from the path and ensure it has .md extension
-                        md_filename = os.path.basename(md_with_toc_path)
-                        if not md_filename.lower().endswith('.md'):
-                            md_filename = f"{md_filename}.md"
-                        return send_file(
-                            md_with_toc_path, 
-                            as_attachment=True,
-                            download_name=md_filename,
-                            mimetype='text/markdown'
-                        )
-                    
-                    return redirect(url_for('md_to_pdf_route'))
-            except Exception as inner_e:
-                flash(f'Error in PDF conversion: {str(inner_e)}', 'error')
-                import traceback
-                app.logger.error(f'PDF conversion error: {traceback.format_exc()}')
-                return redirect(url_for('md_to_pdf_route'))
-        except Exception as e:
-            flash(f'Error: {str(e)}', 'error')
-            import traceback
-            app.logger.error(f'General error: {traceback.format_exc()}')
-            return redirect(url_for('md_to_pdf_route'))
+        # Convert in the background; the page follows the job's progress stream
+        output_base = os.path.splitext(md_filename)[0]
+        output_path = os.path.join('output', f'{output_base}_{task_id}.pdf')
+        event_log.append(task_id, 'Conversion queued, waiting for a free worker...')
+        pdf_queue.submit('pdf', {'input': md_path, 'highlight': highlight_path, 'output': output_path},
+                         job_id=task_id)
+        return render_template('md_to_pdf.html', task_id=task_id)
     
     return render_template('md_to_pdf.html')
 
+@app.route('/md_to_pdf/download/<task_id>')
+def download_pdf(task_id):
+    """Download the PDF of a finished conversion job, or its markdown with TOC (?file=md)"""
+    job = pdf_queue.get(task_id)
+    if job is None or job['kind'] != 'pdf':
+        return jsonify({'error': f'Job {task_id} not found'}), 404
+    if job['status'] != jobs.COMPLETED:
+        return jsonify({'error': f'Job {task_id} has not completed', 'status': job['status']}), 404
+    pdf_path = job['params']['output']
+    if request.args.get('file') == 'md':
+        path, mimetype = os.path.splitext(pdf_path)[0] + '_with_toc.md', 'text/markdown'
+    else:
+        path, mimetype = pdf_path, 'application/pdf'
+    if not os.path.exists(path):
+        return jsonify({'error': f'{os.path.basename(path)} is not available', 'status': job['status']}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path), mimetype=mimetype)
+
+def run_pdf_job(task_id, params, cancel_event):
+    """Job handler: convert the uploaded Markdown, reporting each stage to the task's event log"""
+    report = progress_callback(task_id)
+    try:
+        pdf_path, md_with_toc_path = md_to_pdf.convert_md_to_pdf(params['input'], params['output'],
+                                                                 params.get('highlight'), cache=pdf_cache,
+                                                                 pool=pdf_renderer, progress_callback=report,
+                                                                 parts=pdf_part_renderer, cancel_event=cancel_event)
+        if not os.path.exists(pdf_path):
+            raise RuntimeError(f'PDF generation failed! PDF file not found at {pdf_path}')
+    except md_to_pdf.ConversionCancelled:
+        # The queue records the job as cancelled since cancel_event is set
+        report("ERROR: Job cancelled")
+        return None
+    except BaseException as e:
+        app.logger.error(f'PDF conversion error in job {task_id}: {e}')
+        report(f"ERROR: {str(e)}")
+        raise
+    
+    report("COMPLETED:" + pdf_path)
+    return pdf_path
+
+pdf_queue = jobs.JobQueue(
+    JOBS_DB,
+    handlers={'pdf': run_pdf_job},
+    workers=server_config.getint('Render', 'workers', fallback=render_pool.DEFAULT_WORKERS),
+    on_start=observe_job_start,
+    on_cancel=report_cancelled,
+)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
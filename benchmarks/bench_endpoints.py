@@ -0,0 +1,89 @@
+"""
+Throughput of collect_to_md.main as API keys are added (endpoints.py).
+
+Every key is a local stub server with its own request quota, standing in for
+one provider key with its own rate limit. Each run writes a config.txt with
+one [Endpoint:*] section per key (max_concurrency per key) into a temporary
+directory, so the in-flight window grows with the number of keys. With
+--broken one extra endpoint always answers 500, to show the circuit breaker
+taking it out of rotation.
+
+Usage:
+    python benchmarks/bench_endpoints.py [--urls 200] [--keys 1 2 4] [--per-key 5]
+                                         [--quota 300] [--dispatch least_loaded] [--broken]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_to_md  # noqa: E402
+from stub_llm_server import serve  # noqa: E402
+
+
+def write_config(path, ports, broken_port, per_key, dispatch, engine):
+    lines = ["[API]", "api_key = stub", "model_id = stub", "weight = 0", f"dispatch = {dispatch}",
+             "failure_threshold = 3", "cooldown_seconds = 5", "",
+             "[Processing]", f"batch_size = {per_key}", f"engine = {engine}", "",
+             "[Cache]", "enabled = false", ""]
+    for i, port in enumerate(ports):
+        lines += [f"[Endpoint:key{i + 1}]", f"base_url = http://127.0.0.1:{port}", f"api_key = key{i + 1}",
+                  f"max_concurrency = {per_key}", ""]
+    if broken_port:
+        lines += ["[Endpoint:broken]", f"base_url = http://127.0.0.1:{broken_port}", f"max_concurrency = {per_key}", ""]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="collect throughput with one or more API keys")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--keys", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--per-key", type=int, default=5, help="max_concurrency of every key")
+    parser.add_argument("--quota", type=int, default=300, help="requests per minute allowed per key (0 = unlimited)")
+    parser.add_argument("--median", type=float, default=0.2)
+    parser.add_argument("--dispatch", choices=["least_loaded", "weighted_round_robin"], default="least_loaded")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    parser.add_argument("--broken", action="store_true", help="add an endpoint that always answers 500")
+    args = parser.parse_args()
+
+    print(f"{args.urls} URLs, {args.per_key} concurrent requests and {args.quota} requests/min per key")
+    for keys in args.keys:
+        servers = [serve(median=args.median, sigma=0.4, seed=i, quota=args.quota) for i in range(keys)]
+        broken = serve(median=0.05, error_rate=1.0) if args.broken else None
+        messages = []
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                cwd = os.getcwd()
+                os.chdir(workdir)
+                try:
+                    write_config("config.txt", [server.server_port for server in servers],
+                                 broken.server_port if broken else None, args.per_key, args.dispatch, args.engine)
+                    with open("urls.txt", "w", encoding="utf-8") as f:
+                        f.write("\n".join(f"https://example.com/news/{i}" for i in range(args.urls)))
+                    started = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        collect_to_md.main("urls.txt", "digest.md", progress_callback=messages.append,
+                                           use_cache=False)
+                    elapsed = time.perf_counter() - started
+                finally:
+                    os.chdir(cwd)
+        finally:
+            for server in servers + ([broken] if broken else []):
+                server.shutdown()
+                server.server_close()
+        summary = next((m.strip() for m in messages if m.strip().startswith("全部处理完成")), "")
+        throttled = sum(server.RequestHandlerClass.stub.counts["throttled"] for server in servers)
+        print(f"{keys} key(s): {elapsed:6.2f}s  {args.urls / elapsed:6.1f} URLs/s  429s={throttled}")
+        print(f"    {summary[summary.find('端点请求'):]}")
+
+
+if __name__ == "__main__":
+    main()
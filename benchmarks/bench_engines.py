@@ -0,0 +1,112 @@
+"""
+Compare the threaded collection engine with the asyncio engine against the
+local stub server.
+
+The stub runs in a separate process so its own threads do not count towards
+the peak thread numbers reported for each engine.
+
+Usage:
+    python benchmarks/bench_engines.py [--urls 500] [--concurrency 200]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+from openai import OpenAI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_async  # noqa: E402
+import collect_to_md  # noqa: E402
+
+
+def start_stub(port, median, sigma):
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_llm_server.py"),
+        "--port", str(port), "--median", str(median), "--sigma", str(sigma), "--seed", "1",
+    ], stdout=subprocess.PIPE)
+    proc.stdout.readline()  # wait for the "listening" line
+    return proc
+
+
+class ThreadSampler:
+    """Record the peak number of live threads while a run is in progress."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_threaded(base_url, urls, concurrency, on_done):
+    client = OpenAI(
+        base_url=base_url, api_key="stub",
+        http_client=httpx.Client(limits=httpx.Limits(max_connections=concurrency)),
+    )
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        collect_to_md.run_sliding_window(
+            executor, partial(collect_to_md.fetch_markdown, client, "stub"),
+            enumerate(urls), concurrency, on_done)
+
+
+def run_async(base_url, urls, concurrency, on_done):
+    collect_async.run("stub", "stub", enumerate(urls), concurrency, on_done,
+                      base_url=base_url, max_connections=concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="threaded vs asyncio collection engine")
+    parser.add_argument("--urls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--median", type=float, default=0.2)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    args = parser.parse_args()
+
+    stub = start_stub(args.port, args.median, args.sigma)
+    base_url = f"http://127.0.0.1:{args.port}"
+    urls = [f"https://example.com/article{i}" for i in range(args.urls)]
+    try:
+        for name, runner in (("thread", run_threaded), ("async", run_async)):
+            results = {}
+            errors = []
+
+            def on_done(idx, md_text, err_msg):
+                if err_msg:
+                    errors.append(err_msg)
+                else:
+                    results[idx] = md_text
+
+            with ThreadSampler() as sampler:
+                started = time.perf_counter()
+                runner(base_url, urls, args.concurrency, on_done)
+                elapsed = time.perf_counter() - started
+            print(f"{name:>6}: {elapsed:.2f}s  ok={len(results)} errors={len(errors)} "
+                  f"peak_threads={sampler.peak}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
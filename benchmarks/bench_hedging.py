@@ -0,0 +1,89 @@
+"""
+Tail latency with and without hedged requests (hedging.py).
+
+The stub server draws latencies from a heavy-tailed Pareto distribution, so
+a few calls take many times the median and set the wall-clock time of the
+run. The same URLs are fetched once without hedging and once with it, and
+the report compares wall time, the p50/p95/p99 latency of each call as the
+caller saw it, the hedge rate and the extra requests the stub served.
+
+Usage:
+    python benchmarks/bench_hedging.py [--urls 300] [--concurrency 20] [--median 0.2]
+                                       [--alpha 1.1] [--max-hedge-ratio 0.1] [--engine thread|async]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+from openai import OpenAI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_async  # noqa: E402
+import collect_to_md  # noqa: E402
+import hedging  # noqa: E402
+import metrics  # noqa: E402
+from stub_llm_server import serve  # noqa: E402
+
+
+def run(base_url, urls, concurrency, hedger, engine):
+    run_metrics = metrics.RunMetrics(metrics.Registry())
+    results = {}
+
+    def on_done(idx, md_text, err_msg):
+        results[idx] = md_text
+
+    started = time.perf_counter()
+    if engine == "async":
+        collect_async.run("stub", "stub", enumerate(urls), concurrency, on_done, base_url=base_url,
+                          run_metrics=run_metrics, hedger=hedger, max_connections=concurrency * 2)
+    else:
+        client = OpenAI(base_url=base_url, api_key="stub", max_retries=0,
+                                      http_client=httpx.Client(limits=httpx.Limits(max_connections=concurrency * 2)))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            collect_to_md.run_sliding_window(
+                executor, partial(collect_to_md.fetch_markdown, client, "stub", run_metrics=run_metrics,
+                                  hedger=hedger),
+                enumerate(urls), concurrency, on_done)
+    return results, time.perf_counter() - started, run_metrics.summary()["llm"]["latency_seconds"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tail latency with and without hedged requests")
+    parser.add_argument("--urls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.2, help="minimum latency of the pareto distribution")
+    parser.add_argument("--alpha", type=float, default=1.1, help="pareto shape (lower = heavier tail)")
+    parser.add_argument("--quantile", type=float, default=hedging.DEFAULT_QUANTILE)
+    parser.add_argument("--max-hedge-ratio", type=float, default=hedging.DEFAULT_MAX_HEDGE_RATIO)
+    parser.add_argument("--min-delay", type=float, default=0.1)
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    args = parser.parse_args()
+
+    urls = [f"https://example.com/news/{i}" for i in range(args.urls)]
+    print(f"{args.urls} URLs, concurrency {args.concurrency}, pareto latency (minimum {args.median}s, alpha {args.alpha})")
+    for hedge in (False, True):
+        hedger = hedging.Hedger(quantile=args.quantile, max_hedge_ratio=args.max_hedge_ratio,
+                                min_delay=args.min_delay, max_workers=args.concurrency * 3) if hedge else None
+        server = serve(median=args.median, distribution="pareto", pareto_alpha=args.alpha, seed=1)
+        try:
+            results, elapsed, latency = run(f"http://127.0.0.1:{server.server_port}", urls, args.concurrency,
+                                            hedger, args.engine)
+        finally:
+            server.shutdown()
+            server.server_close()
+        label = "hedged" if hedge else "plain"
+        extra = f"  {hedger.stats_text()}" if hedger else ""
+        print(f"{label:>7}: {elapsed:6.2f}s  p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s "
+              f"p99 {latency['p99']:.2f}s max {latency['max']:.2f}s  ok={sum(1 for md in results.values() if md)}  "
+              f"stub requests={server.RequestHandlerClass.stub.counts['ok']}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare the multi-pass header processing md_to_pdf used before with the
+single-pass parse_document on a synthetic multi-megabyte digest.
+
+Only the Markdown side is timed (TOC removal, header extraction, anchors and
+both TOCs); markdown2 and wkhtmltopdf are the same for both and are skipped.
+
+Usage:
+    python benchmarks/bench_md_headers.py [--sections 5000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import md_to_pdf  # noqa: E402
+
+
+def make_digest(sections, seed=42):
+    """A digest shaped like collect_to_md output, with an old TOC in front."""
+    rng = random.Random(seed)
+    words = ["AI", "model", "release", "benchmark", "GPU", "agent", "open-source", "数据", "发布", "模型"]
+    toc = ["# 目录", ""] + [f"- [Story {i}](#story-{i})" for i in range(min(sections, 50))] + [""]
+    body = []
+    for i in range(sections):
+        title = " ".join(rng.choice(words) for _ in range(6))
+        body.append(f"# Story {i}: [{title}](https://example.com/news/{i})")
+        body.append("")
+        for j in range(rng.randint(1, 3)):
+            body.append(f"## Point {j}: {title}")
+            body.append(" ".join(rng.choice(words) for _ in range(60)))
+            body.append("")
+    return "\n".join(toc + body)
+
+
+def legacy_header_id(text):
+    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
+    header_id = text.lower().strip()
+    header_id = re.sub(r'[^\w\s-]', '', header_id)
+    return re.sub(r'[\s]+', '-', header_id)
+
+
+def legacy_anchor(line):
+    level = len(re.match('^#+', line).group())
+    text = line.lstrip('#').strip()
+    clean_text = text
+    if '[' in text and '](' in text:
+        clean_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
+    return level, text, clean_text, legacy_header_id(clean_text)
+
+
+def run_legacy(content, highlights):
+    """The passes convert_md_to_pdf made before: each step re-splits the content."""
+    content = md_to_pdf.remove_original_toc(content)
+    headers = []
+    for line in content.split('\n'):
+        if line.startswith('#'):
+            level, _, clean_text, header_id = legacy_anchor(line)
+            headers.append((level, clean_text, header_id, line))
+    highlighted = md_to_pdf.HighlightMatcher(highlights).flags(headers)
+    toc_html = md_to_pdf.generate_toc_with_highlights(headers, highlights, highlighted)
+
+    def anchored():
+        out = []
+        for line in content.split('\n'):
+            if line.startswith('#'):
+                level, text, _, header_id = legacy_anchor(line)
+                out.append(f"{'#' * level} <span id='{header_id}'></span>{text}")
+            else:
+                out.append(line)
+        return '\n'.join(out)
+
+    html_input = anchored()
+    saved_md = md_to_pdf.generate_toc_md(headers, highlighted) + "\n\n" + anchored()
+    return toc_html, html_input, saved_md
+
+
+def run_single_pass(content, highlights):
+    document = md_to_pdf.parse_document(content)
+    highlighted = md_to_pdf.HighlightMatcher(highlights).flags(document.headers)
+    toc_html = md_to_pdf.generate_toc_with_highlights(document.headers, highlights, highlighted)
+    saved_md = md_to_pdf.generate_toc_md(document.headers, highlighted) + "\n\n" + document.anchored_content
+    return toc_html, document.anchored_content, saved_md
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = make_digest(args.sections)
+    highlights = ["GPU agent", "open-source"]
+    print(f"digest: {len(content.encode('utf-8')) / 1e6:.1f} MB, {args.sections} sections")
+
+    timings = {}
+    outputs = {}
+    for name, runner in (("legacy", run_legacy), ("single", run_single_pass)):
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            outputs[name] = runner(content, highlights)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print(f"{name:>6}: {best:.3f}s")
+
+    assert outputs["legacy"] == outputs["single"], "single-pass output differs from the legacy output"
+    print(f"speedup: {timings['legacy'] / timings['single']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
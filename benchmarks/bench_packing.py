@@ -0,0 +1,104 @@
+"""
+Compare one URL per request with packed multi-URL requests (url_packing)
+against the local stub server.
+
+The stub bills a fixed system prompt to every request and adds a little
+latency for each extra URL in a packed request, so the report shows both
+sides of the trade: wall time and request count, and the prompt/completion
+tokens that make up the cost. A fraction of packed summaries can be dropped
+to include the cost of the single-URL fallback.
+
+Usage:
+    python benchmarks/bench_packing.py [--urls 300] [--concurrency 20] [--pack 1 3 5 8]
+                                       [--system-tokens 1500] [--drop-rate 0.05]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+from openai import OpenAI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_to_md  # noqa: E402
+import url_packing  # noqa: E402
+from stub_llm_server import serve  # noqa: E402
+
+
+def run(base_url, urls, concurrency, max_urls, token_budget):
+    client = OpenAI(
+        base_url=base_url, api_key="stub", max_retries=0,
+        http_client=httpx.Client(limits=httpx.Limits(max_connections=concurrency)),
+    )
+    results = {}
+    errors = []
+
+    def on_done(idx, md_text, err_msg):
+        if err_msg:
+            errors.append(err_msg)
+        else:
+            results[idx] = md_text
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if max_urls <= 1:
+            collect_to_md.run_sliding_window(
+                executor, partial(collect_to_md.fetch_markdown, client, "stub"),
+                enumerate(urls), concurrency, on_done)
+            packer = None
+        else:
+            packer = url_packing.UrlPacker(max_urls=max_urls, token_budget=token_budget)
+            groups = packer.pack(list(enumerate(urls)))
+
+            def on_group_done(group_idx, group_results, err_msg):
+                for result in group_results or [(idx, None, err_msg) for idx, _ in groups[group_idx]]:
+                    on_done(*result)
+
+            collect_to_md.run_sliding_window(
+                executor, partial(packer.fetch, client, "stub"),
+                list(enumerate(groups)), concurrency, on_group_done)
+    return results, errors, packer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="single-URL vs packed multi-URL requests")
+    parser.add_argument("--urls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--pack", type=int, nargs="+", default=[1, 3, 5, 8], help="max URLs per request (1 = no packing)")
+    parser.add_argument("--token-budget", type=int, default=url_packing.DEFAULT_TOKEN_BUDGET * 2)
+    parser.add_argument("--median", type=float, default=0.3)
+    parser.add_argument("--sigma", type=float, default=0.4)
+    parser.add_argument("--per-url-latency", type=float, default=0.05)
+    parser.add_argument("--system-tokens", type=int, default=1500)
+    parser.add_argument("--drop-rate", type=float, default=0.05, help="fraction of packed summaries the stub leaves out")
+    args = parser.parse_args()
+
+    urls = [f"https://example.com/short-news/{i}" for i in range(args.urls)]
+    print(f"{args.urls} URLs, concurrency {args.concurrency}, {args.system_tokens} system prompt tokens per request")
+    for max_urls in args.pack:
+        server = serve(median=args.median, sigma=args.sigma, seed=1, system_tokens=args.system_tokens,
+                       per_url_latency=args.per_url_latency, pack_drop_rate=args.drop_rate)
+        stub = server.RequestHandlerClass.stub
+        try:
+            started = time.perf_counter()
+            results, errors, packer = run(f"http://127.0.0.1:{server.server_port}", urls, args.concurrency,
+                                          max_urls, args.token_budget)
+            elapsed = time.perf_counter() - started
+        finally:
+            server.shutdown()
+            server.server_close()
+        counts = stub.counts
+        label = "single" if max_urls <= 1 else f"pack {max_urls}"
+        fallback = f", {packer.fallbacks} fallbacks" if packer else ""
+        print(f"{label:>8}: {elapsed:6.2f}s  {len(results) / elapsed:6.1f} URLs/s  ok={len(results)} "
+              f"errors={len(errors)}  requests={counts['ok']}{fallback}  "
+              f"prompt_tokens={counts['prompt_tokens']} completion_tokens={counts['completion_tokens']}")
+
+
+if __name__ == "__main__":
+    main()
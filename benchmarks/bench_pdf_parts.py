@@ -0,0 +1,65 @@
+"""
+Compare a single wkhtmltopdf run with multi-part rendering (pdf_parts) on a
+synthetic digest with thousands of sections.
+
+The single run converts the whole document with markdown2 and renders it in
+one wkhtmltopdf process; the multi-part runs split it at top-level headings
+and render the parts in a process pool, once for every --workers value.
+Needs wkhtmltopdf, and pypdf for the merge.
+
+Usage:
+    python benchmarks/bench_pdf_parts.py [--sections 5000] [--part-sections 200] [--workers 1 2 4] [--skip-single]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import md_to_pdf  # noqa: E402
+import pdf_parts  # noqa: E402
+from bench_md_headers import make_digest  # noqa: E402
+
+
+def page_count(path):
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def timed(label, content, output_file, parts=None):
+    started = time.perf_counter()
+    md_to_pdf.convert_markdown_to_pdf(content, output_file, parts=parts, progress_callback=lambda message: None)
+    elapsed = time.perf_counter() - started
+    print(f"{label:>24}: {elapsed:7.2f}s, {page_count(output_file)} pages")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=5000)
+    parser.add_argument("--part-sections", type=int, default=pdf_parts.DEFAULT_SECTIONS_PER_PART)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--skip-single", action="store_true", help="only time the multi-part runs")
+    args = parser.parse_args()
+
+    content = make_digest(args.sections)
+    out_dir = tempfile.mkdtemp(prefix="bench_pdf_parts_")
+    print(f"{args.sections} sections, {len(content) / 1e6:.1f} MB of markdown, "
+          f"{args.part_sections} sections per part, {os.cpu_count()} CPUs")
+
+    single = None
+    if not args.skip_single:
+        single = timed("single render", content, os.path.join(out_dir, "single.pdf"))
+    for workers in sorted(set(args.workers)):
+        parts = pdf_parts.PartRenderer(args.part_sections, workers=workers, timeout=3600)
+        elapsed = timed(f"parts, {workers} workers", content, os.path.join(out_dir, f"parts_{workers}.pdf"), parts)
+        parts.close()
+        if single:
+            print(f"{'':>24}  {single / elapsed:.2f}x the single render")
+
+
+if __name__ == "__main__":
+    main()
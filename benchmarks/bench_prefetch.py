@@ -0,0 +1,215 @@
+"""
+Local article prefetch (prefetch.py) against a local static news site.
+
+The site serves article pages wrapped in the usual navigation, scripts and
+footer, with an ETag and Last-Modified on every page and Cache-Control:
+no-cache, so a cached copy must be revalidated; a matching If-None-Match or
+If-Modified-Since is answered with 304. A share of the links are dead (404)
+and a share are script-rendered shells with almost no text. The same URLs are
+summarized three times against the stub LLM server:
+
+    url-only   the current behaviour, the bot gets the bare URL
+    cold       prefetch with an empty HTTP cache
+    warm       prefetch again with the cache of the cold run
+
+The report gives wall time, LLM requests (dead links should not reach the
+stub when prefetching), prompt tokens billed by the stub (the trimmed article
+text instead of the bare URL; the bot would otherwise download the whole page
+itself), the status codes and bytes the site served (the warm run should be
+304s with empty bodies) and the most requests the site saw in flight at once,
+which must not exceed --max-per-host.
+
+Usage:
+    python benchmarks/bench_prefetch.py [--urls 200] [--dead-rate 0.1] [--shell-rate 0.05]
+                                        [--concurrency 20] [--max-per-host 4] [--site-latency 0.02]
+                                        [--engine thread|async]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from openai import OpenAI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_async  # noqa: E402
+import collect_to_md  # noqa: E402
+import metrics  # noqa: E402
+import prefetch  # noqa: E402
+from corpus import WORDS  # noqa: E402
+from stub_llm_server import serve  # noqa: E402
+
+LAST_MODIFIED = formatdate(time.time() - 86400, usegmt=True)
+BOILERPLATE = ("<nav><ul>" + "".join(f"<li><a href='/section/{i}'>Section {i}</a></li>" for i in range(30))
+               + "</ul></nav><script>" + "var tracking = {};" * 200 + "</script>")
+
+
+def article_page(number, paragraphs):
+    """An article page: title, boilerplate around an <article> of paragraphs."""
+    rng = random.Random(number)
+    body = "".join(f"<p>{' '.join(rng.choice(WORDS) for _ in range(60))}.</p>" for _ in range(paragraphs))
+    return (f"<html><head><title>Story {number}</title><style>body {{ margin: 0 }}</style></head><body>"
+            f"<header>Daily News</header>{BOILERPLATE}<main><article><h1>Story {number}</h1>{body}</article>"
+            f"<aside>Most read: {'<a>link</a>' * 20}</aside></main><footer>(c) Daily News</footer></body></html>")
+
+
+def shell_page(number):
+    """A page rendered by scripts: almost no text in the HTML."""
+    return f"<html><head><title>App {number}</title></head><body><div id='root'></div>{BOILERPLATE}</body></html>"
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = self.server
+        with site.lock:
+            site.in_flight += 1
+            site.max_in_flight = max(site.max_in_flight, site.in_flight)
+        try:
+            time.sleep(site.latency)
+            kind, _, number = self.path.strip("/").partition("/")
+            if kind == "article":
+                page = article_page(int(number), site.paragraphs)
+            elif kind == "app":
+                page = shell_page(int(number))
+            else:
+                self.respond(404, b"not found", {"Content-Type": "text/plain"})
+                return
+            body = page.encode("utf-8")
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED, "Cache-Control": "no-cache"}
+            if self.headers.get("If-None-Match") == etag or (
+                    "If-None-Match" not in self.headers and self.headers.get("If-Modified-Since") == LAST_MODIFIED):
+                self.respond(304, b"", headers)
+                return
+            self.respond(200, body, dict(headers, **{"Content-Type": "text/html; charset=utf-8"}))
+        finally:
+            with site.lock:
+                site.in_flight -= 1
+
+    def respond(self, status, body, headers):
+        with self.server.lock:
+            self.server.counts[status] = self.server.counts.get(status, 0) + 1
+            self.server.bytes_sent += len(body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Site(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0.02, paragraphs=12):
+        super().__init__(("127.0.0.1", 0), SiteHandler)
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.bytes_sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def site_urls(port, count, dead_rate, shell_rate, seed=1):
+    rng = random.Random(seed)
+    urls = []
+    for i in range(count):
+        draw = rng.random()
+        kind = "dead" if draw < dead_rate else "app" if draw < dead_rate + shell_rate else "article"
+        urls.append(f"http://127.0.0.1:{port}/{kind}/{i}")
+    return urls
+
+
+def run(base_url, urls, concurrency, prefetcher, engine):
+    run_metrics = metrics.RunMetrics(metrics.Registry())
+    results = {}
+
+    def on_done(idx, md_text, err_msg):
+        results[idx] = md_text
+
+    started = time.perf_counter()
+    if engine == "async":
+        collect_async.run("stub", "stub", enumerate(urls), concurrency, on_done, base_url=base_url,
+                          run_metrics=run_metrics, prefetcher=prefetcher, max_connections=concurrency * 2)
+    else:
+        client = OpenAI(base_url=base_url, api_key="stub", max_retries=0,
+                        http_client=httpx.Client(limits=httpx.Limits(max_connections=concurrency * 2)))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            collect_to_md.run_sliding_window(
+                executor, partial(collect_to_md.fetch_markdown, client, "stub", run_metrics=run_metrics,
+                                  prefetcher=prefetcher),
+                enumerate(urls), concurrency, on_done)
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local article prefetch against a static site")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--dead-rate", type=float, default=0.1, help="share of links that return 404")
+    parser.add_argument("--shell-rate", type=float, default=0.05, help="share of script-rendered pages")
+    parser.add_argument("--paragraphs", type=int, default=12, help="paragraphs per article")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--max-per-host", type=int, default=prefetch.DEFAULT_MAX_PER_HOST)
+    parser.add_argument("--max-chars", type=int, default=prefetch.DEFAULT_MAX_CHARS)
+    parser.add_argument("--site-latency", type=float, default=0.02, help="seconds per page on the static site")
+    parser.add_argument("--median", type=float, default=0.05, help="median stub LLM latency")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    args = parser.parse_args()
+
+    site = Site(latency=args.site_latency, paragraphs=args.paragraphs)
+    threading.Thread(target=site.serve_forever, daemon=True).start()
+    urls = site_urls(site.server_port, args.urls, args.dead_rate, args.shell_rate)
+    print(f"{args.urls} URLs ({args.dead_rate:.0%} dead, {args.shell_rate:.0%} script shells), "
+          f"concurrency {args.concurrency}, max {args.max_per_host} per host, engine {args.engine}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "http.sqlite3")
+        for label in ("url-only", "cold", "warm"):
+            prefetcher = None
+            if label != "url-only":
+                prefetcher = prefetch.Prefetcher(cache=prefetch.HttpCache(cache_path),
+                                                 max_per_host=args.max_per_host, max_chars=args.max_chars)
+            site.reset()
+            server = serve(median=args.median, seed=1)
+            try:
+                results, elapsed = run(f"http://127.0.0.1:{server.server_port}", urls, args.concurrency,
+                                       prefetcher, args.engine)
+            finally:
+                server.shutdown()
+                server.server_close()
+            counts = server.RequestHandlerClass.stub.counts
+            served = " ".join(f"{status}={count}" for status, count in sorted(site.counts.items())) or "-"
+            print(f"{label:>8}: {elapsed:6.2f}s  ok={sum(1 for md in results.values() if md)}  "
+                  f"llm requests={counts['ok']}  prompt tokens={counts['prompt_tokens']}  "
+                  f"site: {served}, {site.bytes_sent / 1024:.0f} KiB (max in flight {site.max_in_flight})")
+            if prefetcher is not None:
+                print(f"{'':>10}{prefetcher.stats_text()}")
+                prefetcher.close()
+    site.shutdown()
+    site.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Run the threaded collection path against a stub server that enforces a
+request quota (answering 429 + Retry-After) and injects random 500s, with and
+without rate_limit.RateLimiter, and report lost URLs and throughput.
+
+Usage:
+    python benchmarks/bench_rate_limit.py [--urls 200] [--concurrency 20] [--quota 40 --quota-window 2]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from openai import OpenAI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_to_md  # noqa: E402
+import rate_limit  # noqa: E402
+import stub_llm_server  # noqa: E402
+
+
+def run(base_url, urls, concurrency, limiter):
+    client = OpenAI(base_url=base_url, api_key="stub", max_retries=0 if limiter else 2)
+    fetch = partial(collect_to_md.fetch_markdown, client, "stub", limiter=limiter)
+    ok = 0
+    errors = 0
+
+    def on_done(idx, md_text, err_msg):
+        nonlocal ok, errors
+        if err_msg:
+            errors += 1
+        else:
+            ok += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        collect_to_md.run_sliding_window(executor, fetch, enumerate(urls), concurrency, on_done)
+    return ok, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rate limiting and retry against a quota-enforcing stub")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--quota", type=int, default=40)
+    parser.add_argument("--quota-window", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--median", type=float, default=0.05)
+    args = parser.parse_args()
+
+    urls = [f"https://example.com/article{i}" for i in range(args.urls)]
+    rpm = int(args.quota * 60 / args.quota_window)
+    print(f"quota: {args.quota} requests / {args.quota_window}s (= {rpm} rpm), error rate {args.error_rate:.0%}")
+    for name in ("sdk-retries", "limiter"):
+        server = stub_llm_server.serve(median=args.median, sigma=0.5, seed=7, quota=args.quota,
+                                       quota_window=args.quota_window, error_rate=args.error_rate)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        limiter = None
+        if name == "limiter":
+            limiter = rate_limit.RateLimiter(requests_per_minute=rpm, max_concurrency=args.concurrency,
+                                             backoff_base=0.2, backoff_max=5.0)
+        started = time.perf_counter()
+        ok, errors = run(base_url, urls, args.concurrency, limiter)
+        elapsed = time.perf_counter() - started
+        counts = server.RequestHandlerClass.stub.counts
+        server.shutdown()
+        print(f"{name:>12}: {elapsed:.2f}s ok={ok} lost={errors} throughput={ok / elapsed:.1f}/s "
+              f"server_429={counts['throttled']} server_500={counts['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark the PDF render backends in render_pool on small digests.
+
+Each available backend renders the same documents through a RenderPool;
+backends that are not installed (no wkhtmltopdf binary, no weasyprint) are
+skipped. Reports the mean latency per document and the throughput.
+
+Usage:
+    python benchmarks/bench_render.py [--docs 20] [--sections 20] [--workers 2]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfkit  # noqa: E402
+import render_pool  # noqa: E402
+from bench_md_headers import make_digest  # noqa: E402
+
+
+def build_html(sections):
+    import markdown2
+    import md_to_pdf
+
+    document = md_to_pdf.parse_document(make_digest(sections))
+    body = markdown2.markdown(document.anchored_content, extras=md_to_pdf.MARKDOWN_EXTRAS)
+    toc = md_to_pdf.generate_toc(document.headers)
+    return f"<html><head><meta charset='UTF-8'><style>{md_to_pdf.PDF_CSS}</style></head><body>{toc}{body}</body></html>"
+
+
+def available_backends():
+    try:
+        yield render_pool.WkhtmltopdfBackend(pdfkit.configuration())
+    except (IOError, OSError):
+        print("wkhtmltopdf: not installed, skipped")
+    try:
+        import weasyprint  # noqa: F401
+        yield render_pool.WeasyPrintBackend()
+    except ImportError:
+        print("weasyprint: not installed, skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--sections", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    html = build_html(args.sections)
+    out_dir = tempfile.mkdtemp(prefix="bench_render_")
+    for backend in available_backends():
+        pool = render_pool.RenderPool(backend, workers=args.workers, queue_size=0)
+        options = {'quiet': ''} if backend.name == 'wkhtmltopdf' else None
+        # Warm-up render so persistent workers are started before timing
+        pool.render(html, os.path.join(out_dir, f"{backend.name}_warmup.pdf"), options)
+        started = time.perf_counter()
+        futures = []
+        latencies = []
+        for i in range(args.docs):
+            submitted = time.perf_counter()
+            future = pool.submit(html, os.path.join(out_dir, f"{backend.name}_{i}.pdf"), options)
+            future.add_done_callback(lambda _, submitted=submitted: latencies.append(time.perf_counter() - submitted))
+            futures.append(future)
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+        print(f"{backend.name:>12}: {elapsed:.2f}s for {args.docs} docs, "
+              f"{args.docs / elapsed:.2f} docs/s, mean latency {sum(latencies) / len(latencies):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
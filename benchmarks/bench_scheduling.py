@@ -0,0 +1,73 @@
+"""
+Compare batch-barrier scheduling with the sliding-window scheduler in
+collect_to_md against a fake client with long-tailed latencies.
+
+Usage:
+    python benchmarks/bench_scheduling.py [--urls 200] [--concurrency 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import collect_to_md  # noqa: E402
+from fake_llm import FakeClient  # noqa: E402
+
+
+def run_batch_barrier(client, urls, concurrency):
+    """The scheduling collect_to_md used before: submit a batch, wait for all of it."""
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for start in range(0, len(urls), concurrency):
+            futures = [
+                executor.submit(collect_to_md.fetch_markdown, client, "fake", url, start + i)
+                for i, url in enumerate(urls[start:start + concurrency])
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+    return results
+
+
+def run_sliding_window(client, urls, concurrency):
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        collect_to_md.run_sliding_window(
+            executor,
+            partial(collect_to_md.fetch_markdown, client, "fake"),
+            enumerate(urls),
+            concurrency,
+            lambda idx, md_text, err_msg: results.append((idx, md_text, err_msg)),
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.05, help="median latency in seconds")
+    parser.add_argument("--sigma", type=float, default=1.2, help="log-normal sigma (tail heaviness)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    urls = [f"https://example.com/article{i}" for i in range(args.urls)]
+    timings = {}
+    for name, runner in (("batch", run_batch_barrier), ("window", run_sliding_window)):
+        # Same seed for both runs so each scheduler sees the same latency sequence
+        client = FakeClient(median=args.median, sigma=args.sigma, seed=args.seed)
+        started = time.perf_counter()
+        results = runner(client, urls, args.concurrency)
+        timings[name] = time.perf_counter() - started
+        assert len(results) == len(urls)
+        print(f"{name:>6}: {timings[name]:.2f}s")
+
+    print(f"speedup: {timings['batch'] / timings['window']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
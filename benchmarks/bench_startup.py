@@ -0,0 +1,130 @@
+"""
+Startup cost of each entry point, from `python -X importtime -c "import <module>"`.
+
+Every module is imported in a fresh interpreter started in the repository
+root, once to warm the bytecode cache and then --repeat times. The report
+gives the median cumulative import time of the module, the median wall-clock
+time of the whole interpreter run (startup, import and exit), the peak RSS
+of the import, the direct imports that cost the most, and which of the heavy
+dependencies (openai, httpx, markdown2, pdfkit, flask) the import loaded.
+
+run_suite.py records the same measurement as its startup_* scenarios, so the
+numbers are kept with the other results and compared across commits. With
+--max-ms the script exits with status 1 when any import takes longer, which
+is the check to run before adding a top-level import of a heavy package.
+
+Usage:
+    python benchmarks/bench_startup.py [--modules app collect_to_md md_to_pdf pipeline]
+                                       [--repeat 5] [--top 5] [--max-ms 300]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+ENTRY_POINTS = ["app", "collect_to_md", "md_to_pdf", "pipeline"]
+HEAVY = ["openai", "httpx", "markdown2", "pdfkit", "flask"]
+
+
+def parse_importtime(stderr):
+    """Lines of -X importtime output as (depth, module, self_us, cumulative_us), in output order."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue    # the header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+
+def module_imports(entries, module):
+    """The entry of the module itself and the entries of everything its import loaded."""
+    end = max(i for i, (depth, name, _, _) in enumerate(entries) if depth == 0 and name == module)
+    start = end
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    return entries[end], entries[start:end]
+
+
+def import_once(module):
+    """Import module in a fresh interpreter; returns (wall seconds, importtime entries, peak RSS in MB)."""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    stderr = proc.stderr.read()
+    # wait4 gives the resource usage of this child alone
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    proc.stderr.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {(stderr.strip().splitlines() or ['?'])[-1]}")
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return elapsed, parse_importtime(stderr), rss
+
+
+def measure(module, repeat=5, top=5):
+    """Median import and wall time of module over repeat fresh interpreters, with its heaviest direct imports."""
+    import_once(module)     # compile and cache the bytecode first
+    imports, walls, rss = [], [], 0.0
+    children = {}
+    loaded = set()
+    for _ in range(repeat):
+        wall, entries, rss = import_once(module)
+        (_, _, _, cumulative), nested = module_imports(entries, module)
+        imports.append(cumulative / 1000)
+        walls.append(wall * 1000)
+        for depth, name, _, child_cumulative in nested:
+            loaded.add(name.split(".")[0])
+            if depth == 1:
+                children.setdefault(name, []).append(child_cumulative / 1000)
+    heaviest = sorted(((name, statistics.median(times)) for name, times in children.items()),
+                      key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "import_ms": round(statistics.median(imports), 1),
+        "wall_ms": round(statistics.median(walls), 1),
+        "peak_rss_mb": round(rss, 1),
+        "heaviest": [[name, round(ms, 1)] for name, ms in heaviest],
+        "heavy_loaded": [name for name in HEAVY if name in loaded],
+    }
+
+
+def format_measurement(module, result):
+    heaviest = ", ".join(f"{name} {ms:.0f}" for name, ms in result["heaviest"])
+    return (f"{module:>14}: import {result['import_ms']:7.1f} ms  wall {result['wall_ms']:7.1f} ms  "
+            f"rss {result['peak_rss_mb']:5.1f} MB  heavy: {', '.join(result['heavy_loaded']) or '-'}  "
+            f"top: {heaviest}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time of every entry point")
+    parser.add_argument("--modules", nargs="+", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="number of heaviest direct imports to list")
+    parser.add_argument("--max-ms", type=float, help="exit with status 1 if any import takes longer")
+    args = parser.parse_args()
+
+    print(f"median of {args.repeat} fresh interpreters ({sys.executable}); top imports in ms")
+    slow = []
+    for module in args.modules:
+        result = measure(module, args.repeat, args.top)
+        print(format_measurement(module, result))
+        if args.max_ms is not None and result["import_ms"] > args.max_ms:
+            slow.append(module)
+    if slow:
+        print(f"over {args.max_ms:.0f} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
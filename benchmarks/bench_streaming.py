@@ -0,0 +1,109 @@
+"""
+Time to first visible output per article, with and without streaming.
+
+Without streaming an article becomes visible in the progress stream only
+when its whole completion has arrived; with stream=True (streaming.py) the
+first Markdown is forwarded as soon as the first token arrives. Runs the same
+URLs through fetch_markdown both ways against the local stub server and
+reports the distribution of the time from dispatch to first visible text,
+the completion latency, and whether both runs produced the same Markdown.
+
+Usage:
+    python benchmarks/bench_streaming.py [--urls 100] [--concurrency 10] [--median 2.0]
+                                         [--first-token-fraction 0.1] [--engine thread|async]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+from openai import OpenAI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import collect_async  # noqa: E402
+import collect_to_md  # noqa: E402
+import metrics  # noqa: E402
+import streaming  # noqa: E402
+from stub_llm_server import serve  # noqa: E402
+
+
+class StreamRecorder:
+    """Counts the preview messages forwarded to the progress stream and the articles they cover."""
+
+    def __init__(self):
+        self.messages = 0
+        self.articles = set()
+        self._lock = threading.Lock()
+
+    def emit(self, message):
+        payload = json.loads(message[len(streaming.STREAM_PREFIX):])
+        with self._lock:
+            self.messages += 1
+            if payload["text"]:
+                self.articles.add(payload["idx"])
+
+
+def run(base_url, urls, concurrency, stream, engine):
+    recorder = StreamRecorder()
+    forwarder = streaming.StreamForwarder(recorder.emit) if stream else None
+    run_metrics = metrics.RunMetrics(metrics.Registry())
+    results = {}
+
+    def on_done(idx, md_text, err_msg):
+        results[idx] = md_text
+
+    started = time.monotonic()
+    if engine == "async":
+        collect_async.run("stub", "stub", enumerate(urls), concurrency, on_done, base_url=base_url,
+                          run_metrics=run_metrics, stream=forwarder, max_connections=concurrency)
+    else:
+        client = OpenAI(base_url=base_url, api_key="stub", max_retries=0,
+                                      http_client=httpx.Client(limits=httpx.Limits(max_connections=concurrency)))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            collect_to_md.run_sliding_window(
+                executor, partial(collect_to_md.fetch_markdown, client, "stub", run_metrics=run_metrics,
+                                  stream=forwarder),
+                enumerate(urls), concurrency, on_done)
+    return results, recorder, time.monotonic() - started, run_metrics.summary()["llm"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time to first visible output with and without streaming")
+    parser.add_argument("--urls", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--median", type=float, default=2.0)
+    parser.add_argument("--sigma", type=float, default=0.4)
+    parser.add_argument("--first-token-fraction", type=float, default=0.1)
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    args = parser.parse_args()
+
+    urls = [f"https://example.com/news/{i}" for i in range(args.urls)]
+    outputs = {}
+    for stream in (False, True):
+        server = serve(median=args.median, sigma=args.sigma, seed=1, first_token_fraction=args.first_token_fraction)
+        try:
+            results, recorder, elapsed, llm = run(f"http://127.0.0.1:{server.server_port}", urls, args.concurrency,
+                                               stream, args.engine)
+        finally:
+            server.shutdown()
+            server.server_close()
+        outputs[stream] = results
+        # Without streaming an article is first visible when its completion has arrived
+        first = llm["first_token_seconds"] if stream else llm["latency_seconds"]
+        label = "stream" if stream else "blocking"
+        print(f"{label:>8}: {elapsed:6.2f}s total  first visible p50 {first['p50']:.2f}s p95 {first['p95']:.2f}s  "
+              f"completion p50 {llm['latency_seconds']['p50']:.2f}s  ok={sum(1 for md in results.values() if md)}"
+              + (f"  previews: {recorder.messages} messages for {len(recorder.articles)} articles" if stream else ""))
+    print("same Markdown:", outputs[False] == outputs[True])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Synthetic news digests for md_to_pdf benchmarks.
+
+generate_digest builds a digest shaped like collect_to_md output (an old
+table of contents, then one top-level section per story) whose size and
+header density can be varied independently: the number of sections sets the
+size, headers_per_section the number of ##/### headings inside each section,
+and paragraph_words the amount of text between headings. Output is fully
+determined by the seed, so results are comparable across commits.
+
+Usage:
+    python benchmarks/corpus.py --sections 5000 --headers-per-section 4 -o digest.md
+"""
+
+import argparse
+import random
+
+WORDS = ["AI", "model", "release", "benchmark", "GPU", "agent", "open-source", "inference", "dataset",
+         "数据", "发布", "模型", "开源", "推理", "芯片"]
+
+# Named corpora used by run_suite.py: (sections, headers per section, words per paragraph)
+PRESETS = {
+    "small": (200, 2, 60),
+    "medium": (1000, 2, 60),
+    "large": (5000, 2, 60),
+    "dense": (1000, 8, 20),
+    "sparse": (1000, 0, 300),
+}
+
+
+def generate_digest(sections, headers_per_section=2, paragraph_words=60, seed=42, toc=True,
+                    code_every=0, table_every=0):
+    """Markdown digest with the given number of top-level sections.
+
+    Each section has a linked top-level heading, a paragraph and headers_per_section
+    subheadings (alternating ## and ###), each followed by a paragraph. code_every /
+    table_every add a fenced code block / a table to every n-th section (0 = never)."""
+    rng = random.Random(seed)
+
+    def words(count):
+        return " ".join(rng.choice(WORDS) for _ in range(count))
+
+    lines = []
+    if toc:
+        lines += ["# 目录", ""] + [f"- [Story {i}](#story-{i})" for i in range(min(sections, 50))] + [""]
+    for i in range(sections):
+        title = words(6)
+        lines += [f"# Story {i}: [{title}](https://example.com/news/{i})", "", words(paragraph_words), ""]
+        for j in range(headers_per_section):
+            level = "##" if j % 2 == 0 else "###"
+            lines += [f"{level} Point {j}: {words(5)}", "", words(paragraph_words), ""]
+        if code_every and i % code_every == 0:
+            lines += ["```python", f"print({i!r})", "```", ""]
+        if table_every and i % table_every == 0:
+            lines += ["| metric | value |", "| --- | --- |", f"| score | {rng.randint(1, 100)} |", ""]
+    return "\n".join(lines)
+
+
+def preset(name, seed=42):
+    sections, headers_per_section, paragraph_words = PRESETS[name]
+    return generate_digest(sections, headers_per_section, paragraph_words, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write a synthetic news digest")
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--headers-per-section", type=int, default=2)
+    parser.add_argument("--paragraph-words", type=int, default=60)
+    parser.add_argument("--code-every", type=int, default=0)
+    parser.add_argument("--table-every", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="digest.md")
+    args = parser.parse_args()
+
+    content = generate_digest(args.sections, args.headers_per_section, args.paragraph_words, seed=args.seed,
+                              code_every=args.code_every, table_every=args.table_every)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(content)
+    print(f"wrote {args.output}: {args.sections} sections, {len(content) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+In-process fake of the OpenAI chat client used by collect_to_md.
+
+Only the surface that fetch_markdown touches is implemented:
+client.chat.completions.create(model=..., messages=[...]) returning an object
+with choices[0].message.content. Latencies are drawn from a log-normal
+distribution so a few calls are much slower than the median, which is what
+real bot endpoints look like.
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeCompletions:
+    def __init__(self, median=0.2, sigma=1.0, seed=42, scale=1.0):
+        self.median = median
+        self.sigma = sigma
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        with self._lock:
+            return self.median * self._rng.lognormvariate(0, self.sigma) * self.scale
+
+    def create(self, model, messages, **kwargs):
+        time.sleep(self.sample_latency())
+        url = messages[-1]["content"]
+        content = f"# Summary of {url}\n\nFake summary produced by {model}.\n"
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeCompletions(**kwargs))
@@ -0,0 +1,292 @@
+"""
+Run the benchmark suite and write machine-readable results.
+
+Every scenario runs in a fresh child process, so its peak RSS is its own:
+- collect_*: collect_to_md.main over synthetic URLs against the local stub
+  server (stub_llm_server, started in this process), with a latency
+  distribution and error rate per scenario. Reports URLs/s, LLM latency
+  percentiles, errors and the collect stage time.
+- pdf_*: md_to_pdf.convert_markdown_to_pdf on synthetic digests of different
+  sizes and header densities (corpus.PRESETS). Reports MB/s and the time of
+  every conversion stage. With --skip-render the wkhtmltopdf render stage is
+  replaced by a no-op, to time parsing, TOC and HTML generation alone.
+- startup_*: the import time of each entry point in fresh interpreters
+  (bench_startup.measure), with its peak RSS and heaviest imports.
+
+Results go to benchmarks/results/<timestamp>_<commit>.json (or --output) with
+the commit, Python version and platform, so runs can be compared across
+commits with --compare OLD.json NEW.json.
+
+Usage:
+    python benchmarks/run_suite.py [--quick] [--only collect_thread pdf_dense] [--skip-render]
+                                   [--output results.json]
+    python benchmarks/run_suite.py --compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+SCENARIOS = [
+    {"name": "collect_thread", "kind": "collect", "engine": "thread", "urls": 300, "concurrency": 20,
+     "stub": {"median": 0.2, "sigma": 0.6}},
+    {"name": "collect_async", "kind": "collect", "engine": "async", "urls": 300, "concurrency": 20,
+     "stub": {"median": 0.2, "sigma": 0.6}},
+    {"name": "collect_heavy_tail", "kind": "collect", "engine": "thread", "urls": 300, "concurrency": 20,
+     "stub": {"median": 0.1, "distribution": "pareto", "pareto_alpha": 1.2, "error_rate": 0.02,
+              "response_size": 4000}},
+    {"name": "pdf_small", "kind": "pdf", "corpus": "small"},
+    {"name": "pdf_medium", "kind": "pdf", "corpus": "medium"},
+    {"name": "pdf_dense", "kind": "pdf", "corpus": "dense"},
+    {"name": "pdf_sparse", "kind": "pdf", "corpus": "sparse"},
+    {"name": "pdf_large", "kind": "pdf", "corpus": "large"},
+    {"name": "startup_app", "kind": "startup", "module": "app"},
+    {"name": "startup_collect_to_md", "kind": "startup", "module": "collect_to_md"},
+    {"name": "startup_md_to_pdf", "kind": "startup", "module": "md_to_pdf"},
+    {"name": "startup_pipeline", "kind": "startup", "module": "pipeline"},
+]
+
+# Metrics compared by --compare, and whether higher is better
+COMPARED = {"throughput": True, "latency_p50": False, "latency_p95": False, "latency_p99": False,
+            "peak_rss_mb": False, "duration_seconds": False}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class NullRenderPool:
+    """Stands in for render_pool.RenderPool when --skip-render is given: nothing is rendered."""
+
+    def render(self, html, output_file, options=None):
+        with open(output_file, "wb") as f:
+            f.write(b"%PDF-1.4\n")
+
+
+def run_collect(scenario, workdir):
+    import collect_to_md
+    import metrics
+
+    collect_to_md.BASE_URL = scenario["base_url"]
+    with open(os.path.join(workdir, "config.txt"), "w", encoding="utf-8") as f:
+        f.write("[API]\napi_key = stub\nmodel_id = stub\n\n"
+                f"[Processing]\nbatch_size = {scenario['concurrency']}\nengine = {scenario['engine']}\n\n"
+                "[Cache]\nenabled = false\n")
+    with open(os.path.join(workdir, "urls.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(f"https://example.com/news/{i}" for i in range(scenario["urls"])))
+
+    run_metrics = metrics.RunMetrics(metrics.Registry())
+    started = time.perf_counter()
+    collect_to_md.main("urls.txt", "digest.md", progress_callback=lambda message: None, use_cache=False,
+                       run_metrics=run_metrics)
+    elapsed = time.perf_counter() - started
+    summary = run_metrics.summary()
+    latency = summary["llm"]["latency_seconds"]
+    return {
+        "duration_seconds": round(elapsed, 3),
+        "throughput": round(summary["urls"].get("succeeded", 0) / elapsed, 2),
+        "throughput_unit": "urls/s",
+        "latency_p50": latency.get("p50"),
+        "latency_p95": latency.get("p95"),
+        "latency_p99": latency.get("p99"),
+        "urls": summary["urls"],
+        "llm_requests": summary["llm"]["requests"],
+        "errors": summary["llm"]["errors"],
+        "stages_seconds": summary["stages_seconds"],
+    }
+
+
+def run_pdf(scenario, workdir):
+    import corpus
+    import md_to_pdf
+    import metrics
+
+    content = corpus.preset(scenario["corpus"])
+    pool = NullRenderPool() if scenario.get("skip_render") else None
+    run_metrics = metrics.RunMetrics(metrics.Registry())
+    started = time.perf_counter()
+    md_to_pdf.convert_markdown_to_pdf(content, os.path.join(workdir, "digest.pdf"), pool=pool,
+                                      progress_callback=lambda message: None, run_metrics=run_metrics)
+    elapsed = time.perf_counter() - started
+    size_mb = len(content.encode("utf-8")) / 1e6
+    return {
+        "duration_seconds": round(elapsed, 3),
+        "throughput": round(size_mb / elapsed, 3),
+        "throughput_unit": "MB/s",
+        "input_mb": round(size_mb, 2),
+        "sections": corpus.PRESETS[scenario["corpus"]][0],
+        "rendered": not scenario.get("skip_render"),
+        "stages_seconds": run_metrics.summary()["stages_seconds"],
+    }
+
+
+def run_startup(scenario, workdir):
+    from bench_startup import measure
+
+    result = measure(scenario["module"], repeat=scenario.get("repeat", 5))
+    return dict(result, duration_seconds=round(result["import_ms"] / 1000, 4))
+
+
+RUNNERS = {"collect": run_collect, "pdf": run_pdf, "startup": run_startup}
+
+
+def run_child(spec_file, result_file):
+    """Body of the child process: run one scenario and write its result as JSON."""
+    with open(spec_file, encoding="utf-8") as f:
+        scenario = json.load(f)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        result = RUNNERS[scenario["kind"]](scenario, workdir)
+    # startup scenarios report the RSS of the interpreters they started
+    result.setdefault("peak_rss_mb", peak_rss_mb())
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_scenario(scenario, skip_render=False):
+    """Run one scenario in a child process (with the stub server for collect scenarios)."""
+    server = None
+    scenario = dict(scenario, skip_render=skip_render)
+    if scenario["kind"] == "collect":
+        from stub_llm_server import serve
+        server = serve(seed=1, **scenario["stub"])
+        scenario["base_url"] = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            spec_file = os.path.join(tmp, "scenario.json")
+            result_file = os.path.join(tmp, "result.json")
+            with open(spec_file, "w", encoding="utf-8") as f:
+                json.dump(scenario, f)
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", spec_file, result_file],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                return {"error": (proc.stderr.strip().splitlines() or [f"exit code {proc.returncode}"])[-1]}
+            with open(result_file, encoding="utf-8") as f:
+                return json.load(f)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def quick(scenario):
+    """Smaller version of a scenario for --quick."""
+    if scenario["kind"] == "collect":
+        return dict(scenario, urls=60)
+    if scenario["kind"] == "startup":
+        return dict(scenario, repeat=2)
+    return scenario
+
+
+def format_result(name, result):
+    if "error" in result:
+        return f"{name:>20}: FAILED {result['error']}"
+    if "import_ms" in result:
+        return (f"{name:>20}: import {result['import_ms']:7.1f} ms  wall {result['wall_ms']:7.1f} ms"
+                f"  rss {result['peak_rss_mb']:6.1f} MB  heavy: {', '.join(result['heavy_loaded']) or '-'}")
+    line = (f"{name:>20}: {result['duration_seconds']:7.2f}s  {result['throughput']:8.2f} {result['throughput_unit']:<6}"
+            f"  rss {result['peak_rss_mb']:6.1f} MB")
+    if result.get("latency_p50") is not None:
+        line += f"  p50/p95/p99 {result['latency_p50']:.3f}/{result['latency_p95']:.3f}/{result['latency_p99']:.3f}s"
+    stages = result.get("stages_seconds") or {}
+    if result.get("throughput_unit") == "MB/s":
+        line += "  " + " ".join(f"{stage}={seconds:.2f}" for stage, seconds in stages.items())
+    return line
+
+
+def compare(old_file, new_file):
+    with open(old_file, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_file, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    for name, result in new["scenarios"].items():
+        before = old["scenarios"].get(name)
+        if before is None or "error" in before or "error" in result:
+            print(f"{name:>20}: not comparable")
+            continue
+        deltas = []
+        for metric, higher_is_better in COMPARED.items():
+            if before.get(metric) in (None, 0) or result.get(metric) is None:
+                continue
+            change = (result[metric] - before[metric]) / before[metric] * 100
+            better = change > 0 if higher_is_better else change < 0
+            deltas.append(f"{metric} {before[metric]} -> {result[metric]} ({change:+.1f}%{'' if abs(change) < 1 else ' better' if better else ' worse'})")
+        print(f"{name:>20}: " + "; ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run the benchmark suite")
+    parser.add_argument("--only", nargs="+", metavar="SCENARIO", help="run only these scenarios")
+    parser.add_argument("--quick", action="store_true", help="fewer URLs, no pdf_large")
+    parser.add_argument("--skip-render", action="store_true", help="do not run wkhtmltopdf in the pdf scenarios")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenarios = SCENARIOS
+    if args.only:
+        unknown = set(args.only) - {scenario["name"] for scenario in SCENARIOS}
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in SCENARIOS if scenario["name"] in args.only]
+    elif args.quick:
+        scenarios = [quick(scenario) for scenario in SCENARIOS if scenario["name"] != "pdf_large"]
+
+    commit = git_commit()
+    started_at = datetime.now()
+    results = {}
+    for scenario in scenarios:
+        results[scenario["name"]] = run_scenario(scenario, args.skip_render)
+        print(format_result(scenario["name"], results[scenario["name"]]))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{started_at.strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "scenarios": results,
+        }, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Local OpenAI-compatible stub server for benchmarks.
+
+Serves POST /chat/completions (with or without a /v1 or /api/v3/bots prefix)
+and answers every request after a random delay with a Markdown summary of the
+URL found in the last user message. Point collect_to_md at it by passing
+base_url=http://127.0.0.1:<port>.
+
+The delay follows --distribution: "lognormal" (default; median --median,
+tail heaviness --sigma), "fixed" (always --median), "uniform" (0 to
+2 x --median) or "pareto" (minimum --median, shape --pareto-alpha; a heavy
+tail where a few requests take many times the median). --response-size sets
+the approximate length of every summary in characters.
+
+A request quota (--quota requests per --quota-window seconds) makes the stub
+answer 429 with a Retry-After header once exceeded, and --error-rate injects
+random 500s, so retry and rate-limit behaviour can be exercised offline.
+
+Packed requests (several numbered URLs, see url_packing) are answered with
+one summary per URL behind <<<URL n>>> markers; --pack-drop-rate leaves some
+of them out to exercise the single-URL fallback. Every request is billed
+--system-tokens prompt tokens for the bot's system prompt, and each extra URL
+in a packed request adds --per-url-latency seconds, so per-request overhead
+and cost can be compared.
+
+Requests with stream=True are answered as server-sent events: the first
+chunk arrives after --first-token-fraction of the sampled latency and the
+rest of the summary is spread over the remainder in --stream-chunks chunks.
+
+Usage:
+    python benchmarks/stub_llm_server.py [--port 8900] [--median 0.2] [--sigma 0.8]
+                                         [--quota 60 --quota-window 60] [--error-rate 0.05]
+                                         [--system-tokens 1500] [--per-url-latency 0.05] [--pack-drop-rate 0.1]
+                                         [--distribution pareto --pareto-alpha 1.5] [--response-size 2000]
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PACKED_URL = re.compile(r"^(\d+)\. (\S+)$", re.MULTILINE)
+DISTRIBUTIONS = ("lognormal", "fixed", "uniform", "pareto")
+FILLER = ("Stub summary text about models, agents, GPUs and benchmarks. "
+          "大模型发布与开源进展的模拟摘要内容。")
+
+
+class StubConfig:
+    def __init__(self, median=0.2, sigma=0.8, seed=None, quota=0, quota_window=60.0, error_rate=0.0,
+                 system_tokens=0, per_url_latency=0.0, pack_drop_rate=0.0, distribution="lognormal",
+                 pareto_alpha=1.5, response_size=0, first_token_fraction=0.1, stream_chunks=20):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution {distribution!r}")
+        self.median = median
+        self.sigma = sigma
+        self.distribution = distribution
+        self.pareto_alpha = pareto_alpha
+        self.response_size = response_size
+        self.first_token_fraction = first_token_fraction
+        self.stream_chunks = max(1, stream_chunks)
+        self.quota = quota
+        self.quota_window = quota_window
+        self.error_rate = error_rate
+        self.system_tokens = system_tokens
+        self.per_url_latency = per_url_latency
+        self.pack_drop_rate = pack_drop_rate
+        self.accepted = deque()
+        self.counts = {"ok": 0, "throttled": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        with self._lock:
+            if self.distribution == "fixed":
+                return self.median
+            if self.distribution == "uniform":
+                return self._rng.uniform(0, 2 * self.median)
+            if self.distribution == "pareto":
+                return self.median * self._rng.paretovariate(self.pareto_alpha)
+            return self.median * self._rng.lognormvariate(0, self.sigma)
+
+    def summarize(self, url):
+        """Markdown summary of url, padded to about response_size characters."""
+        body = "Stub summary text.\n"
+        if self.response_size > len(body):
+            repeats = self.response_size // len(FILLER) + 1
+            body = "\n\n".join(FILLER * 4 for _ in range(repeats // 4 + 1))[:self.response_size] + "\n"
+        return f"# Summary of {url}\n\n{body}"
+
+    def admit(self):
+        """Return (status, retry_after) for the next request: 200, 429 or 500."""
+        with self._lock:
+            now = time.monotonic()
+            if self.quota > 0:
+                while self.accepted and now - self.accepted[0] >= self.quota_window:
+                    self.accepted.popleft()
+                if len(self.accepted) >= self.quota:
+                    self.counts["throttled"] += 1
+                    return 429, self.quota_window - (now - self.accepted[0])
+                self.accepted.append(now)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.counts["errors"] += 1
+                return 500, None
+            self.counts["ok"] += 1
+            return 200, None
+
+    def dropped(self):
+        with self._lock:
+            return self.pack_drop_rate and self._rng.random() < self.pack_drop_rate
+
+    def bill(self, prompt, content):
+        """Token usage of one answered request; the totals are kept in counts."""
+        usage = {"prompt_tokens": self.system_tokens + len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self._lock:
+            self.counts["prompt_tokens"] += usage["prompt_tokens"]
+            self.counts["completion_tokens"] += usage["completion_tokens"]
+        return usage
+
+
+def make_completion(model, content, usage=None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage or {"prompt_tokens": 20, "completion_tokens": len(content) // 4,
+                           "total_tokens": 20 + len(content) // 4},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real API endpoint
+    stub = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, request, prompt, latency):
+        """Answer a stream=True request as server-sent events: the first chunk arrives after
+        first_token_fraction of the latency, the rest of the summary spread over the remainder."""
+        content = f"Here is the summary.\n{self.stub.summarize(prompt)}"
+        model = request.get("model", "stub")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(latency * self.stub.first_token_fraction)
+        count = self.stub.stream_chunks
+        step = -(-len(content) // count)
+        for i in range(0, len(content), step):
+            if i:
+                time.sleep(latency * (1 - self.stub.first_token_fraction) / count)
+            send({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                  "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]})
+        usage = self.stub.bill(prompt, content)
+        send({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+              "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                  "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        status, retry_after = self.stub.admit()
+        if status == 429:
+            self.send_json(429, {"error": {"message": "rate limit exceeded", "type": "rate_limit"}},
+                           {"Retry-After": f"{retry_after:.2f}"})
+            return
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        packed = PACKED_URL.findall(prompt) if "<<<URL" in prompt else []
+        latency = self.stub.sample_latency() + self.stub.per_url_latency * max(0, len(packed) - 1)
+        if request.get("stream") and status == 200:
+            self.send_stream(request, prompt, latency)
+            return
+        time.sleep(latency)
+        if status == 500:
+            self.send_json(500, {"error": {"message": "injected server error", "type": "server_error"}})
+            return
+        if packed:
+            content = "".join(f"<<<URL {number}>>>\n{self.stub.summarize(url)}\n"
+                              for number, url in packed if not self.stub.dropped())
+        else:
+            content = f"Here is the summary.\n{self.stub.summarize(prompt)}"
+        self.send_json(200, make_completion(request.get("model", "stub"), content, self.stub.bill(prompt, content)))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the socketserver default of 5 drops bursts of connections
+
+    def handle_error(self, request, client_address):
+        # Clients that cancel a request (e.g. the loser of a hedged pair) close the connection mid-answer
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def serve(port=0, **stub_kwargs):
+    """Start the stub in a background thread and return the running server."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"stub": StubConfig(**stub_kwargs)})
+    server = StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--median", type=float, default=0.2, help="median latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.8, help="log-normal sigma (tail heaviness)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--quota", type=int, default=0, help="requests allowed per quota window (0 = unlimited)")
+    parser.add_argument("--quota-window", type=float, default=60.0, help="quota window in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--system-tokens", type=int, default=0, help="prompt tokens billed per request for the system prompt")
+    parser.add_argument("--per-url-latency", type=float, default=0.0, help="extra seconds per additional URL in a packed request")
+    parser.add_argument("--pack-drop-rate", type=float, default=0.0, help="fraction of packed summaries left out")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal", help="latency distribution")
+    parser.add_argument("--pareto-alpha", type=float, default=1.5, help="shape of the pareto distribution (lower = heavier tail)")
+    parser.add_argument("--response-size", type=int, default=0, help="approximate summary length in characters")
+    parser.add_argument("--first-token-fraction", type=float, default=0.1,
+                        help="share of the latency before the first streamed chunk")
+    parser.add_argument("--stream-chunks", type=int, default=20, help="chunks per streamed summary")
+    args = parser.parse_args()
+
+    stub = StubConfig(median=args.median, sigma=args.sigma, seed=args.seed, quota=args.quota,
+                      quota_window=args.quota_window, error_rate=args.error_rate, system_tokens=args.system_tokens,
+                      per_url_latency=args.per_url_latency, pack_drop_rate=args.pack_drop_rate,
+                      distribution=args.distribution, pareto_alpha=args.pareto_alpha, response_size=args.response_size,
+                      first_token_fraction=args.first_token_fraction, stream_chunks=args.stream_chunks)
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"stub": stub})
+    server = StubServer(("127.0.0.1", args.port), handler)
+    print(f"stub LLM server listening on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+协程版采集引擎：基于 AsyncOpenAI，所有请求共用同一个 httpx.AsyncClient 连接池，
+用信号量限制同时在途的请求数。单个进程即可同时驱动数百个摘要请求，而无需数百个线程。
+
+在 config.txt 中设置 [Processing] engine = async 即可由 collect_to_md.main 使用本引擎。
+"""
+
+import asyncio
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+import hedging
+import streaming
+from collect_to_md import trim_leading_text
+
+# 连接池默认参数，可在 config.txt 的 [HTTP] 段中覆盖
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+def pool_settings(config):
+    """从 ConfigParser 对象读取 [HTTP] 段的连接池参数，缺省时使用默认值。"""
+    return {
+        "max_connections": config.getint("HTTP", "max_connections", fallback=DEFAULT_MAX_CONNECTIONS),
+        "max_keepalive_connections": config.getint("HTTP", "max_keepalive_connections",
+                                                   fallback=DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+        "keepalive_expiry": config.getfloat("HTTP", "keepalive_expiry", fallback=DEFAULT_KEEPALIVE_EXPIRY),
+    }
+
+
+def build_http_client(max_connections=DEFAULT_MAX_CONNECTIONS,
+                      max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                      keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY):
+    """创建带连接池上限和 HTTP keep-alive 的共享 httpx.AsyncClient。"""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    # LLM 请求耗时较长，读超时放宽；连接超时保持较短以便快速发现不可达的端点
+    timeout = httpx.Timeout(600.0, connect=10.0)
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+async def acquire_slot(llm_slots):
+    """在不阻塞事件循环的前提下占用共享信号量（threading.Semaphore）的一个名额。"""
+    while not llm_slots.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+
+
+async def fetch_markdown_async(client, model_id, url, idx, cache=None, refresh=False, limiter=None,
+                               llm_slots=None, run_metrics=None, stream=None, hedger=None, deadline=None,
+                               prefetcher=None):
+    """
+    fetch_markdown 的协程版本（缓存、限流重试、指标记录、流式转发、对冲、时间预算和本地预取规则相同；
+    落后的对冲请求被取消）。
+    返回值： (idx, md_text 或 None, 错误信息或 None)
+    """
+    if cache is not None and not refresh:
+        md_text = cache.get(url, model_id)
+        if md_text is not None:
+            if run_metrics is not None:
+                run_metrics.observe_cache_hit()
+            return (idx, md_text, None)
+
+    content = url
+    if prefetcher is not None:
+        try:
+            content = await prefetcher.prompt_async(url, None if deadline is None else deadline.call_timeout())
+        except Exception as e:
+            return (idx, None, str(e))
+
+    queued_at = time.monotonic()
+
+    async def request():
+        nonlocal queued_at
+        if llm_slots is not None:
+            await acquire_slot(llm_slots)
+        try:
+            async def create():
+                timeout = {} if deadline is None else {"timeout": deadline.call_timeout()}
+                if stream is None:
+                    return await client.chat.completions.create(
+                        model=model_id,
+                        messages=[{"role": "user", "content": content}],
+                        **timeout,
+                    )
+                started = time.monotonic()
+                chunks = await client.chat.completions.create(
+                    model=model_id,
+                    messages=[{"role": "user", "content": content}],
+                    stream=True,
+                    **timeout,
+                    # 在最后一块中返回 token 用量（openai 1.12 的 SDK 还没有 stream_options 参数）
+                    extra_body={"stream_options": {"include_usage": True}},
+                )
+                return await streaming.collect_stream_async(chunks, stream.open(idx, url), started, run_metrics)
+
+            def call():
+                return create() if hedger is None else hedger.call_async(create, hedging.reserve(llm_slots, limiter))
+            if run_metrics is None:
+                return await call()
+            waited_since, queued_at = queued_at, None
+            return await run_metrics.call_async(call, waited_since)
+        finally:
+            if llm_slots is not None:
+                llm_slots.release()
+
+    if deadline is not None:
+        request = deadline.guard_async(request)
+    try:
+        completion = await (limiter.call_async(request) if limiter is not None else request())
+        md_text = trim_leading_text(completion.choices[0].message.content)
+        if cache is not None:
+            cache.put(url, model_id, md_text)
+        return (idx, md_text, None)
+    except Exception as e:
+        return (idx, None, str(e))
+
+
+async def run_bounded(client, model_id, items, concurrency, on_done,
+                      cache=None, refresh=False, limiter=None, llm_slots=None, stop=None, run_metrics=None,
+                      stream=None, hedger=None, deadline=None, prefetcher=None):
+    """
+    以信号量限制并发，对 items 中的每个 (idx, url) 发起请求；
+    每个请求完成时立即调用 on_done(idx, md_text, err_msg)。
+    stop 返回 True 后，尚未开始的请求直接跳过（不调用 on_done）。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(idx, url):
+        async with semaphore:
+            if stop is not None and stop():
+                return None
+            return await fetch_markdown_async(client, model_id, url, idx, cache=cache, refresh=refresh,
+                                              limiter=limiter, llm_slots=llm_slots, run_metrics=run_metrics,
+                                              stream=stream, hedger=hedger, deadline=deadline,
+                                              prefetcher=prefetcher)
+
+    tasks = [asyncio.create_task(fetch_one(idx, url)) for idx, url in items]
+    for next_done in asyncio.as_completed(tasks):
+        result = await next_done
+        if result is not None:
+            on_done(*result)
+
+
+async def collect(api_key, model_id, items, concurrency, on_done, base_url,
+                  cache=None, refresh=False, limiter=None, llm_slots=None, stop=None, run_metrics=None,
+                  endpoint_pool=None, stream=None, hedger=None, timeout=None, deadline=None, prefetcher=None,
+                  **pool_kwargs):
+    """
+    创建共享连接池和 AsyncOpenAI 客户端，完成全部请求后关闭连接池（以及 prefetcher 的下载连接池）。
+    给出 endpoint_pool（endpoints.EndpointPool）时，请求按其策略分发到各端点，api_key 和 base_url 不再使用。
+    timeout 为单次请求的超时（秒），不指定时使用连接池的默认超时。
+    """
+    async with build_http_client(**pool_kwargs) as http_client:
+        client_kwargs = {"max_retries": 0 if limiter else 2}
+        if timeout is not None:
+            client_kwargs["timeout"] = timeout
+        if endpoint_pool is not None:
+            client = endpoint_pool.async_client(http_client, **client_kwargs)
+        else:
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client, **client_kwargs)
+        try:
+            await run_bounded(client, model_id, items, concurrency, on_done, cache=cache, refresh=refresh,
+                              limiter=limiter, llm_slots=llm_slots, stop=stop, run_metrics=run_metrics,
+                              stream=stream, hedger=hedger, deadline=deadline, prefetcher=prefetcher)
+        finally:
+            if prefetcher is not None:
+                await prefetcher.aclose()
+
+
+def run(api_key, model_id, items, concurrency, on_done, base_url,
+        cache=None, refresh=False, limiter=None, llm_slots=None, stop=None, run_metrics=None, endpoint_pool=None,
+        stream=None, hedger=None, timeout=None, deadline=None, prefetcher=None, **pool_kwargs):
+    """同步入口：在新的事件循环中运行 collect，供 collect_to_md.main 等同步代码调用。"""
+    asyncio.run(collect(api_key, model_id, list(items), concurrency, on_done, base_url,
+                        cache=cache, refresh=refresh, limiter=limiter, llm_slots=llm_slots, stop=stop,
+                        run_metrics=run_metrics, endpoint_pool=endpoint_pool, stream=stream, hedger=hedger,
+                        timeout=timeout, deadline=deadline, prefetcher=prefetcher, **pool_kwargs))
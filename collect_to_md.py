@@ -3,48 +3,185 @@
 
 import os
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import httpx
-import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+from functools import partial
+import argparse
 import configparser
 from datetime import datetime
 
-# 如果你是用 volces-openai-sdk，请安装并导入它
-# from openai import OpenAI
-# 这里仅作示例:
-try:
-    from openai import OpenAI
-except ImportError:
-    print("请先安装相应的 SDK, 例如: pip install openai 或检查引用。")
-    sys.exit(1)
+import deadline
+import endpoints
+import hedging
+import metrics
+import rate_limit
+import streaming
+import summary_cache
+import journal
+from md_writer import OrderedMarkdownWriter
+from url_utils import dedupe_urls
 
+BASE_URL = "https://ark.cn-beijing.volces.com/api/v3/bots"
 
-def fetch_markdown(client, model_id, url, batch_idx):
+
+def load_openai():
+    """
+    在第一次需要调用 LLM 时才导入 SDK 并返回 OpenAI 类（之后直接取自已导入的模块）。
+    openai 连同 httpx 的导入需要半秒以上，Web 服务启动、命令行 --help 等用不到它的场合不必承担。
+    """
+    # 如果你是用 volces-openai-sdk，请安装并导入它
+    # from openai import OpenAI
+    # 这里仅作示例:
+    try:
+        from openai import OpenAI
+    except ImportError:
+        print("请先安装相应的 SDK, 例如: pip install openai 或检查引用。")
+        sys.exit(1)
+    return OpenAI
+
+
+def trim_leading_text(md_text):
+    """如果返回文本不是以 # 开头，则截去第一个 # 之前的冗余文本。"""
+    if not md_text.startswith('#'):
+        start_hash = md_text.find('#')
+        if start_hash != -1:
+            md_text = md_text[start_hash:]  # 去除所有 # 之前的冗余文本
+    return md_text
+
+
+def fetch_markdown(client, model_id, url, batch_idx, cache=None, refresh=False, limiter=None, llm_slots=None,
+                   run_metrics=None, stream=None, hedger=None, deadline=None, prefetcher=None):
     """
     用于并行调用 API 的辅助函数：
     给定 client, model_id, url, 调用接口获取对应 Markdown。
+    如果提供了 cache，则先查缓存（refresh=True 时跳过读取），成功结果写回缓存。
+    如果提供了 limiter，则请求经过限流器，遇到 429/5xx 等暂时性错误时自动退避重试。
+    如果提供了 llm_slots（多个任务共享的信号量），则每次实际调用 API 时占用其中一个名额。
+    如果提供了 run_metrics（metrics.RunMetrics），则记录每次调用的耗时、token 用量、错误和排队等待。
+    如果提供了 stream（streaming.StreamForwarder），则以 stream=True 调用，生成中的文本实时转发到进度流，
+    返回值与非流式调用相同。
+    如果提供了 hedger（hedging.Hedger），则调用超过其耗时阈值仍未完成时发出对冲请求，先返回的结果胜出；
+    对冲请求另占 llm_slots 和限流器并发上限的名额，没有空闲名额时不对冲。
+    如果提供了 deadline（deadline.Deadline），则每次调用的超时不超过剩余的时间预算，预算用完后不再重试。
+    如果提供了 prefetcher（prefetch.Prefetcher），则先在本地下载网页，把提取的正文代替 URL 发给模型；
+    失效链接（404 / 410）直接判定失败，不调用 LLM。
     返回值： (idx, md_text 或 None, 错误信息或 None)
     """
+    if cache is not None and not refresh:
+        md_text = cache.get(url, model_id)
+        if md_text is not None:
+            if run_metrics is not None:
+                run_metrics.observe_cache_hit()
+            return (batch_idx, md_text, None)
+
+    content = url
+    if prefetcher is not None:
+        try:
+            # 预取也计入时间预算，预算已用完时直接判定失败
+            content = prefetcher.prompt(url, None if deadline is None else deadline.call_timeout())
+        except Exception as e:
+            return (batch_idx, None, str(e))
+
+    queued_at = time.monotonic()
+
+    def request():
+        nonlocal queued_at
+        with llm_slots or nullcontext():
+            def create():
+                timeout = {} if deadline is None else {"timeout": deadline.call_timeout()}
+                if stream is None:
+                    return client.chat.completions.create(
+                        model=model_id,
+                        messages=[{"role": "user", "content": content}],
+                        **timeout,
+                    )
+                started = time.monotonic()
+                chunks = client.chat.completions.create(
+                    model=model_id,
+                    messages=[{"role": "user", "content": content}],
+                    stream=True,
+                    **timeout,
+                    # 在最后一块中返回 token 用量（openai 1.12 的 SDK 还没有 stream_options 参数）
+                    extra_body={"stream_options": {"include_usage": True}},
+                )
+                return streaming.collect_stream(chunks, stream.open(batch_idx, url), started, run_metrics)
+            call = create if hedger is None else partial(hedger.call, create, hedging.reserve(llm_slots, limiter))
+            if run_metrics is None:
+                return call()
+            # 排队等待只在第一次尝试时记录（限流等待与并发名额）
+            waited_since, queued_at = queued_at, None
+            return run_metrics.call(call, waited_since)
+
+    if deadline is not None:
+        request = deadline.guard(request)
     try:
-        completion = client.chat.completions.create(
-            model=model_id,
-            messages=[{"role": "user", "content": url}],
-        )
-        md_text = completion.choices[0].message.content
-        # 如果返回文本不是以 # 开头，则截去 # 之前的部分
-        if not md_text.startswith('#'):
-            start_hash = md_text.find('#')
-            if start_hash != -1:
-                md_text = md_text[start_hash:]  # 去除所有 # 之前的冗余文本
+        completion = limiter.call(request) if limiter is not None else request()
+        md_text = trim_leading_text(completion.choices[0].message.content)
+        if cache is not None:
+            cache.put(url, model_id, md_text)
         return (batch_idx, md_text, None)
     except Exception as e:
         return (batch_idx, None, str(e))
 
 
-def main(input_txt, output_md=None, progress_callback=None):
+def report(message, progress_callback=None):
+    """打印进度信息，并在提供了回调时同步推送给调用方（如 Web 进度流）。"""
+    print(message)
+    if progress_callback:
+        progress_callback(message)
+
+
+def run_sliding_window(executor, fetch, items, window, on_done, stop=None):
+    """
+    滑动窗口调度：始终保持 window 个请求在途，任意一个请求完成后立即补充下一个，
+    避免按批等待时一个慢请求拖住整批 worker。
+
+    参数:
+        executor: 线程池
+        fetch: 调用方式为 fetch(url, idx)，返回 (idx, md_text 或 None, 错误信息或 None)
+        items: 可迭代的 (idx, url)
+        window: 同时在途的最大请求数
+        on_done: 每个请求完成时调用 on_done(idx, md_text, err_msg)
+        stop: 可选，返回 True 时不再提交新的请求（已在途的请求仍会等待完成）
+    """
+    pending = iter(items)
+    in_flight = {}
+
+    def submit_next():
+        if stop is not None and stop():
+            return False
+        try:
+            idx, url = next(pending)
+        except StopIteration:
+            return False
+        in_flight[executor.submit(fetch, url, idx)] = idx
+        return True
+
+    for _ in range(window):
+        if not submit_next():
+            break
+
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            idx = in_flight.pop(future)
+            try:
+                (ret_idx, md_text, err_msg) = future.result()
+            except Exception as e:
+                (ret_idx, md_text, err_msg) = (idx, None, str(e))
+            on_done(ret_idx, md_text, err_msg)
+            # 每完成一个请求就立即补位，保持窗口满载
+            submit_next()
+
+
+def main(input_txt, output_md=None, progress_callback=None, use_cache=True, refresh=False, resume=None,
+         cancel_event=None, llm_slots=None, on_markdown=None, run_metrics=None, budget=None, priority_file=None):
     """
     从 input_txt 文件读取每行 URL，利用多线程并行调用 LLM Bot 接口获取 Markdown 文本并合并，
-    最终输出为一个 output_md 文件（纯 Markdown）。
+    最终输出为一个 output_md 文件（纯 Markdown）。每个摘要完成后即按原始顺序追加写入，
+    中途退出时已完成的部分仍保留在文件中。
+    每个任务在输出文件旁保存检查点日志（*.journal.jsonl），可通过 resume 从中断处继续。
     从 config.txt 文件读取 API Key、model ID 和处理参数。
     
     如果未指定 output_md，则使用默认路径和文件名：./output/AI_news_summary_yyyymmdd_hhmmss.md
@@ -53,7 +190,32 @@ def main(input_txt, output_md=None, progress_callback=None):
         input_txt: 输入文件路径，包含URL列表
         output_md: 输出Markdown文件路径
         progress_callback: 进度回调函数，用于实时更新进度信息
+        use_cache: 是否使用摘要缓存（对应命令行 --no-cache）
+        refresh: 忽略已有缓存重新请求，并用新结果覆盖缓存（对应命令行 --refresh）
+        resume: 要继续的任务（任务 ID、输出 .md 路径或日志路径，对应命令行 --resume）；
+                指定时忽略 input_txt 和 output_md，沿用原任务的URL列表和输出文件
+        cancel_event: 可选的 threading.Event，被设置后不再发起新请求，任务保持未完成状态以便之后继续
+        llm_slots: 可选的信号量，由多个同时运行的任务共享，限制全局同时在途的 LLM 请求数
+        on_markdown: 可选回调，每段摘要按输出文件中的顺序写出后以 on_markdown(md_text) 调用，
+                     用于在内存中同步构建合并后的文档（见 pipeline.py）
+        run_metrics: 可选的 metrics.RunMetrics，不指定时新建；请求耗时、token 用量、错误和排队等待
+                     记录在其中，结束时写入输出文件旁的运行报告（*.metrics.json）
+        budget: 可选的时间预算（秒，对应命令行 --budget），不指定时读取 [Deadline] budget_seconds；
+                预算快用完时不再发起新请求，未完成的URL写入输出文件旁的 *.skipped.txt
+        priority_file: 可选的关键词文件（每行一个，对应命令行 --priority），URL 包含其中任一关键词时优先处理；
+                       不指定时读取 [Deadline] priority_file。输入文件中每行 URL 后的整数列为显式优先级
     """
+    # 继续中断的任务时，URL列表和输出文件都来自检查点日志
+    resume_state = None
+    if resume:
+        resume_journal = journal.find_journal(resume)
+        if not os.path.exists(resume_journal):
+            report(f"找不到任务 {resume} 的检查点日志：{resume_journal}", progress_callback)
+            sys.exit(1)
+        resume_state = journal.load(resume_journal)
+        input_txt = resume_state["input"]
+        output_md = resume_state["output"]
+
     # 如果未指定输出文件，则使用默认路径和文件名
     if output_md is None:
         # 确保输出目录存在
@@ -67,133 +229,325 @@ def main(input_txt, output_md=None, progress_callback=None):
 
     # 1. 从配置文件读取配置
     if not os.path.exists("config.txt"):
-        message = "配置文件 config.txt 不存在！请检查。"
-        print(message)
-        if progress_callback:
-            progress_callback(message)
+        report("配置文件 config.txt 不存在！请检查。", progress_callback)
         sys.exit(1)
 
     config = configparser.ConfigParser()
     config.read("config.txt")
+    OpenAI = load_openai()
     
     api_key = config["API"]["api_key"]
     model_id = config["API"]["model_id"]
+    base_url = config["API"].get("base_url", BASE_URL)
+    # 单次 LLM 请求的超时（秒），避免个别请求无限期挂起
+    request_timeout = config["Processing"].getfloat("request_timeout", 600.0)
     batch_size = config["Processing"].getint("batch_size", 10)  # 默认值为10
+    # 可选：多个端点 / API Key（[Endpoint:*] 段），按负载分发并熔断持续失败的端点
+    endpoint_pool = endpoints.from_config(config, BASE_URL, on_event=lambda m: report(m, progress_callback))
+    if endpoint_pool is not None and endpoint_pool.capacity:
+        # 各端点都设置了并发上限时，同时在途的请求数取其总和，使吞吐量随端点数增加
+        batch_size = endpoint_pool.capacity
+    engine = config["Processing"].get("engine", "thread")  # thread 或 async
+    # 重复URL只请求一次；expand: 结果填回每个原始位置，collapse: 只保留首次出现的位置
+    duplicates = config["Processing"].get("duplicates", "expand")
+    cache = summary_cache.from_config(config) if use_cache else None
+    if cache is not None and endpoint_pool is not None:
+        # 摘要按实际回答请求的模型缓存；各端点的模型不同时，查缓存时无法确定请求会由哪个模型回答
+        models = endpoint_pool.model_ids
+        if len(models) > 1:
+            report(f"各端点使用不同的 model_id（{', '.join(models)}），不支持摘要缓存，[Cache] 设置已忽略",
+                   progress_callback)
+            cache.close()
+            cache = None
+        else:
+            model_id = models[0]
+    # 可选：流式调用，生成中的摘要实时转发到进度流（[Processing] stream）；命令行下只记录首个 token 的时间
+    stream = streaming.from_config(config, progress_callback or (lambda message: None))
+    # 可选：对冲请求（[Hedging] 段），超过近期耗时分位数仍未完成的调用再发一次，先返回者胜出
+    hedger = hedging.from_config(config, batch_size)
+    if hedger is not None and stream is not None:
+        report("流式调用不支持对冲，[Hedging] 设置已忽略", progress_callback)
+        hedger = None
+    if run_metrics is None:
+        run_metrics = metrics.RunMetrics()
+    collect_started = time.monotonic()
+    # 可选：时间预算（[Deadline] 段或 budget 参数），从这里开始计时
+    time_budget = deadline.from_config(config, budget, request_timeout, run_metrics,
+                                       on_event=lambda m: report(m, progress_callback))
+    limiter = rate_limit.from_config(config, batch_size, on_event=lambda m: report(m, progress_callback))
+    # 可选：把多个短 URL 打包进同一个请求（[Packing] 段）
+    packer = None
+    if config.getboolean("Packing", "enabled", fallback=False):
+        if engine == "async":
+            report("协程引擎暂不支持合并请求，[Packing] 设置已忽略", progress_callback)
+        else:
+            import url_packing
+            packer = url_packing.from_config(config)
+            # 合并请求一次返回多篇摘要，既不逐篇转发生成中的文字，也不对冲
+            if stream is not None:
+                report("合并请求不支持流式调用，[Processing] stream 设置已忽略", progress_callback)
+                stream = None
+            if hedger is not None:
+                report("合并请求不支持对冲，[Hedging] 设置已忽略", progress_callback)
+                hedger.close()
+                hedger = None
+    # 可选：本地预取网页正文（[Prefetch] 段），发给模型的是提取后的正文而不是 URL
+    prefetcher = None
+    if config.getboolean("Prefetch", "enabled", fallback=False):
+        if packer is not None:
+            report("合并请求不支持本地预取，[Prefetch] 设置已忽略", progress_callback)
+        else:
+            import prefetch
+            prefetcher = prefetch.from_config(config)
 
-    # 2. 初始化客户端
-    client = OpenAI(
-        base_url="https://ark.cn-beijing.volces.com/api/v3/bots",
-        api_key=api_key,
-    )
-
-    # 3. 读取包含 URL 的文件
-    if not os.path.exists(input_txt):
-        message = f"输入文件 {input_txt} 不存在！"
-        print(message)
-        if progress_callback:
-            progress_callback(message)
-        sys.exit(1)
+    # 2. 读取包含 URL 的文件（继续任务时使用日志中保存的列表）
+    if resume_state is not None:
+        urls = resume_state["urls"]
+        explicit_priorities = resume_state["priorities"]
+        completed = resume_state["results"]
+    else:
+        if not os.path.exists(input_txt):
+            report(f"输入文件 {input_txt} 不存在！", progress_callback)
+            sys.exit(1)
 
-    with open(input_txt, "r", encoding="utf-8") as f:
-        urls = [line.strip() for line in f if line.strip()]
+        # 每行一个 URL，可在其后附一列整数优先级
+        with open(input_txt, "r", encoding="utf-8") as f:
+            entries = [deadline.parse_url_line(line) for line in f if line.strip()]
+        urls = [url for url, _ in entries]
+        explicit_priorities = [priority for _, priority in entries]
+        completed = {}
 
     total_urls = len(urls)
-    total_batches = math.ceil(total_urls / batch_size)
-    message = f"\n开始处理，共{total_urls}个URL，分{total_batches}批进行（每批{batch_size}个）...\n"
-    print(message)
-    if progress_callback:
-        progress_callback(message)
+    unique_urls, positions = dedupe_urls(urls)
+    total_calls = len(unique_urls)
+    # 优先级：重复 URL 取各位置中最高的显式优先级；没有显式优先级时按关键词匹配
+    priority_file = priority_file or config.get("Deadline", "priority_file", fallback="") or None
+    keywords = deadline.load_keywords(priority_file) if priority_file and os.path.exists(priority_file) else ()
+    unique_explicit = None
+    if explicit_priorities is not None:
+        unique_explicit = [max((explicit_priorities[pos] for pos in positions[idx]
+                                if explicit_priorities[pos] is not None), default=None)
+                           for idx in range(total_calls)]
+    priorities = deadline.url_priorities(unique_urls, unique_explicit, keywords)
+    report(f"\n开始处理，共{total_urls}个URL，去重后需请求{total_calls}个（节省{total_urls - total_calls}次调用），"
+           f"最多{batch_size}个请求同时进行（完成一个立即补充下一个）...\n",
+           progress_callback)
+
+    # 3. 打开增量写出器（每个摘要完成后按原始顺序立即追加到输出文件）和检查点日志
+    try:
+        writer = OrderedMarkdownWriter(output_md, total_urls, on_write=on_markdown)
+        if resume_state is not None:
+            checkpoint = journal.Journal(journal.journal_path(output_md))
+        else:
+            checkpoint = journal.Journal.create(journal.journal_path(output_md), input_txt, output_md, urls,
+                                                explicit_priorities)
+    except Exception as e:
+        report(f"写入文件失败: {e}", progress_callback)
+        return
+
+    # 4. 并行调用 API（逐个URL汇报进度）
+    finished = 0
+    succeeded = 0
+
+    def place(idx, md_text):
+        """把一个去重后URL的结果填入它在原始输入中的位置。"""
+        first = positions[idx][0]
+        for pos in positions[idx]:
+            writer.add(pos, md_text if duplicates == "expand" or pos == first else None)
+
+    reported = set()
+    summarized = set()
+
+    def on_done(idx, md_text, err_msg):
+        nonlocal finished, succeeded
+        finished += 1
+        reported.add(idx)
+        cache_info = f" （{cache.stats_text()}）" if cache is not None else ""
+        run_metrics.observe_url("failed" if err_msg else "succeeded")
+        if err_msg:
+            place(idx, None)
+            report(f"[{finished}/{total_calls}] 错误: {unique_urls[idx]} {err_msg}{cache_info}", progress_callback)
+            return
+        succeeded += 1
+        summarized.add(idx)
+        checkpoint.record(idx, unique_urls[idx], md_text)
+        place(idx, md_text)
+        report(f"[{finished}/{total_calls}] 完成: {unique_urls[idx]}{cache_info}", progress_callback)
+
+    # 继续任务时，日志中已完成的URL直接填入结果，不再请求
+    pending = []
+    for idx, url in enumerate(unique_urls):
+        if url in completed:
+            finished += 1
+            succeeded += 1
+            place(idx, completed[url])
+        else:
+            pending.append((idx, url))
+    if resume_state is not None:
+        report(f"继续任务 {journal.job_id_for(output_md)}：已完成 {succeeded} 个URL，剩余 {len(pending)} 个", progress_callback)
+    # 优先级高的先发出（稳定排序，同级保持输入顺序）；输出文件中的顺序不变
+    pending = deadline.order_by_priority(pending, priorities)
+    prioritized = sum(1 for idx, _ in pending if priorities[idx] > 0)
+    if time_budget is not None or prioritized:
+        budget_info = f"时间预算 {time_budget.budget:.0f} 秒，" if time_budget is not None else ""
+        report(f"{budget_info}{prioritized} 个URL优先处理", progress_callback)
 
-    # 4. 并行调用 API
-    results = []  # 用于存放 (idx, md_text) 的结果
-    with ThreadPoolExecutor(max_workers=batch_size) as executor:
-        for batch in range(total_batches):
-            start_idx = batch * batch_size
-            end_idx = min((batch + 1) * batch_size, total_urls)
-            batch_urls = urls[start_idx:end_idx]
-            current_batch_size = len(batch_urls)
-            remaining_batches = total_batches - batch - 1
-            
-            message = f"正在处理第{batch+1}批，共{current_batch_size}个URL，还剩{remaining_batches}批"
-            print(message)
-            if progress_callback:
-                progress_callback(message)
-            
-            future_to_idx = {}
-            for i, url in enumerate(batch_urls):
-                future = executor.submit(fetch_markdown, client, model_id, url, start_idx+i)
-                future_to_idx[future] = start_idx+i
-
-            for future in as_completed(future_to_idx):
-                idx = future_to_idx[future]
-                try:
-                    (ret_idx, md_text, err_msg) = future.result()
+    stop = cancel_event.is_set if cancel_event is not None else None
+    if time_budget is not None:
+        cancelled = stop
+
+        def stop():
+            return (cancelled is not None and cancelled()) or time_budget.exhausted()
+    try:
+        if engine == "async":
+            # 协程引擎：单个事件循环 + 共享连接池，不为每个在途请求占用线程
+            import collect_async
+            collect_async.run(api_key, model_id, pending, batch_size, on_done,
+                              base_url=base_url, cache=cache, refresh=refresh, limiter=limiter,
+                              llm_slots=llm_slots, stop=stop, run_metrics=run_metrics, endpoint_pool=endpoint_pool,
+                              stream=stream, hedger=hedger, timeout=request_timeout, deadline=time_budget,
+                              prefetcher=prefetcher,
+                              **collect_async.pool_settings(config))
+        else:
+            # 启用限流器时由它负责重试，关闭 SDK 自带的重试以免重复退避
+            max_retries = 0 if limiter else 2
+            if endpoint_pool is not None:
+                client = endpoint_pool.client(max_retries=max_retries, timeout=request_timeout)
+            else:
+                client = OpenAI(base_url=base_url, api_key=api_key, max_retries=max_retries, timeout=request_timeout)
+            if packer is not None:
+                # 命中缓存的URL不参与打包；其余按 token 预算分组，每组一个请求
+                misses = []
+                for idx, url in pending:
+                    md_text = cache.get(url, model_id) if cache is not None and not refresh else None
+                    if md_text is not None:
+                        run_metrics.observe_cache_hit()
+                        on_done(idx, md_text, None)
+                    else:
+                        misses.append((idx, url))
+                groups = packer.pack(misses)
+                report(f"合并请求：{len(misses)} 个URL打包为 {len(groups)} 个请求", progress_callback)
+
+                def on_group_done(group_idx, results, err_msg):
                     if err_msg:
-                        error_message = f"错误: {err_msg}"
-                        print(error_message)
-                        if progress_callback:
-                            progress_callback(error_message)
-                        continue
-                    results.append((ret_idx, md_text))
-                except Exception as e:
-                    error_message = f"错误: {e}"
-                    print(error_message)
-                    if progress_callback:
-                        progress_callback(error_message)
-
-            batch_complete_message = f"第{batch+1}批处理完成"
-            print(batch_complete_message)
-            if progress_callback:
-                progress_callback(batch_complete_message)
-
-    completion_message = f"\n全部处理完成，成功处理 {len(results)}/{total_urls} 个URL\n"
-    print(completion_message)
-    if progress_callback:
-        progress_callback(completion_message)
+                        results = [(idx, None, err_msg) for idx, _ in groups[group_idx]]
+                    for result in results:
+                        on_done(*result)
 
-    # 5. 按照原先顺序 (idx) 排序并合并所有 Markdown
-    results.sort(key=lambda x: x[0])
-    merged_md = "\n\n".join(r[1] for r in results if r[1])
+                fetch = partial(packer.fetch, client, model_id, cache=cache, limiter=limiter, llm_slots=llm_slots,
+                                run_metrics=run_metrics, deadline=time_budget)
+                with ThreadPoolExecutor(max_workers=batch_size) as executor:
+                    run_sliding_window(executor, fetch, list(enumerate(groups)), batch_size, on_group_done,
+                                       stop=stop)
+            else:
+                fetch = partial(fetch_markdown, client, model_id, cache=cache, refresh=refresh,
+                                limiter=limiter, llm_slots=llm_slots, run_metrics=run_metrics, stream=stream,
+                                hedger=hedger, deadline=time_budget, prefetcher=prefetcher)
+                with ThreadPoolExecutor(max_workers=batch_size) as executor:
+                    run_sliding_window(executor, fetch, pending, batch_size, on_done, stop=stop)
+        # 取消后未发出的URL留空，使其后已完成的结果仍能写出
+        for idx, _ in pending:
+            if idx not in reported:
+                place(idx, None)
+    finally:
+        writer.close()
+        # 全部成功才标记任务结束；有失败的URL时保留为未完成，便于之后继续
+        if succeeded == total_calls:
+            checkpoint.finish()
+        checkpoint.close()
 
-    if not merged_md.strip():
-        empty_message = "未获取到任何有效内容，程序结束。"
-        print(empty_message)
-        if progress_callback:
-            progress_callback(empty_message)
-        return
+    summary = f"\n全部处理完成，成功处理 {succeeded}/{total_calls} 个URL（去重节省 {total_urls - total_calls} 次调用）"
+    if cache is not None:
+        summary += f"，{cache.stats_text()}"
+        cache.close()
+    if limiter is not None:
+        summary += f"，{limiter.stats_text()}"
+    if packer is not None:
+        summary += f"，{packer.stats_text()}"
+    if endpoint_pool is not None:
+        summary += f"，{endpoint_pool.stats_text()}"
+    if hedger is not None:
+        summary += f"，{hedger.stats_text()}"
+        hedger.close()
+    if prefetcher is not None:
+        summary += f"，{prefetcher.stats_text()}"
+        prefetcher.close()
+    if time_budget is not None:
+        summary += f"，{time_budget.stats_text()}"
+    report(summary + "\n", progress_callback)
+
+    # 有时间预算时，把未完成的URL（未发出、超时或失败）按优先级写出，供下一次运行使用
+    skipped = [(idx, url) for idx, url in pending if idx not in summarized]
+    skipped_file = deadline.skipped_path(output_md)
+    if not skipped and os.path.exists(skipped_file):
+        # 之前运行留下的列表已全部完成
+        os.remove(skipped_file)
+    if time_budget is not None and skipped:
+        not_sent = sum(1 for idx, _ in skipped if idx not in reported)
+        try:
+            deadline.write_skipped(skipped_file, [url for _, url in skipped], [priorities[idx] for idx, _ in skipped])
+            report(f"{len(skipped)} 个URL未完成（{not_sent} 个未发出，{len(skipped) - not_sent} 个超时或失败），"
+                   f"已按优先级写入 {skipped_file}，可作为下一次运行的输入或用 --resume 继续", progress_callback)
+        except OSError as e:
+            report(f"写入跳过的URL列表失败: {e}", progress_callback)
 
-    # 6. 将合并后的 Markdown 内容写入 .md 文件
+    # 运行报告：延迟分位数、token 用量、按类型的错误数和排队等待，写在输出文件旁
+    run_metrics.observe_stage("collect", time.monotonic() - collect_started)
+    llm_summary = run_metrics.summary()["llm"]
+    latency = llm_summary["latency_seconds"]
+    if latency["count"]:
+        report(f"LLM 请求 {llm_summary['requests']} 次，延迟 p50 {latency['p50']:.2f}s / p95 {latency['p95']:.2f}s，"
+               f"token 共 {llm_summary['tokens']['total']}，错误 {sum(llm_summary['errors'].values())} 次", progress_callback)
+    run_metrics.info.update(input=input_txt, output=output_md, model_id=model_id, engine=engine,
+                            batch_size=batch_size)
+    if endpoint_pool is not None:
+        run_metrics.info["endpoints"] = endpoint_pool.stats()
+    if hedger is not None:
+        run_metrics.info["hedging"] = hedger.stats()
+    if prefetcher is not None:
+        run_metrics.info["prefetch"] = prefetcher.stats()
+    if time_budget is not None:
+        run_metrics.info["deadline"] = {"budget_seconds": time_budget.budget, "stopped_early": time_budget.stopped,
+                                        "skipped": len(skipped)}
     try:
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_md)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            
-        with open(output_md, "w", encoding="utf-8") as f:
-            f.write(merged_md)
-        file_message = f"已生成Markdown文件：{output_md}"
-        print(file_message)
-        if progress_callback:
-            progress_callback(file_message)
-        return output_md
-    except Exception as e:
-        error_message = f"写入文件失败: {e}"
-        print(error_message)
-        if progress_callback:
-            progress_callback(error_message)
+        run_metrics.write_report(metrics.report_path(output_md))
+    except OSError as e:
+        report(f"写入运行报告失败: {e}", progress_callback)
+    if cancel_event is not None and cancel_event.is_set():
+        report(f"任务已取消，未处理的 {total_calls - finished} 个URL可稍后继续", progress_callback)
+
+    if writer.written == 0:
+        os.remove(output_md)
+        report("未获取到任何有效内容，程序结束。", progress_callback)
+        return
+
+    report(f"已生成Markdown文件：{output_md}", progress_callback)
+    return output_md
 
 if __name__ == "__main__":
     """
     命令行用法示例:
-        python collect_to_md.py input_urls.txt [output.md]
+        python collect_to_md.py input_urls.txt [output.md] [--no-cache] [--refresh]
+        python collect_to_md.py --resume AI_news_summary_yyyymmdd_hhmmss
+        python collect_to_md.py input_urls.txt --budget 1200 --priority highlight_headers.txt
         
     如果不指定输出文件，则使用默认路径和文件名：./output/AI_news_summary_yyyymmdd_hhmmss.md
     """
-    if len(sys.argv) < 2:
-        print("用法示例: python collect_to_md.py input.txt [output.md]")
-        print("如果不指定输出文件，则使用默认路径和文件名：./output/AI_news_summary_yyyymmdd_hhmmss.md")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="从URL列表生成AI新闻摘要Markdown",
+        epilog="如果不指定输出文件，则使用默认路径和文件名：./output/AI_news_summary_yyyymmdd_hhmmss.md")
+    parser.add_argument("input_txt", nargs="?", help="包含URL列表的文本文件，每行一个URL")
+    parser.add_argument("output_md", nargs="?", default=None, help="输出的Markdown文件路径（可选）")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入摘要缓存")
+    parser.add_argument("--refresh", action="store_true", help="忽略已有缓存重新请求，并用新结果更新缓存")
+    parser.add_argument("--resume", metavar="JOB",
+                        help="继续中断的任务：任务ID（输出文件名去掉扩展名）、输出的 .md 路径或 .journal.jsonl 路径")
+    parser.add_argument("--budget", type=float, metavar="SECONDS",
+                        help="时间预算（秒）：快用完时不再发起新请求，未完成的URL写入 .skipped.txt")
+    parser.add_argument("--priority", metavar="FILE", help="关键词列表（每行一个），URL 包含其中任一关键词时优先处理")
+    args = parser.parse_args()
+    if not args.input_txt and not args.resume:
+        parser.error("需要指定 input_txt，或使用 --resume 继续已有任务")
 
-    input_txt_path = sys.argv[1]
-    output_md_path = sys.argv[2] if len(sys.argv) > 2 else None
-    main(input_txt_path, output_md_path)
+    main(args.input_txt, args.output_md, use_cache=not args.no_cache, refresh=args.refresh, resume=args.resume,
+         budget=args.budget, priority_file=args.priority)
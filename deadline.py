@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间预算与优先级：在截稿时间之前产出尽可能完整的摘要。
+
+- 优先级：输入文件每行可以在 URL 后面用空白隔开写一个整数优先级（数值大的先处理）；
+  没有写优先级的 URL，命中关键词列表（如高亮标题文件）时优先级为 1，否则为 0。
+  优先级相同的 URL 按输入顺序处理。优先级只影响请求的发出顺序，输出文件仍按原始顺序排列；
+- 时间预算：采集阶段在 budget 秒内结束。剩余时间不够完成一次典型调用（近期调用耗时的 p90，
+  至少 reserve 秒）时不再发出新请求；在途请求的超时不超过剩余时间，到期仍未完成的按失败处理；
+- 跳过的 URL（未发出、超时或失败）按优先级写入输出文件旁的 *.skipped.txt，可直接作为下一次运行的输入，
+  任务保持未完成状态，也可以用 --resume 继续。
+
+在 config.txt 的 [Deadline] 段中设置，或通过命令行 --budget / --priority 指定。
+"""
+
+import os
+import threading
+import time
+
+import metrics
+
+DEFAULT_RESERVE = 30.0
+DEFAULT_QUANTILE = 90
+LATENCY_WINDOW = 200
+SKIPPED_SUFFIX = ".skipped.txt"
+
+
+class DeadlineExceeded(Exception):
+    """时间预算已用完，不再发出（或重试）请求。"""
+
+    def __init__(self):
+        super().__init__("时间预算已用完")
+
+
+def parse_url_line(line):
+    """解析输入文件的一行，返回 (url, 优先级或 None)；第二列不是整数时忽略。"""
+    fields = line.split()
+    if len(fields) < 2:
+        return line.strip(), None
+    try:
+        return fields[0], int(fields[1])
+    except ValueError:
+        return fields[0], None
+
+
+def load_keywords(path):
+    """读取关键词列表（每行一个，格式与高亮标题文件相同），统一转为小写。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip().lower() for line in f if line.strip()]
+
+
+def url_priorities(urls, explicit=None, keywords=()):
+    """
+    每个 URL 的优先级：explicit 中对应位置给出了优先级时取该值，
+    否则 URL（不区分大小写）包含任一关键词时为 1，其余为 0。
+    """
+    explicit = explicit or [None] * len(urls)
+    priorities = []
+    for url, value in zip(urls, explicit):
+        if value is None:
+            lowered = url.lower()
+            value = 1 if any(keyword in lowered for keyword in keywords) else 0
+        priorities.append(value)
+    return priorities
+
+
+def order_by_priority(items, priorities):
+    """把 (idx, url) 按 priorities[idx] 从高到低排序，优先级相同时保持原顺序。"""
+    return sorted(items, key=lambda item: -priorities[item[0]])
+
+
+class Deadline:
+    """采集阶段的时间预算：判断是否还来得及发出新请求，并把在途请求的超时限制在剩余时间内。线程安全。"""
+
+    def __init__(self, budget, reserve=DEFAULT_RESERVE, request_timeout=600.0, run_metrics=None, on_event=None):
+        self.budget = budget
+        self.reserve = reserve
+        self.request_timeout = request_timeout
+        self.run_metrics = run_metrics
+        self.on_event = on_event
+        self.started = time.monotonic()
+        self.stopped = False     # 是否因预算不足停止过发出新请求
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return self.budget - (time.monotonic() - self.started)
+
+    def margin(self):
+        """发出一个新请求至少需要的剩余时间：近期成功调用耗时的 p90，且不少于 reserve。"""
+        latencies = self.run_metrics.recent_latencies(LATENCY_WINDOW) if self.run_metrics is not None else []
+        if not latencies:
+            return self.reserve
+        return max(self.reserve, metrics.percentile(sorted(latencies), DEFAULT_QUANTILE))
+
+    def exhausted(self):
+        """剩余时间不够完成一次典型调用时返回 True（用作 run_sliding_window 等的 stop）。"""
+        remaining = self.remaining()
+        margin = self.margin()
+        if remaining >= margin:
+            return False
+        with self._lock:
+            first, self.stopped = not self.stopped, True
+        if first and self.on_event is not None:
+            self.on_event(f"时间预算剩余 {max(0.0, remaining):.1f} 秒，不足以完成一次请求（约 {margin:.1f} 秒），"
+                          f"不再发出新请求")
+        return True
+
+    def call_timeout(self):
+        """本次调用的超时：request_timeout 与剩余时间中较小者；预算已用完时抛出 DeadlineExceeded。"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return min(self.request_timeout, remaining)
+
+    def _out_of_time(self, exc):
+        """失败发生时剩余时间已不够再试一次：换成 DeadlineExceeded，限流器不再退避重试。"""
+        if not isinstance(exc, DeadlineExceeded) and self.remaining() < self.margin():
+            raise DeadlineExceeded() from exc
+
+    def guard(self, request):
+        """包装交给限流器的 request()，预算将尽时的失败不再重试。"""
+        def guarded():
+            try:
+                return request()
+            except Exception as e:
+                self._out_of_time(e)
+                raise
+        return guarded
+
+    def guard_async(self, request):
+        """guard 的协程版本，request() 返回可等待对象。"""
+        async def guarded():
+            try:
+                return await request()
+            except Exception as e:
+                self._out_of_time(e)
+                raise
+        return guarded
+
+    def stats_text(self):
+        used = time.monotonic() - self.started
+        return f"时间预算 {self.budget:.0f} 秒，采集用时 {used:.1f} 秒"
+
+
+def skipped_path(output_md):
+    """跳过的 URL 列表的路径：与输出文件同名，扩展名为 .skipped.txt。"""
+    return os.path.splitext(output_md)[0] + SKIPPED_SUFFIX
+
+
+def write_skipped(path, urls, priorities):
+    """按优先级写出跳过的 URL，格式与输入文件相同（URL 与优先级一列）。"""
+    with open(path, "w", encoding="utf-8") as f:
+        for url, priority in zip(urls, priorities):
+            f.write(f"{url} {priority}\n" if priority else f"{url}\n")
+
+
+def from_config(config, budget=None, request_timeout=600.0, run_metrics=None, on_event=None):
+    """
+    创建 Deadline：budget（秒）不指定时读取 [Deadline] budget_seconds；预算为 0 或未设置时返回 None。
+    """
+    if budget is None:
+        budget = config.getfloat("Deadline", "budget_seconds", fallback=0.0)
+    if not budget or budget <= 0:
+        return None
+    return Deadline(budget, reserve=config.getfloat("Deadline", "reserve_seconds", fallback=DEFAULT_RESERVE),
+                    request_timeout=request_timeout, run_metrics=run_metrics, on_event=on_event)
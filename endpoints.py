@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多端点、多 API Key 的请求分发：
+
+- 端点：config.txt 中 [API] 段和每个 [Endpoint:名称] 段各是一个端点，有自己的 base_url、api_key、
+  model_id、权重（weight）和同时在途请求数上限（max_concurrency，0 表示不限制）；
+  [Endpoint:*] 段未设置的项沿用 [API] 段的值，因此只写 api_key 即可为同一服务增加一个 Key；
+  [API] 段 weight = 0 时不参与分发，只提供默认值；
+- 分发：least_loaded（默认）选择 在途请求数/权重 最小的端点，weighted_round_robin 按权重平滑轮询；
+  所有可用端点都已满载时等待其中一个请求完成；
+- 熔断：某个端点连续失败 failure_threshold 次后暂停 cooldown_seconds 秒，之后先放行一个试探请求，
+  成功则恢复，失败则继续暂停。只有可重试的错误（超时、连接失败、429、5xx）计为失败；
+  400、401、内容审核拒绝等错误说明端点本身正常工作，不计入熔断；
+  所有端点都被熔断时抛出 rate_limit.EndpointsUnavailable，由限流器按暂停剩余时间退避重试。
+
+EndpointPool.client / async_client 返回与 OpenAI 客户端接口相同的对象（chat.completions.create），
+每次调用时选择一个端点发出请求，因此 fetch_markdown、合并请求和限流器都无需改动。
+只有在 config.txt 中配置了 [Endpoint:*] 段时才启用。
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import metrics
+from rate_limit import EndpointsUnavailable, classify_error
+
+SECTION_PREFIX = "Endpoint:"
+STRATEGIES = ("least_loaded", "weighted_round_robin")
+DEFAULT_STRATEGY = "least_loaded"
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30.0
+
+
+class Endpoint:
+    """一个端点（base_url + api_key + model_id）及其负载与熔断状态，由 EndpointPool 加锁访问。"""
+
+    def __init__(self, name, base_url, api_key, model_id, weight=1.0, max_concurrency=0):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model_id = model_id
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.current_weight = 0.0    # 平滑加权轮询的当前值
+        self.failures = 0            # 连续失败次数
+        self.open_until = 0.0        # 熔断结束时间（time.monotonic()），0 表示未熔断
+        self.probing = False         # 熔断结束后是否已放行试探请求
+        self.requests = 0
+        self.errors = 0
+        self.trips = 0
+
+    def available(self, now):
+        """能否再接收一个请求：未满载，且未熔断（熔断结束后只放行一个试探请求）。"""
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return False
+        if self.open_until:
+            return now >= self.open_until and not self.probing
+        return True
+
+
+class EndpointPool:
+    """按策略把请求分发到多个端点，统计各端点的负载和失败并执行熔断。线程安全。"""
+
+    def __init__(self, endpoints, strategy=DEFAULT_STRATEGY, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN, on_event=None):
+        if not endpoints:
+            raise ValueError("至少需要一个端点")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的分发策略 {strategy!r}，可选 {', '.join(STRATEGIES)}")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.on_event = on_event
+        self._cond = threading.Condition()
+
+    @property
+    def capacity(self):
+        """各端点 max_concurrency 之和；有端点不限制并发时返回 None。"""
+        if any(endpoint.max_concurrency <= 0 for endpoint in self.endpoints):
+            return None
+        return sum(endpoint.max_concurrency for endpoint in self.endpoints)
+
+    @property
+    def model_ids(self):
+        """参与分发的各端点使用的 model_id（去重，按端点顺序）。"""
+        return list(dict.fromkeys(endpoint.model_id for endpoint in self.endpoints))
+
+    def _emit(self, message):
+        if self.on_event:
+            self.on_event(message)
+
+    def _select(self, now):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not candidates:
+            return None
+        if self.strategy == "weighted_round_robin":
+            # 平滑加权轮询（同 nginx）：权重大的端点被选中的次数多，且不会连续集中
+            total = sum(endpoint.weight for endpoint in candidates)
+            for endpoint in candidates:
+                endpoint.current_weight += endpoint.weight
+            chosen = max(candidates, key=lambda endpoint: endpoint.current_weight)
+            chosen.current_weight -= total
+            return chosen
+        # 在途请求数相对权重最小者；相同时按已发请求数轮换，避免总选第一个
+        return min(candidates, key=lambda endpoint: (endpoint.in_flight / endpoint.weight,
+                                                     endpoint.requests / endpoint.weight))
+
+    def _unavailable_for(self, now):
+        """所有端点都处于熔断中时返回最早恢复的剩余秒数，否则返回 None（有试探请求在途时等待其结果）。"""
+        if all(endpoint.open_until and now < endpoint.open_until for endpoint in self.endpoints):
+            return max(0.0, min(endpoint.open_until for endpoint in self.endpoints) - now)
+        return None
+
+    def _take(self, endpoint):
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        if endpoint.open_until:
+            endpoint.probing = True
+        return endpoint
+
+    def try_acquire(self):
+        """选择一个端点并占用其一个名额；都已满载时返回 None，都被熔断时抛出 EndpointsUnavailable。"""
+        with self._cond:
+            now = time.monotonic()
+            endpoint = self._select(now)
+            if endpoint is not None:
+                return self._take(endpoint)
+            retry_after = self._unavailable_for(now)
+            if retry_after is not None:
+                raise EndpointsUnavailable(retry_after)
+            return None
+
+    def acquire(self):
+        """try_acquire 的阻塞版本：都已满载时等待有请求完成或熔断结束。"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                endpoint = self._select(now)
+                if endpoint is not None:
+                    return self._take(endpoint)
+                retry_after = self._unavailable_for(now)
+                if retry_after is not None:
+                    raise EndpointsUnavailable(retry_after)
+                # 熔断到期不会触发通知，定期醒来重新检查
+                self._cond.wait(timeout=0.5)
+
+    def release(self, endpoint, error=None):
+        """请求结束后释放名额；error 为失败时的异常，可重试的错误计入熔断判断。"""
+        tripped = False
+        # 不可重试的错误（请求本身有问题）说明端点能正常应答，与成功一样重置连续失败次数
+        unhealthy = error is not None and classify_error(error)[0]
+        with self._cond:
+            endpoint.in_flight -= 1
+            probe, endpoint.probing = endpoint.probing, False
+            if error is not None:
+                endpoint.errors += 1
+            if not unhealthy:
+                endpoint.failures = 0
+                endpoint.open_until = 0.0
+            else:
+                endpoint.failures += 1
+                # 熔断前已发出的请求失败时不重复熔断；试探请求失败则重新暂停
+                if probe or (not endpoint.open_until and endpoint.failures >= self.failure_threshold):
+                    endpoint.open_until = time.monotonic() + self.cooldown
+                    endpoint.trips += 1
+                    tripped = True
+            self._cond.notify_all()
+        metrics.REGISTRY.inc("ai_news_llm_endpoint_requests_total", endpoint=endpoint.name,
+                             result="ok" if error is None else "error")
+        if tripped:
+            metrics.REGISTRY.inc("ai_news_llm_endpoint_circuit_open_total", endpoint=endpoint.name)
+            self._emit(f"端点 {endpoint.name} 连续失败 {endpoint.failures} 次（{error.__class__.__name__}），"
+                       f"暂停 {self.cooldown:.0f} 秒")
+
+    def client(self, max_retries=2, **client_kwargs):
+        """线程引擎使用的客户端：每个端点一个 OpenAI 客户端（client_kwargs 如 timeout），按策略分发。"""
+        from openai import OpenAI
+
+        clients = {endpoint.name: OpenAI(base_url=endpoint.base_url, api_key=endpoint.api_key,
+                                         max_retries=max_retries, **client_kwargs)
+                   for endpoint in self.endpoints}
+        return PooledClient(self, clients)
+
+    def async_client(self, http_client, max_retries=2, **client_kwargs):
+        """协程引擎使用的客户端：各端点的 AsyncOpenAI 共用同一个 httpx.AsyncClient 连接池。"""
+        from openai import AsyncOpenAI
+
+        clients = {endpoint.name: AsyncOpenAI(base_url=endpoint.base_url, api_key=endpoint.api_key,
+                                              http_client=http_client, max_retries=max_retries, **client_kwargs)
+                   for endpoint in self.endpoints}
+        return AsyncPooledClient(self, clients)
+
+    def stats(self):
+        with self._cond:
+            return [{"name": endpoint.name, "model_id": endpoint.model_id, "requests": endpoint.requests,
+                     "errors": endpoint.errors, "circuit_opened": endpoint.trips}
+                    for endpoint in self.endpoints]
+
+    def stats_text(self):
+        parts = []
+        for item in self.stats():
+            text = f"{item['name']} {item['requests']} 次（失败 {item['errors']}"
+            if item["circuit_opened"]:
+                text += f"，熔断 {item['circuit_opened']} 次"
+            parts.append(text + "）")
+        return "端点请求：" + "，".join(parts)
+
+
+class PooledClient:
+    """
+    与 OpenAI 客户端接口相同（client.chat.completions.create），每次调用分发到一个端点。
+    stream=True 时端点的名额保留到流式回复读完为止。
+    """
+
+    def __init__(self, pool, clients):
+        self.pool = pool
+        self.clients = clients
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model=None, **kwargs):
+        endpoint = self.pool.acquire()
+        try:
+            completion = self.clients[endpoint.name].chat.completions.create(
+                model=endpoint.model_id or model, **kwargs)
+        except Exception as e:
+            self.pool.release(endpoint, e)
+            raise
+        if kwargs.get("stream"):
+            return self._stream(endpoint, completion)
+        self.pool.release(endpoint)
+        return completion
+
+    def _stream(self, endpoint, chunks):
+        error = None
+        try:
+            yield from chunks
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(endpoint, error)
+
+
+class AsyncPooledClient(PooledClient):
+    """PooledClient 的协程版本；等待空闲端点时不阻塞事件循环。"""
+
+    async def create(self, model=None, **kwargs):
+        endpoint = self.pool.try_acquire()
+        while endpoint is None:
+            await asyncio.sleep(0.05)
+            endpoint = self.pool.try_acquire()
+        try:
+            completion = await self.clients[endpoint.name].chat.completions.create(
+                model=endpoint.model_id or model, **kwargs)
+        except Exception as e:
+            self.pool.release(endpoint, e)
+            raise
+        if kwargs.get("stream"):
+            return self._stream(endpoint, completion)
+        self.pool.release(endpoint)
+        return completion
+
+    async def _stream(self, endpoint, chunks):
+        error = None
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(endpoint, error)
+
+
+def from_config(config, base_url, on_event=None):
+    """
+    从 [API] 段和 [Endpoint:*] 段创建 EndpointPool；没有 [Endpoint:*] 段时返回 None（只使用 [API] 段）。
+    base_url 为 [API] 段未设置 base_url 时使用的默认地址。
+    """
+    names = [section for section in config.sections() if section.startswith(SECTION_PREFIX)]
+    if not names:
+        return None
+    default_url = config.get("API", "base_url", fallback=base_url)
+    default_key = config.get("API", "api_key", fallback="")
+    default_model = config.get("API", "model_id", fallback="")
+    endpoints = []
+    if config.getfloat("API", "weight", fallback=1.0) > 0:
+        endpoints.append(Endpoint("API", default_url, default_key, default_model,
+                                  weight=config.getfloat("API", "weight", fallback=1.0),
+                                  max_concurrency=config.getint("API", "max_concurrency", fallback=0)))
+    for section in names:
+        weight = config.getfloat(section, "weight", fallback=1.0)
+        if weight <= 0:
+            continue
+        endpoints.append(Endpoint(
+            section[len(SECTION_PREFIX):].strip(),
+            config.get(section, "base_url", fallback=default_url),
+            config.get(section, "api_key", fallback=default_key),
+            config.get(section, "model_id", fallback=default_model),
+            weight=weight,
+            max_concurrency=config.getint(section, "max_concurrency", fallback=0),
+        ))
+    return EndpointPool(
+        endpoints,
+        strategy=config.get("API", "dispatch", fallback=DEFAULT_STRATEGY),
+        failure_threshold=config.getint("API", "failure_threshold", fallback=DEFAULT_FAILURE_THRESHOLD),
+        cooldown=config.getfloat("API", "cooldown_seconds", fallback=DEFAULT_COOLDOWN),
+        on_event=on_event,
+    )
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对冲请求：降低少数极慢的 LLM 调用对整次运行耗时的影响。
+
+- 阈值：一次调用超过近期调用耗时的 quantile 分位数（默认 p90，至少 min_delay 秒）仍未完成时，
+  再发出一个相同的请求，先返回的结果胜出；积累 min_samples 个样本之前不对冲；
+- 预算：对冲请求数不超过调用总数的 max_hedge_ratio（默认 10%），额外的费用有上限；
+- 名额：对冲请求与原请求一样占用并发名额（任务间共享的信号量和限流器的并发上限，见 reserve），
+  没有空闲名额时不对冲；该名额在两个请求都结束后才归还，落后的请求也计入全局在途请求数；
+- 取消：协程引擎中落后的请求直接取消（关闭连接）；线程引擎无法中途打断同步调用，
+  落后请求的结果被丢弃，由 [Processing] request_timeout 限定其最长占用时间。
+  失败的尝试不会立即判定失败：另一个尝试仍在进行时等待它的结果。
+
+在 config.txt 的 [Hedging] 段中设置 enabled = true 启用；流式调用（[Processing] stream）时不对冲。
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+DEFAULT_QUANTILE = 90
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MAX_HEDGE_RATIO = 0.1
+DEFAULT_MIN_DELAY = 1.0
+DEFAULT_WINDOW = 200
+
+
+class Hedger:
+    """按近期耗时的分位数决定何时发出对冲请求，并统计对冲次数和胜出情况。线程安全。"""
+
+    def __init__(self, quantile=DEFAULT_QUANTILE, min_samples=DEFAULT_MIN_SAMPLES,
+                 max_hedge_ratio=DEFAULT_MAX_HEDGE_RATIO, min_delay=DEFAULT_MIN_DELAY, window=DEFAULT_WINDOW,
+                 max_workers=32):
+        self.quantile = quantile
+        self.min_samples = max(1, min_samples)
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_delay = min_delay
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0      # 对冲请求先于原请求完成的次数
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        # 每次调用的原请求和对冲请求都在这里执行，调用方线程只负责等待
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def delay(self):
+        """当前的对冲阈值（秒）；样本不足时返回 None（不对冲）。"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return max(self.min_delay, metrics.percentile(ordered, self.quantile))
+
+    def _begin(self):
+        with self._lock:
+            self.calls += 1
+
+    def _allow_hedge(self, spare):
+        """
+        对冲预算：对冲次数不超过调用次数的 max_hedge_ratio，且 spare() 能给出一个空闲名额。
+        返回归还名额的函数；不对冲时返回 None。
+        """
+        with self._lock:
+            if self.hedged + 1 > math.floor(self.calls * self.max_hedge_ratio):
+                return None
+            release = _no_slot if spare is None else spare()
+            if release is None:
+                return None
+            self.hedged += 1
+        metrics.REGISTRY.inc("ai_news_llm_hedged_requests_total")
+        return release
+
+    def _release_after(self, attempts, release):
+        """两个尝试都结束（完成、失败或被取消）后归还对冲请求占用的名额。"""
+        remaining = [len(attempts)]
+
+        def done(_):
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                release()
+        for attempt in attempts:
+            attempt.add_done_callback(done)
+
+    def _finish(self, started, hedge_won):
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+            if hedge_won:
+                self.hedge_wins += 1
+        if hedge_won:
+            metrics.REGISTRY.inc("ai_news_llm_hedge_wins_total")
+
+    def call(self, create, spare=None):
+        """
+        执行 create()，超过阈值未完成时再执行一次，返回先成功的结果；两次都失败时抛出原请求的异常。
+        spare 为可选的名额函数（见 reserve），对冲请求占用它给出的名额。
+        """
+        self._begin()
+        started = time.monotonic()
+        primary = self._executor.submit(create)
+        delay = self.delay()
+        if delay is not None:
+            wait([primary], timeout=delay)
+        release = None if primary.done() or delay is None else self._allow_hedge(spare)
+        if release is None:
+            completion = primary.result()
+            self._finish(started, False)
+            return completion
+
+        hedge = self._executor.submit(create)
+        self._release_after((primary, hedge), release)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 落后的请求无法中断，结果直接丢弃
+                    for loser in pending:
+                        loser.cancel()
+                    self._finish(started, future is hedge)
+                    return future.result()
+        return primary.result()
+
+    async def call_async(self, create, spare=None):
+        """call 的协程版本，create() 返回可等待对象；落后的请求被取消。"""
+        self._begin()
+        started = time.monotonic()
+        primary = asyncio.ensure_future(create())
+        delay = self.delay()
+        if delay is not None:
+            await asyncio.wait({primary}, timeout=delay)
+        release = None if primary.done() or delay is None else self._allow_hedge(spare)
+        if release is None:
+            completion = await primary
+            self._finish(started, False)
+            return completion
+
+        hedge = asyncio.ensure_future(create())
+        self._release_after((primary, hedge), release)
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._finish(started, task is hedge)
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        """不再接受新的调用；被丢弃的落后请求在后台自行结束。"""
+        self._executor.shutdown(wait=False)
+
+    def stats_text(self):
+        with self._lock:
+            calls, hedged, wins = self.calls, self.hedged, self.hedge_wins
+        rate = hedged / calls * 100 if calls else 0.0
+        return f"对冲请求 {hedged} 次（占 {rate:.1f}%），其中 {wins} 次对冲请求先完成"
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                    "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0}
+
+
+def _no_slot():
+    pass
+
+
+def reserve(llm_slots=None, limiter=None):
+    """
+    返回 Hedger.call 的 spare 参数：对冲请求另占共享信号量 llm_slots（threading.Semaphore）
+    和限流器并发上限各一个名额，任一方已满时返回 None（不对冲）。两者都没有时返回 None（不限制）。
+    """
+    if llm_slots is None and limiter is None:
+        return None
+
+    def spare():
+        if llm_slots is not None and not llm_slots.acquire(blocking=False):
+            return None
+        if limiter is not None and not limiter.concurrency.try_acquire():
+            if llm_slots is not None:
+                llm_slots.release()
+            return None
+
+        def release():
+            if limiter is not None:
+                limiter.concurrency.release()
+            if llm_slots is not None:
+                llm_slots.release()
+        return release
+    return spare
+
+
+def from_config(config, max_concurrency):
+    """从 [Hedging] 段创建 Hedger；未启用时返回 None。"""
+    if not config.getboolean("Hedging", "enabled", fallback=False):
+        return None
+    return Hedger(
+        quantile=config.getfloat("Hedging", "quantile", fallback=DEFAULT_QUANTILE),
+        min_samples=config.getint("Hedging", "min_samples", fallback=DEFAULT_MIN_SAMPLES),
+        max_hedge_ratio=config.getfloat("Hedging", "max_hedge_ratio", fallback=DEFAULT_MAX_HEDGE_RATIO),
+        min_delay=config.getfloat("Hedging", "min_delay_seconds", fallback=DEFAULT_MIN_DELAY),
+        # 每个在途调用占用一个原请求线程，再留出对冲请求和落后请求的余量
+        max_workers=max(8, max_concurrency * 3),
+    )
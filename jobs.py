@@ -0,0 +1,299 @@
+"""
+Persistent job queue and bounded worker pool for the web app.
+
+Jobs are stored in a SQLite table so they survive a server restart. A fixed
+number of worker threads claim queued jobs one at a time and run the handler
+registered for the job's kind, so concurrent submissions queue up instead of
+each spawning its own thread. Running jobs can be cancelled through a
+per-job threading.Event that the handler is expected to check.
+
+Several queues can share one database: each only claims, recovers and
+cancels jobs of the kinds it has handlers for, so e.g. PDF conversions get
+their own workers and never wait behind long collection jobs.
+
+The database may also be shared by several server processes (e.g.
+gunicorn -w N). A job is claimed with a conditional UPDATE, so exactly one
+process runs it; the owning process refreshes a heartbeat on its running
+jobs, and only jobs whose heartbeat has gone stale (the owner died) are
+queued again. Cancelling a running job sets a flag in the database that the
+owning process polls, whichever process received the request.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# Workers look for jobs submitted by other processes, and owners refresh heartbeats and
+# pick up cancel requests, this often (seconds)
+POLL_INTERVAL = 2.0
+# A running job whose heartbeat is older than this belongs to a dead process and is queued again
+STALE_AFTER = 30.0
+# How long a statement waits for another process's write lock before raising "database is locked"
+BUSY_TIMEOUT = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+def new_job_id():
+    """Unique, roughly time-ordered job id, e.g. 20240306_123045_1a2b3c4d."""
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+class JobQueue:
+    """SQLite-backed FIFO job queue served by a fixed pool of worker threads."""
+
+    def __init__(self, db_path, handlers, workers=2, on_recover=None, on_start=None,
+                 on_cancel=None, poll_interval=POLL_INTERVAL, stale_after=STALE_AFTER):
+        """
+        handlers: {kind: handler(job_id, params, cancel_event) -> result string}
+        on_recover: optional hook(job) -> params, called for every job that was
+            still running when the process that ran it died; the returned
+            params replace the job's params before it is queued again.
+        on_start: optional hook(job, waited_seconds), called when a worker picks up
+            a job, with the time the job spent queued since it was submitted.
+        on_cancel: optional hook(job_id), called when a job is cancelled before it
+            started; its handler never runs, so this is where it reports the end.
+        poll_interval / stale_after: see POLL_INTERVAL and STALE_AFTER.
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.handlers = handlers
+        self._kinds = tuple(handlers)
+        self._kind_filter = f"kind IN ({', '.join('?' * len(self._kinds))})"
+        self.workers = workers
+        self.on_recover = on_recover
+        self.on_start = on_start
+        self.on_cancel = on_cancel
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        # Identifies this queue's process in the jobs it runs
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._cancel_events = {}
+        self._threads = []
+        self._conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                heartbeat_at REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Databases created before jobs could be shared between processes lack the ownership columns
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (('owner', 'TEXT'), ('heartbeat_at', 'REAL'),
+                                   ('cancel_requested', 'INTEGER NOT NULL DEFAULT 0')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def submit(self, kind, params, job_id=None):
+        """Queue a job and return its id."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = job_id or new_job_id()
+        with self._wakeup:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), QUEUED, time.time()))
+            self._conn.commit()
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit=50):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def status_counts(self):
+        """Number of this queue's jobs per (kind, status)."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT kind, status, COUNT(*) AS n FROM jobs WHERE {self._kind_filter} GROUP BY kind, status",
+                self._kinds).fetchall()
+        return {(row['kind'], row['status']): row['n'] for row in rows}
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job, or ask a running one to stop (in whichever process runs it).
+        Returns False if already finished or not ours.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT kind, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row['kind'] not in self.handlers or row['status'] in FINISHED_STATES:
+                return False
+            if row['status'] == QUEUED:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                    (CANCELLED, time.time(), job_id, QUEUED))
+                self._conn.commit()
+                cancelled_queued = cursor.rowcount > 0
+            else:
+                cancelled_queued = False
+            if not cancelled_queued:
+                # Running (or claimed by a worker in the meantime): stop it in whichever process runs it
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+                self._conn.commit()
+                if job_id in self._cancel_events:
+                    self._cancel_events[job_id].set()
+                return cursor.rowcount > 0
+        if self.on_cancel:
+            self.on_cancel(job_id)
+        return True
+
+    def _finish(self, job_id, status, result=None, error=None):
+        # Caller holds self._lock. A job queued again after this process was taken for dead is no longer ours.
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND owner = ?",
+            (status, result, error, time.time(), job_id, self.owner))
+        self._conn.commit()
+
+    def _rollback(self):
+        # Caller holds self._lock. Ends the transaction a failed statement may have left open.
+        try:
+            self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running; blocks until one is available."""
+        with self._wakeup:
+            while True:
+                try:
+                    row = self._conn.execute(
+                        f"SELECT * FROM jobs WHERE status = ? AND {self._kind_filter} ORDER BY created_at LIMIT 1",
+                        (QUEUED,) + self._kinds).fetchone()
+                    if row is not None:
+                        started_at = time.time()
+                        # Another process may claim the same row between the SELECT and the UPDATE
+                        cursor = self._conn.execute(
+                            "UPDATE jobs SET status = ?, started_at = ?, owner = ?, heartbeat_at = ?, "
+                            "cancel_requested = 0 WHERE id = ? AND status = ?",
+                            (RUNNING, started_at, self.owner, started_at, row['id'], QUEUED))
+                        self._conn.commit()
+                        if not cursor.rowcount:
+                            continue
+                        self._cancel_events[row['id']] = threading.Event()
+                        return self._to_dict(row), self._cancel_events[row['id']], started_at - row['created_at']
+                except sqlite3.Error as e:
+                    # e.g. another process held the write lock for longer than BUSY_TIMEOUT; try again later
+                    logger.warning("Could not claim a job: %s", e)
+                    self._rollback()
+                # Jobs submitted by other processes do not notify this condition
+                self._wakeup.wait(self.poll_interval)
+
+    def _work(self):
+        while True:
+            job, cancel_event, waited = self._claim()
+            if self.on_start:
+                try:
+                    self.on_start(job, waited)
+                except Exception:
+                    pass
+            try:
+                result = self.handlers[job['kind']](job['id'], job['params'], cancel_event)
+            except BaseException as e:
+                status, result, error = FAILED, None, str(e)
+            else:
+                status, error = (CANCELLED if cancel_event.is_set() else COMPLETED), None
+            while True:
+                with self._lock:
+                    self._cancel_events.pop(job['id'], None)
+                    try:
+                        self._finish(job['id'], status, result, error)
+                        break
+                    except sqlite3.Error as e:
+                        # The heartbeat stays fresh meanwhile, so no other process runs the job again
+                        logger.warning("Could not record the end of job %s: %s", job['id'], e)
+                        self._rollback()
+                time.sleep(self.poll_interval)
+
+    def _recover(self):
+        """Re-queue jobs whose owner stopped refreshing their heartbeat (its process died)."""
+        stale = time.time() - self.stale_after
+        with self._wakeup:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND {self._kind_filter} "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?)", (RUNNING,) + self._kinds + (stale,)).fetchall()
+            for row in rows:
+                job = self._to_dict(row)
+                params = self.on_recover(job) if self.on_recover else job['params']
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, params = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                    "WHERE id = ? AND status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                    (QUEUED, json.dumps(params), job['id'], RUNNING, stale))
+            self._conn.commit()
+            if rows:
+                self._wakeup.notify_all()
+
+    def _monitor(self):
+        """Refresh the heartbeat of this process's running jobs, apply cancel requests and recover dead owners' jobs."""
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self._lock:
+                    self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = ?",
+                                       (time.time(), self.owner, RUNNING))
+                    self._conn.commit()
+                    for row in self._conn.execute(
+                            "SELECT id FROM jobs WHERE owner = ? AND status = ? AND cancel_requested = 1",
+                            (self.owner, RUNNING)).fetchall():
+                        if row['id'] in self._cancel_events:
+                            self._cancel_events[row['id']].set()
+                self._recover()
+            except sqlite3.Error:
+                # e.g. the database is locked by another process for longer than the busy timeout; try again later
+                pass
+
+    def start(self):
+        """Start the worker threads once; safe to call repeatedly."""
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._work, daemon=True, name=f"job-worker-{i}")
+                             for i in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._monitor, daemon=True, name="job-monitor"))
+        self._recover()
+        for thread in self._threads:
+            thread.start()
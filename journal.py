@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+采集任务的检查点日志：每个任务在输出文件旁保存一个只追加的 JSONL 日志，
+记录任务参数和每个已完成 URL 的 Markdown。进程崩溃或服务器重启后，
+可以用 `--resume <任务>`（或 Web 界面中的“继续”按钮）跳过已完成的 URL，只处理剩余部分。
+
+日志格式（每行一个 JSON 对象）：
+    {"type": "job", "input": ..., "output": ..., "urls": [...]}   第一行，任务参数（输入文件给出了优先级时
+                                                                 另有 "priorities"，见 deadline.py）
+    {"type": "result", "idx": 3, "url": ..., "markdown": ...}    每完成一个 URL 追加一行
+    {"type": "end"}                                              所有 URL 都成功后追加
+"""
+
+import json
+import os
+
+from url_utils import dedupe_urls
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+
+def journal_path(output_md):
+    """输出文件对应的日志路径，例如 output/x.md -> output/x.journal.jsonl。"""
+    return os.path.splitext(output_md)[0] + JOURNAL_SUFFIX
+
+
+def job_id_for(output_md):
+    """任务 ID 即输出文件名去掉扩展名，例如 AI_news_summary_20240306_123045。"""
+    return os.path.splitext(os.path.basename(output_md))[0]
+
+
+def find_journal(job, search_dir="output"):
+    """
+    根据 --resume 的参数找到日志文件：可以是日志路径、输出的 .md 路径，
+    或者 search_dir 目录下的任务 ID。
+    """
+    if job.endswith(JOURNAL_SUFFIX):
+        return job
+    if job.endswith(".md"):
+        return journal_path(job)
+    return os.path.join(search_dir, job + JOURNAL_SUFFIX)
+
+
+class Journal:
+    """只追加的任务日志，每条记录写入后立即刷新。"""
+
+    def __init__(self, path, mode="a"):
+        self.path = path
+        self._file = open(path, mode, encoding="utf-8")
+
+    @classmethod
+    def create(cls, path, input_txt, output_md, urls, priorities=None):
+        journal = cls(path, mode="w")
+        record = {"type": "job", "input": input_txt, "output": output_md, "urls": urls}
+        if priorities is not None and any(p is not None for p in priorities):
+            record["priorities"] = priorities
+        journal._append(record)
+        return journal
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def record(self, idx, url, md_text):
+        self._append({"type": "result", "idx": idx, "url": url, "markdown": md_text})
+
+    def finish(self):
+        self._append({"type": "end"})
+
+    def close(self):
+        self._file.close()
+
+
+def load(path):
+    """
+    读取日志，返回 {"input", "output", "urls", "priorities", "results": {url: markdown}, "finished": bool}。
+    进程崩溃时最后一行可能只写了一半，这样的行会被忽略。
+    """
+    state = {"input": None, "output": None, "urls": [], "priorities": None, "results": {}, "finished": False}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("type") == "job":
+                state["input"] = record.get("input")
+                state["output"] = record.get("output")
+                state["urls"] = record.get("urls", [])
+                state["priorities"] = record.get("priorities")
+            elif record.get("type") == "result":
+                state["results"][record["url"]] = record["markdown"]
+            elif record.get("type") == "end":
+                state["finished"] = True
+    return state
+
+
+def list_unfinished(search_dir="output"):
+    """列出 search_dir 下尚未完成的任务：[(任务 ID, 已完成数, URL 总数)]，按任务 ID 倒序。"""
+    jobs = []
+    if not os.path.isdir(search_dir):
+        return jobs
+    for name in sorted(os.listdir(search_dir), reverse=True):
+        if not name.endswith(JOURNAL_SUFFIX):
+            continue
+        state = load(os.path.join(search_dir, name))
+        if state["finished"]:
+            continue
+        jobs.append((name[:-len(JOURNAL_SUFFIX)], len(state["results"]), len(dedupe_urls(state["urls"])[0])))
+    return jobs
@@ -1,50 +1,140 @@
-import markdown2
+import configparser
+import functools
 import re
-import pdfkit
 import sys
 import os
+import time
+from collections import namedtuple
 from datetime import datetime
 
-# Configure wkhtmltopdf path - using system PATH if available
-try:
-    # Try to use wkhtmltopdf from system PATH
-    config = pdfkit.configuration()
-except Exception:
-    # Fallback to specific path if needed
-    config = pdfkit.configuration(wkhtmltopdf=r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
+import metrics
+import render_cache
+
+# markdown2 and pdfkit are imported where they are used, so importing this module (the web app,
+# pipeline.py, the header parsing) does not pay for them or for looking up the wkhtmltopdf binary
+
+@functools.lru_cache(maxsize=None)
+def wkhtmltopdf_configuration():
+    """The pdfkit configuration for the wkhtmltopdf binary, looked up on first use and reused afterwards.
+    
+    Raises OSError when wkhtmltopdf is neither on PATH nor at the default Windows install location."""
+    import pdfkit
+    try:
+        # Try to use wkhtmltopdf from system PATH
+        return pdfkit.configuration()
+    except Exception:
+        # Fallback to specific path if needed
+        return pdfkit.configuration(wkhtmltopdf=r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
+
+# Precompiled patterns used for every heading
+LINK_PATTERN = re.compile(r'\[(.*?)\]\(.*?\)')
+NON_ID_CHARS = re.compile(r'[^\w\s-]')
+WHITESPACE_RUNS = re.compile(r'[\s]+')
+PUNCTUATION = re.compile(r'[^\w\s]')
+
+TOC_HEADING = '# 目录'
+
+# A heading in the document: level (number of #), link-free text, anchor id and its line index
+Header = namedtuple('Header', ['level', 'text', 'id', 'line_index'])
+
+# Result of parse_document: the headers and the content with an anchor span in every heading
+ParsedDocument = namedtuple('ParsedDocument', ['headers', 'anchored_content'])
+
+def strip_links(text):
+    """Replace markdown links with their link text."""
+    if '](' not in text:
+        return text
+    return LINK_PATTERN.sub(r'\1', text)
 
 def create_header_id(text):
     """Create a header ID from header text for anchor links."""
     # Remove any markdown links and keep only the text
-    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
+    text = strip_links(text)
     # Convert to lowercase and replace spaces with hyphens
     header_id = text.lower().strip()
     # Remove any special characters that aren't suitable for IDs
-    header_id = re.sub(r'[^\w\s-]', '', header_id)
-    header_id = re.sub(r'[\s]+', '-', header_id)
+    header_id = NON_ID_CHARS.sub('', header_id)
+    header_id = WHITESPACE_RUNS.sub('-', header_id)
     return header_id
 
+class DocumentBuilder:
+    """Incremental parse_document: the markdown can be fed piece by piece while it is still being
+    produced (e.g. summaries as collect_to_md writes them), so the header model and the anchored
+    content are ready as soon as the last piece arrives."""
+    
+    def __init__(self, separator="\n\n"):
+        self.separator = separator
+        self.headers = []
+        self._anchored = []
+        self._chunks = []
+        self._partial = ''
+        self._toc_start = None      # (line count, header count) when the original TOC heading was seen
+        self._toc_done = False
+    
+    def feed(self, text):
+        """Feed raw markdown; complete lines are processed right away."""
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+    
+    def add(self, md_text):
+        """Append one document section; sections are joined with the separator, like collect_to_md does."""
+        if self._chunks:
+            self.feed(self.separator)
+        self._chunks.append(md_text)
+        self.feed(md_text)
+    
+    @property
+    def content(self):
+        """The markdown added so far with add()."""
+        return self.separator.join(self._chunks)
+    
+    def _line(self, line):
+        anchored = self._anchored
+        headers = self.headers
+        # Like remove_original_toc, the TOC heading may be indented, so it is looked for before the
+        # heading check below
+        if self._toc_start is None and not self._toc_done and TOC_HEADING in line and line.strip() == TOC_HEADING:
+            self._toc_start = (len(anchored), len(headers))
+        elif self._toc_start is not None and line.startswith('# '):
+            # First top-level heading after the TOC: everything since the TOC heading is dropped
+            del anchored[self._toc_start[0]:]
+            del headers[self._toc_start[1]:]
+            self._toc_start = None
+            self._toc_done = True
+        
+        if not line.startswith('#'):
+            anchored.append(line)
+            return
+        
+        text = line.lstrip('#').strip()
+        level = len(line) - len(line.lstrip('#'))
+        clean_text = strip_links(text) if '[' in text else text
+        header_id = create_header_id(clean_text)
+        headers.append(Header(level, clean_text, header_id, len(anchored)))
+        anchored.append(f"{'#' * level} <span id='{header_id}'></span>{text}")
+    
+    def document(self):
+        """Finish the last line and return the ParsedDocument; nothing may be fed afterwards."""
+        self._line(self._partial)
+        self._partial = ''
+        return ParsedDocument(self.headers, '\n'.join(self._anchored))
+
+def parse_document(markdown_content):
+    """Walk the markdown once: drop the original table of contents, collect the headers and
+    insert an anchor span right after the # symbols of every heading.
+    
+    The anchored content is what both the HTML and the saved _with_toc.md are built from."""
+    builder = DocumentBuilder()
+    builder.feed(markdown_content)
+    return builder.document()
+
 def extract_headers(markdown_content):
     """Extract headers from markdown content and return them as a list of tuples (level, text, id, original_line)."""
-    headers = []
-    for line in markdown_content.split('\n'):
-        if line.startswith('#'):
-            level = len(re.match('^#+', line).group())
-            # Extract the header text without the # symbols
-            text = line.lstrip('#').strip()
-            
-            # Store the original line for later use
-            original_line = line
-            
-            # If the text contains a markdown link, extract just the link text for ID creation
-            clean_text = text
-            if '[' in text and '](' in text:
-                clean_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-            
-            # Create an ID for the header
-            header_id = create_header_id(clean_text)
-            headers.append((level, clean_text, header_id, original_line))
-    return headers
+    lines = remove_original_toc(markdown_content).split('\n')
+    return [(level, text, header_id, lines[i])
+            for level, text, header_id, i in parse_document(markdown_content).headers]
 
 def load_highlight_headers(highlight_file):
     """Load headers to highlight from a text file."""
@@ -59,7 +149,7 @@ def remove_original_toc(markdown_content):
     # Find where the TOC starts (usually with a # 目录 heading)
     toc_start = -1
     for i, line in enumerate(lines):
-        if line.strip() == '# 目录':
+        if line.strip() == TOC_HEADING:
             toc_start = i
             break
     
@@ -82,37 +172,60 @@ def remove_original_toc(markdown_content):
     new_lines = lines[:toc_start] + lines[toc_end:]
     return '\n'.join(new_lines)
 
+def normalize_for_highlight(text):
+    """Lowercase and remove punctuation; highlight terms and header texts are compared in this form."""
+    return PUNCTUATION.sub('', text.lower()).strip()
+
+def _trie_pattern(trie):
+    """Regex for a trie of terms; a branch stops at the first complete term since only presence matters."""
+    if None in trie:
+        return ''
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(trie.items())]
+    return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+class HighlightMatcher:
+    """All highlight terms compiled into one regex, so each header is checked in a single search.
+    
+    A header is highlighted when any normalized term is a substring of its normalized text."""
+    
+    def __init__(self, highlight_headers):
+        terms = {normalize_for_highlight(h) for h in highlight_headers}
+        # An empty term (e.g. a line of punctuation) is a substring of every header
+        self.match_all = '' in terms
+        self.pattern = None
+        if terms and not self.match_all:
+            trie = {}
+            for term in terms:
+                node = trie
+                for char in term:
+                    node = node.setdefault(char, {})
+                node[None] = True
+            self.pattern = re.compile(_trie_pattern(trie))
+    
+    def matches(self, text):
+        if self.match_all:
+            return True
+        return self.pattern is not None and self.pattern.search(normalize_for_highlight(text)) is not None
+    
+    def flags(self, headers):
+        """Whether each header is highlighted, in header order."""
+        return [self.matches(text) for _, text, _, _ in headers]
+
 def generate_toc(headers):
     """Generate HTML table of contents with proper indentation and clickable links."""
-    toc_html = ["<h1>目录</h1>", "<ul class='toc'>"]
-    for level, text, header_id, _ in headers:
-        indent = "  " * (level - 1)
-        # Create an HTML link to the header
-        toc_html.append(f"{indent}<li><a href='#{header_id}'>{text}</a></li>")
-    toc_html.append("</ul>")
-    return "\n".join(toc_html)
+    return generate_toc_with_highlights(headers, [])
 
-def generate_toc_with_highlights(headers, highlight_headers):
+def generate_toc_with_highlights(headers, highlight_headers, highlighted=None):
     """Generate HTML table of contents with proper indentation and clickable links.
-    Headers in the highlight_headers list will be highlighted."""
+    Headers in the highlight_headers list will be highlighted; highlighted may pass
+    precomputed HighlightMatcher flags instead."""
+    if highlighted is None:
+        highlighted = HighlightMatcher(highlight_headers).flags(headers)
     toc_html = ["<h1>目录</h1>", "<ul class='toc'>"]
     
-    for level, text, header_id, _ in headers:
+    for (level, text, header_id, _), highlight in zip(headers, highlighted):
         indent = "  " * (level - 1)
-        
-        # Check if this header should be highlighted - more flexible matching
-        should_highlight = False
-        for h in highlight_headers:
-            # Remove punctuation and whitespace for comparison
-            clean_h = re.sub(r'[^\w\s]', '', h.lower()).strip()
-            clean_text = re.sub(r'[^\w\s]', '', text.lower()).strip()
-            
-            # Check if the cleaned highlight text is a substantial part of the cleaned header text
-            if clean_h in clean_text:
-                should_highlight = True
-                break
-        
-        if should_highlight:
+        if highlight:
             # Create a highlighted HTML link to the header
             toc_html.append(f"{indent}<li><a href='#{header_id}' class='highlight'>{text}</a></li>")
         else:
@@ -122,193 +235,41 @@ def generate_toc_with_highlights(headers, highlight_headers):
     toc_html.append("</ul>")
     return "\n".join(toc_html)
 
-def process_content_for_html(markdown_content, headers):
-    """Process markdown content to add HTML anchors for linking without changing the header format."""
-    lines = markdown_content.split('\n')
-    modified_lines = []
-    
-    header_indices = {}
-    for i, line in enumerate(lines):
-        if line.startswith('#'):
-            header_indices[i] = True
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if i in header_indices:
-            # Find the corresponding header in our headers list
-            level = len(re.match('^#+', line).group())
-            text = line.lstrip('#').strip()
-            clean_text = text
-            if '[' in text and '](' in text:
-                clean_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-            
-            header_id = create_header_id(clean_text)
-            
-            # Add the original header line with an anchor span right after the # symbols
-            hashes = '#' * level
-            # Insert an anchor span right after the heading marker but before the text
-            modified_line = f"{hashes} <span id='{header_id}'></span>{text}"
-            modified_lines.append(modified_line)
-        else:
-            modified_lines.append(line)
-        i += 1
-    
-    return '\n'.join(modified_lines)
-
-def generate_md_with_toc(content, headers, output_md_file):
-    """Generate a markdown file with table of contents."""
-    # Generate a markdown version with ToC for saving
+def generate_toc_md(headers, highlighted=None):
+    """Generate the markdown table of contents; headers flagged in highlighted are shown in bold."""
+    if highlighted is None:
+        highlighted = [False] * len(headers)
     toc_md = ["# 目录\n"]
-    for level, text, header_id, _ in headers:
+    for (level, text, header_id, _), highlight in zip(headers, highlighted):
         indent = "  " * (level - 1)
-        toc_md.append(f"{indent}- [{text}](#{header_id})")
-    
-    # Add HTML anchors to the markdown content for the saved file
-    lines = content.split('\n')
-    md_with_anchors = []
-    
-    for line in lines:
-        if line.startswith('#'):
-            level = len(re.match('^#+', line).group())
-            text = line.lstrip('#').strip()
-            clean_text = text
-            if '[' in text and '](' in text:
-                clean_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-            
-            header_id = create_header_id(clean_text)
-            # Add a span with ID right after the heading marker
-            hashes = '#' * level
-            md_with_anchors.append(f"{hashes} <span id='{header_id}'></span>{text}")
+        if highlight:
+            toc_md.append(f"{indent}- **[{text}](#{header_id})**")
         else:
-            md_with_anchors.append(line)
-    
+            toc_md.append(f"{indent}- [{text}](#{header_id})")
+    return "\n".join(toc_md)
+
+def write_md_with_toc(document, output_md_file, highlighted=None):
+    """Save a parsed document as markdown with its table of contents in front."""
     with open(output_md_file, 'w', encoding='utf-8') as f:
-        f.write("\n".join(toc_md) + "\n\n" + "\n".join(md_with_anchors))
-    
+        f.write(generate_toc_md(document.headers, highlighted) + "\n\n" + document.anchored_content)
     return output_md_file
 
+def process_content_for_html(markdown_content, headers=None):
+    """Process markdown content to add HTML anchors for linking without changing the header format."""
+    return parse_document(markdown_content).anchored_content
+
+def generate_md_with_toc(content, headers, output_md_file):
+    """Generate a markdown file with table of contents."""
+    return write_md_with_toc(parse_document(content), output_md_file)
+
 def generate_md_with_highlighted_toc(content, headers, highlight_headers, output_md_file):
     """Generate a markdown file with table of contents where specified headers are highlighted."""
-    # Generate a markdown version with ToC for saving
-    toc_md = ["# 目录\n"]
-    for level, text, header_id, _ in headers:
-        indent = "  " * (level - 1)
-        
-        # Check if this header should be highlighted - more flexible matching
-        should_highlight = False
-        for h in highlight_headers:
-            # Remove punctuation and whitespace for comparison
-            clean_h = re.sub(r'[^\w\s]', '', h.lower()).strip()
-            clean_text = re.sub(r'[^\w\s]', '', text.lower()).strip()
-            
-            # Check if the cleaned highlight text is a substantial part of the cleaned header text
-            if clean_h in clean_text:
-                should_highlight = True
-                break
-        
-        if should_highlight:
-            # Create a highlighted markdown link to the header
-            toc_md.append(f"{indent}- **[{text}](#{header_id})**")
-        else:
-            # Create a normal markdown link to the header
-            toc_md.append(f"{indent}- [{text}](#{header_id})")
-    
-    # Add HTML anchors to the markdown content for the saved file
-    lines = content.split('\n')
-    md_with_anchors = []
-    
-    for line in lines:
-        if line.startswith('#'):
-            level = len(re.match('^#+', line).group())
-            text = line.lstrip('#').strip()
-            clean_text = text
-            if '[' in text and '](' in text:
-                clean_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-            
-            header_id = create_header_id(clean_text)
-            # Add a span with ID right after the heading marker
-            hashes = '#' * level
-            md_with_anchors.append(f"{hashes} <span id='{header_id}'></span>{text}")
-        else:
-            md_with_anchors.append(line)
-    
-    with open(output_md_file, 'w', encoding='utf-8') as f:
-        f.write("\n".join(toc_md) + "\n\n" + "\n".join(md_with_anchors))
-    
-    return output_md_file
+    document = parse_document(content)
+    highlighted = HighlightMatcher(highlight_headers).flags(document.headers)
+    return write_md_with_toc(document, output_md_file, highlighted)
 
-def convert_md_to_pdf(input_file, output_file=None, highlight_file=None):
-    """Convert markdown file to PDF with table of contents and also output a markdown file with TOC.
-    If highlight_file is provided, highlight the specified headers in the TOC.
-    
-    If output_file is not specified, use default path and filename: ./output/AI_news_summary_yyyymmdd_hhmmss.pdf
-    """
-    # If output_file is not specified, use default path and filename
-    if output_file is None:
-        # Ensure output directory exists
-        output_dir = os.path.join(".", "output")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(output_dir, f"AI_news_summary_{timestamp}.pdf")
-    else:
-        # Ensure output_file has .pdf extension
-        if not output_file.lower().endswith('.pdf'):
-            output_file = f"{output_file}.pdf"
-    
-    # Read markdown content
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Remove original TOC if exists
-    content = remove_original_toc(content)
-    
-    # Generate title with current date
-    current_date = datetime.now().strftime("%Y/%m/%d")
-    
-    # Extract headers
-    headers = extract_headers(content)
-    
-    # Generate TOC (with or without highlights)
-    if highlight_file and os.path.exists(highlight_file):
-        highlight_headers = load_highlight_headers(highlight_file)
-        toc_html = generate_toc_with_highlights(headers, highlight_headers)
-    else:
-        highlight_headers = []
-        toc_html = generate_toc(headers)
-    
-    # Process markdown content to add HTML anchors without changing header format
-    processed_content = process_content_for_html(content, headers)
-    
-    # Convert markdown to HTML
-    content_html = markdown2.markdown(
-        processed_content,
-        extras=[
-            'fenced-code-blocks',
-            'tables',
-            'header-ids'
-        ]
-    )
-    
-    # Save the markdown with ToC (for reference)
-    md_with_toc_file = os.path.splitext(output_file)[0] + "_with_toc.md"
-    
-    # Ensure output directory exists for md_with_toc_file
-    md_output_dir = os.path.dirname(md_with_toc_file)
-    if md_output_dir and not os.path.exists(md_output_dir):
-        os.makedirs(md_output_dir)
-    
-    # Generate markdown file with TOC
-    if highlight_file and os.path.exists(highlight_file):
-        generate_md_with_highlighted_toc(content, headers, highlight_headers, md_with_toc_file)
-    else:
-        generate_md_with_toc(content, headers, md_with_toc_file)
-    
-    # Add some basic CSS for better formatting
-    css = """
+# Basic CSS for better formatting
+PDF_CSS = """
     body {
         font-family: Arial, sans-serif;
         line-height: 1.6;
@@ -353,9 +314,36 @@ def convert_md_to_pdf(input_file, output_file=None, highlight_file=None):
         text-decoration: underline !important;
     }
     """
-    
-    # Create HTML with CSS
-    html_with_css = f"""
+
+# wkhtmltopdf options
+PDF_OPTIONS = {
+    'encoding': 'UTF-8',
+    'page-size': 'A4',
+    'margin-top': '20mm',
+    'margin-right': '20mm',
+    'margin-bottom': '20mm',
+    'margin-left': '20mm',
+    'enable-local-file-access': None,
+    'outline': None,
+    'outline-depth': 3,
+    'footer-right': '[page]/[topage]',
+    'footer-font-size': '9',
+    'footer-spacing': '5',
+    'enable-internal-links': True,  # Enable internal links in the PDF
+    'quiet': ''  # Reduce console output
+}
+
+# markdown2 extras used for the document body
+MARKDOWN_EXTRAS = [
+    'fenced-code-blocks',
+    'tables',
+    'header-ids'
+]
+
+def html_page(*fragments, css=PDF_CSS):
+    """Wrap HTML fragments into the standalone page that is rendered to PDF."""
+    body = "\n".join(fragments)
+    return f"""
     <!DOCTYPE html>
     <html>
         <head>
@@ -363,31 +351,170 @@ def convert_md_to_pdf(input_file, output_file=None, highlight_file=None):
             <style>{css}</style>
         </head>
         <body>
-            <div class="main-title">AI News Summary - {current_date}</div>
-            {toc_html}
-            {content_html}
-            <div id="footer"></div>
+            {body}
         </body>
     </html>
     """
+
+# Stages reported to progress_callback as "[k/N] ..." once each one is done
+CONVERSION_STAGES = 4
+
+def report(message, progress_callback=None):
+    """Print a progress message, or pass it to progress_callback when one is given."""
+    if progress_callback:
+        progress_callback(message)
+    else:
+        print(message)
+
+class ConversionCancelled(Exception):
+    """The conversion's cancel_event was set; raised between stages."""
+
+def check_cancelled(cancel_event):
+    """Raise ConversionCancelled if cancel_event (an optional threading.Event) is set."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConversionCancelled("Conversion cancelled")
+
+def convert_md_to_pdf(input_file, output_file=None, highlight_file=None, cache=None, pool=None,
+                      progress_callback=None, parts=None, run_metrics=None, cancel_event=None):
+    """Convert markdown file to PDF with table of contents and also output a markdown file with TOC.
+    See convert_markdown_to_pdf for the arguments."""
+    # Read markdown content
+    with open(input_file, 'r', encoding='utf-8') as f:
+        content = f.read()
     
-    # Configure PDF options
-    options = {
-        'encoding': 'UTF-8',
-        'page-size': 'A4',
-        'margin-top': '20mm',
-        'margin-right': '20mm',
-        'margin-bottom': '20mm',
-        'margin-left': '20mm',
-        'enable-local-file-access': None,
-        'outline': None,
-        'outline-depth': 3,
-        'footer-right': '[page]/[topage]',
-        'footer-font-size': '9',
-        'footer-spacing': '5',
-        'enable-internal-links': True,  # Enable internal links in the PDF
-        'quiet': ''  # Reduce console output
-    }
+    return convert_markdown_to_pdf(content, output_file, highlight_file, cache=cache, pool=pool,
+                                   progress_callback=progress_callback, parts=parts, run_metrics=run_metrics,
+                                   cancel_event=cancel_event)
+
+def convert_markdown_to_pdf(content, output_file=None, highlight_file=None, cache=None, pool=None,
+                            progress_callback=None, document=None, parts=None, run_metrics=None, cancel_event=None):
+    """Convert markdown text to PDF with table of contents and also output a markdown file with TOC.
+    If highlight_file is provided, highlight the specified headers in the TOC.
+    If cache (a render_cache.RenderCache) is given, identical conversions are copied from it and
+    the markdown2 body is reused when only the highlights change.
+    If pool (a render_pool.RenderPool) is given, the PDF is rendered by one of its workers;
+    otherwise wkhtmltopdf is run directly through pdfkit.
+    If progress_callback is given, it receives a message as each stage (parse, TOC, HTML, render) finishes.
+    If document (the ParsedDocument of content, e.g. from a DocumentBuilder fed while the markdown
+    was being produced) is given, the parse stage is skipped.
+    If parts (a pdf_parts.PartRenderer) is given and the document has more top-level sections than
+    it allows per part, the document is rendered in parts in parallel and merged into output_file;
+    in its volumes mode the list of volume files is returned in place of output_file.
+    The duration of every stage is recorded in run_metrics (a metrics.RunMetrics, e.g. shared with
+    the collection run in pipeline.py) and always in the process-wide metrics.REGISTRY.
+    If cancel_event (a threading.Event) is set, ConversionCancelled is raised after the stage that
+    is running, and between the parts of a multi-part render.
+    
+    If output_file is not specified, use default path and filename: ./output/AI_news_summary_yyyymmdd_hhmmss.pdf
+    """
+    # If output_file is not specified, use default path and filename
+    if output_file is None:
+        # Ensure output directory exists
+        output_dir = os.path.join(".", "output")
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        # Generate filename with timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(output_dir, f"AI_news_summary_{timestamp}.pdf")
+    else:
+        # Ensure output_file has .pdf extension
+        if not output_file.lower().endswith('.pdf'):
+            output_file = f"{output_file}.pdf"
+    
+    # Generate title with current date
+    current_date = datetime.now().strftime("%Y/%m/%d")
+    title = f"AI News Summary - {current_date}"
+    
+    # Load the headers to highlight, if any
+    if highlight_file and os.path.exists(highlight_file):
+        highlight_headers = load_highlight_headers(highlight_file)
+    else:
+        highlight_headers = []
+    
+    # Save the markdown with ToC (for reference)
+    md_with_toc_file = os.path.splitext(output_file)[0] + "_with_toc.md"
+    
+    if run_metrics is None:
+        run_metrics = metrics.RunMetrics()
+    stage_started = time.monotonic()
+    
+    def stage_done(stage):
+        nonlocal stage_started
+        now = time.monotonic()
+        run_metrics.observe_stage(f"pdf_{stage}", now - stage_started)
+        stage_started = now
+        check_cancelled(cancel_event)
+    
+    check_cancelled(cancel_event)
+    
+    # Volumes are several files, which the cache does not hold
+    if parts is not None and parts.volumes:
+        cache = None
+    
+    # An identical conversion was rendered before: reuse its PDF and markdown
+    if cache is not None:
+        key_options = PDF_OPTIONS if parts is None else dict(PDF_OPTIONS, part_sections=parts.sections_per_part)
+        render_key = cache.render_key(content, highlight_headers, PDF_CSS, key_options, title)
+        if cache.get_render(render_key, output_file, md_with_toc_file):
+            report(f"[{CONVERSION_STAGES}/{CONVERSION_STAGES}] Identical document was converted before, using the cached PDF",
+                   progress_callback)
+            stage_done("cache_hit")
+            return output_file, md_with_toc_file
+    
+    # Single pass over the document: drop the original TOC, collect headers, add anchors
+    if document is None:
+        document = parse_document(content)
+    report(f"[1/{CONVERSION_STAGES}] Parsed Markdown: {len(document.headers)} headers", progress_callback)
+    stage_done("parse")
+    
+    # Match every header once; the HTML and the markdown TOC share the result
+    highlighted = HighlightMatcher(highlight_headers).flags(document.headers)
+    toc_html = generate_toc_with_highlights(document.headers, highlight_headers, highlighted)
+    report(f"[2/{CONVERSION_STAGES}] Built table of contents ({sum(highlighted)} highlighted)", progress_callback)
+    stage_done("toc")
+    
+    if parts is not None and parts.applies(document):
+        for path in (md_with_toc_file, output_file):
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_md_with_toc(document, md_with_toc_file, highlighted)
+        pdf_files = parts.render(document, highlighted, title, output_file, PDF_OPTIONS, progress_callback,
+                                 cancel_event=cancel_event)
+        stage_done("render_parts")
+        if cache is not None:
+            cache.put_render(render_key, output_file, md_with_toc_file)
+        return pdf_files, md_with_toc_file
+    
+    # Convert markdown (with HTML anchors, header format unchanged) to HTML; the body does not
+    # depend on the highlights, so a cached one is reused when only they changed
+    content_html = None
+    if cache is not None:
+        body_key = cache.body_key(content, MARKDOWN_EXTRAS)
+        content_html = cache.get_body(body_key)
+    if content_html is None:
+        report("Converting Markdown to HTML...", progress_callback)
+        import markdown2
+        content_html = markdown2.markdown(document.anchored_content, extras=MARKDOWN_EXTRAS)
+        if cache is not None:
+            cache.put_body(body_key, content_html)
+        report(f"[3/{CONVERSION_STAGES}] Converted Markdown to HTML", progress_callback)
+    else:
+        report(f"[3/{CONVERSION_STAGES}] Reused the cached HTML body", progress_callback)
+    stage_done("html")
+    
+    # Ensure output directory exists for md_with_toc_file
+    md_output_dir = os.path.dirname(md_with_toc_file)
+    if md_output_dir and not os.path.exists(md_output_dir):
+        os.makedirs(md_output_dir)
+    
+    # Generate markdown file with TOC
+    write_md_with_toc(document, md_with_toc_file, highlighted)
+    
+    # Create HTML with CSS
+    html_with_css = html_page(f'<div class="main-title">{title}</div>', toc_html, content_html,
+                              '<div id="footer"></div>')
+
     
     # Ensure output directory exists for PDF file
     pdf_output_dir = os.path.dirname(output_file)
@@ -395,7 +522,19 @@ def convert_md_to_pdf(input_file, output_file=None, highlight_file=None):
         os.makedirs(pdf_output_dir)
     
     # Convert to PDF
-    pdfkit.from_string(html_with_css, output_file, options=options, configuration=config)
+    report("Rendering PDF...", progress_callback)
+    if pool is not None:
+        pool.render(html_with_css, output_file, PDF_OPTIONS)
+    else:
+        import pdfkit
+        pdfkit.from_string(html_with_css, output_file, options=PDF_OPTIONS,
+                           configuration=wkhtmltopdf_configuration())
+    
+    report(f"[{CONVERSION_STAGES}/{CONVERSION_STAGES}] Rendered PDF", progress_callback)
+    stage_done("render")
+    
+    if cache is not None:
+        cache.put_render(render_key, output_file, md_with_toc_file)
     
     return output_file, md_with_toc_file
 
@@ -447,7 +586,16 @@ def main():
         sys.exit(1)
     
     try:
-        pdf_file, md_file = convert_md_to_pdf(input_file, output_file, highlight_file)
+        # The render cache is configured in the [RenderCache] section of config.txt (enabled by default),
+        # multi-part rendering of large digests in [Render] (off by default)
+        import pdf_parts  # imports this module, so not at the top of a script run directly
+        config = configparser.ConfigParser()
+        config.read("config.txt")
+        pdf_file, md_file = convert_md_to_pdf(input_file, output_file, highlight_file,
+                                              cache=render_cache.from_config(config),
+                                              parts=pdf_parts.from_config(config))
+        if isinstance(pdf_file, list):
+            pdf_file = ", ".join(pdf_file)
         if highlight_file:
             print(f"Successfully converted {input_file} to {pdf_file} with highlighted headers")
         else:
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量写出 Markdown：每个摘要完成后按原始顺序立即追加到输出文件并刷新，
+进程中途退出时已完成的部分仍然保存在文件中，且文件在任何时刻都是可用的 Markdown。
+"""
+
+import os
+import tempfile
+
+DEFAULT_MAX_BUFFERED = 256
+
+
+class OrderedMarkdownWriter:
+    """
+    带重排缓冲区的顺序写出器。
+
+    结果可以按任意顺序通过 add(idx, md_text) 提交（idx 为 0..total-1，每个位置恰好提交一次，
+    失败或跳过的位置提交 None）。只有当 idx 之前的所有位置都已提交时才写出，
+    因此输出文件中的顺序与输入一致。
+
+    乱序到达、暂时不能写出的结果先放在内存中；超过 max_buffered 条后溢出到临时文件，
+    因此无论运行多长，内存占用都是有界的。
+
+    on_write 可选：每写出一段非空 Markdown 就按文件中的顺序调用一次 on_write(md_text)，
+    例如让 md_to_pdf.DocumentBuilder 在摘要陆续到达时就开始解析标题。
+    """
+
+    def __init__(self, path, total, separator="\n\n", max_buffered=DEFAULT_MAX_BUFFERED, on_write=None):
+        output_dir = os.path.dirname(path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.path = path
+        self.total = total
+        self.separator = separator
+        self.max_buffered = max_buffered
+        self.on_write = on_write
+        self.written = 0
+        self.next_idx = 0
+        self._pending = {}   # idx -> md_text 或 None（在内存中）
+        self._spilled = {}   # idx -> (offset, length)（在溢出文件中）
+        self._spill = None
+        self._file = open(path, "w", encoding="utf-8")
+
+    def add(self, idx, md_text):
+        """提交位置 idx 的结果，并写出所有已经就绪的连续结果。"""
+        if idx == self.next_idx:
+            self._write(md_text)
+            self.next_idx += 1
+            self._drain()
+            self._file.flush()
+        elif len(self._pending) < self.max_buffered or md_text is None:
+            self._pending[idx] = md_text
+        else:
+            self._spill_out(idx, md_text)
+
+    def _drain(self):
+        while True:
+            if self.next_idx in self._pending:
+                md_text = self._pending.pop(self.next_idx)
+            elif self.next_idx in self._spilled:
+                md_text = self._spill_in(self.next_idx)
+            else:
+                return
+            self._write(md_text)
+            self.next_idx += 1
+
+    def _write(self, md_text):
+        if not md_text:
+            return
+        if self.written:
+            self._file.write(self.separator)
+        self._file.write(md_text)
+        self.written += 1
+        if self.on_write is not None:
+            self.on_write(md_text)
+
+    def _spill_out(self, idx, md_text):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        data = md_text.encode("utf-8")
+        self._spill.seek(0, os.SEEK_END)
+        self._spilled[idx] = (self._spill.tell(), len(data))
+        self._spill.write(data)
+
+    def _spill_in(self, idx):
+        offset, length = self._spilled.pop(idx)
+        self._spill.seek(offset)
+        return self._spill.read(length).decode("utf-8")
+
+    @property
+    def complete(self):
+        return self.next_idx >= self.total
+
+    def close(self):
+        """关闭输出文件。尚未写出的结果（其前面有位置未提交）会被丢弃。"""
+        self._file.close()
+        if self._spill is not None:
+            self._spill.close()
+        self._pending.clear()
+        self._spilled.clear()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+采集与 PDF 转换的运行指标：
+
+- RunMetrics：一次运行（一个采集任务或一次 PDF 转换）的明细，包括每次 LLM 调用的耗时、
+  completion.usage 中的 token 数、按错误类型统计的失败次数、请求排队等待时间和各阶段耗时；
+  运行结束后由 write_report 写成 JSON 报告（collect_to_md 写在输出 .md 旁边：*.metrics.json）。
+- Registry：进程级的累计指标，每个 RunMetrics 的观测值同时计入全局的 REGISTRY，
+  由 render 输出 Prometheus 文本格式，供 app.py 的 /metrics 接口使用。
+
+只依赖标准库，不需要 prometheus_client。
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+REPORT_SUFFIX = ".metrics.json"
+
+# 直方图的桶上限（秒）
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 300)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900)
+
+METRIC_HELP = {
+    "ai_news_llm_request_duration_seconds": ("histogram", "LLM 请求耗时（每次尝试，含重试）"),
+    "ai_news_llm_first_token_seconds": ("histogram", "流式请求从发出到收到第一个 token 的时间"),
+    "ai_news_llm_hedged_requests_total": ("counter", "超过耗时阈值后发出的对冲请求（hedging.py）"),
+    "ai_news_llm_hedge_wins_total": ("counter", "对冲请求先于原请求完成的次数"),
+    "ai_news_llm_queue_wait_seconds": ("histogram", "URL 轮到处理到请求实际发出之间的等待（限流、并发名额）"),
+    "ai_news_llm_tokens_total": ("counter", "completion.usage 中的 token 数"),
+    "ai_news_llm_errors_total": ("counter", "失败的 LLM 请求，按错误类型"),
+    "ai_news_llm_endpoint_requests_total": ("counter", "各端点（endpoints.py）的 LLM 请求，按结果"),
+    "ai_news_llm_endpoint_circuit_open_total": ("counter", "端点被熔断的次数"),
+    "ai_news_urls_total": ("counter", "处理完成的 URL，按结果"),
+    "ai_news_summary_cache_hits_total": ("counter", "直接使用摘要缓存、未调用 LLM 的 URL"),
+    "ai_news_prefetch_requests_total": ("counter", "本地预取的网页（prefetch.py），按结果"),
+    "ai_news_stage_duration_seconds": ("histogram", "各处理阶段的耗时"),
+    "ai_news_job_queue_wait_seconds": ("histogram", "Web 任务从提交到开始运行的等待"),
+}
+
+
+def percentile(values, q):
+    """已排序列表的 q 分位数（0-100，线性插值）；空列表返回 None。"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    low, high = math.floor(position), math.ceil(position)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def distribution(values):
+    """耗时列表的汇总：次数、平均值、p50/p95/p99 和最大值（秒）。"""
+    ordered = sorted(values)
+    summary = {"count": len(ordered)}
+    if ordered:
+        summary.update({
+            "mean": round(sum(ordered) / len(ordered), 4),
+            "p50": round(percentile(ordered, 50), 4),
+            "p95": round(percentile(ordered, 95), 4),
+            "p99": round(percentile(ordered, 99), 4),
+            "max": round(ordered[-1], 4),
+        })
+    return summary
+
+
+def error_class(exc):
+    """错误分类：异常类名，如 RateLimitError、APITimeoutError、APIConnectionError。"""
+    return exc.__class__.__name__
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Registry:
+    """进程内累计的计数器与直方图，按 Prometheus 文本格式输出。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}      # (name, labels) -> value
+        self._histograms = {}    # (name, labels) -> [buckets, counts, sum, count]
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[1][index] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def render(self, extra=()):
+        """Prometheus 文本格式；extra 为额外的 (名称, 类型, 说明, [(标签dict, 值)]) 指标（如任务队列长度）。"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (buckets, list(counts), total, count))
+                                for key, (buckets, counts, total, count) in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind=None, help_text=None):
+            if name in described:
+                return
+            described.add(name)
+            if kind is None:
+                kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        for name, kind, help_text, samples in extra:
+            describe(name, kind, help_text)
+            for labels, value in samples:
+                lines.append(f"{name}{_label_text(sorted(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class RunMetrics:
+    """一次运行的指标明细；所有观测值同时计入 registry（默认为全局 REGISTRY）。线程安全。"""
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.started_at = datetime.now()
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.first_tokens = []
+        self.queue_waits = []
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.errors = {}
+        self.urls = {}
+        self.cache_hits = 0
+        self.stages = {}
+        self.info = {}           # 写入报告的运行信息，如输入输出文件、model_id
+
+    def observe_request(self, seconds, usage=None):
+        """记录一次成功的 LLM 调用：耗时和 completion.usage（可为 None）。"""
+        prompt = getattr(usage, "prompt_tokens", None) or 0
+        completion = getattr(usage, "completion_tokens", None) or 0
+        with self._lock:
+            self.latencies.append(seconds)
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+        self.registry.observe("ai_news_llm_request_duration_seconds", seconds, LLM_LATENCY_BUCKETS)
+        self.registry.inc("ai_news_llm_tokens_total", prompt, type="prompt")
+        self.registry.inc("ai_news_llm_tokens_total", completion, type="completion")
+
+    def recent_latencies(self, count):
+        """最近 count 次成功调用的耗时（副本）。"""
+        with self._lock:
+            return self.latencies[-count:]
+
+    def observe_error(self, exc):
+        """记录一次失败的 LLM 调用（包括之后被重试的）。"""
+        name = error_class(exc)
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        self.registry.inc("ai_news_llm_errors_total", error=name)
+
+    def observe_first_token(self, seconds):
+        """记录流式请求收到第一个 token 的等待时间（见 streaming.py）。"""
+        with self._lock:
+            self.first_tokens.append(seconds)
+        self.registry.observe("ai_news_llm_first_token_seconds", seconds, LLM_LATENCY_BUCKETS)
+
+    def observe_queue_wait(self, seconds):
+        with self._lock:
+            self.queue_waits.append(seconds)
+        self.registry.observe("ai_news_llm_queue_wait_seconds", seconds, QUEUE_WAIT_BUCKETS)
+
+    def observe_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+        self.registry.inc("ai_news_summary_cache_hits_total")
+
+    def observe_url(self, result):
+        """记录一个 URL 的最终结果：succeeded 或 failed。"""
+        with self._lock:
+            self.urls[result] = self.urls.get(result, 0) + 1
+        self.registry.inc("ai_news_urls_total", result=result)
+
+    def observe_stage(self, stage, seconds):
+        """记录一个处理阶段的耗时（同名阶段累加），如 collect、pdf_parse、pdf_render。"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.registry.observe("ai_news_stage_duration_seconds", seconds, STAGE_BUCKETS, stage=stage)
+
+    def call(self, create, queued_at=None):
+        """
+        执行一次 LLM 调用 create() 并记录耗时、usage 或错误；
+        queued_at（time.monotonic() 时间）给出时，同时记录从该时刻到调用发出的排队等待。
+        """
+        started = time.monotonic()
+        if queued_at is not None:
+            self.observe_queue_wait(started - queued_at)
+        try:
+            completion = create()
+        except Exception as e:
+            self.observe_error(e)
+            raise
+        self.observe_request(time.monotonic() - started, getattr(completion, "usage", None))
+        return completion
+
+    async def call_async(self, create, queued_at=None):
+        """call 的协程版本，create() 返回可等待对象。"""
+        started = time.monotonic()
+        if queued_at is not None:
+            self.observe_queue_wait(started - queued_at)
+        try:
+            completion = await create()
+        except Exception as e:
+            self.observe_error(e)
+            raise
+        self.observe_request(time.monotonic() - started, getattr(completion, "usage", None))
+        return completion
+
+    def summary(self):
+        """汇总为可写入 JSON 的字典。"""
+        with self._lock:
+            latencies = list(self.latencies)
+            first_tokens = list(self.first_tokens)
+            queue_waits = list(self.queue_waits)
+            tokens = dict(self.tokens)
+            errors = dict(self.errors)
+            urls = dict(self.urls, cached=self.cache_hits)
+            stages = {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        # 每个URL的 token 数只按实际调用了 LLM 的成功URL计算
+        summarized = urls.get("succeeded", 0) - urls["cached"]
+        total_tokens = tokens["prompt"] + tokens["completion"]
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(time.monotonic() - self._started, 3),
+            "urls": urls,
+            "llm": {
+                "requests": len(latencies) + sum(errors.values()),
+                "latency_seconds": distribution(latencies),
+                "first_token_seconds": distribution(first_tokens),
+                "queue_wait_seconds": distribution(queue_waits),
+                "tokens": dict(tokens, total=total_tokens,
+                               per_url=round(total_tokens / summarized, 1) if summarized > 0 else None),
+                "errors": errors,
+                "error_rate": round(sum(errors.values()) / (len(latencies) + sum(errors.values())), 4)
+                if latencies or errors else 0.0,
+            },
+            "stages_seconds": stages,
+        }
+
+    def write_report(self, path):
+        """把 info 和 summary 写成 JSON 文件；同一次运行可以在后续阶段结束后重写。"""
+        report = dict(self.info, **self.summary())
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+
+def report_path(output_path):
+    """输出文件对应的运行报告路径，例如 output/x.md -> output/x.metrics.json。"""
+    return os.path.splitext(output_path)[0] + REPORT_SUFFIX
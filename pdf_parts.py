@@ -0,0 +1,367 @@
+"""
+Multi-part PDF rendering for very large digests.
+
+A single wkhtmltopdf run over a digest with thousands of sections is
+single-core, needs a lot of memory and loses everything when it fails. Here
+the parsed document is split at top-level headings into parts of
+sections_per_part sections, and the parts are converted (markdown2 + render)
+in parallel in a process pool. The pool belongs to the PartRenderer and is
+shared by every conversion that uses it, so concurrent conversions (e.g. the
+web app's PDF jobs) run at most `workers` part renders between them. Then
+either:
+
+- "merge" (default): the parts are joined into one PDF with a table of
+  contents that lists the global page number of every heading, a global
+  outline (bookmarks) and "page/total" page numbers. Needs pypdf
+  (pip install -r requirements-optional.txt), which reads the page counts and heading pages of the
+  rendered parts and does the merge.
+- "volumes": every part is written as a standalone PDF
+  (<name>_part01.pdf, ...) with its own title, table of contents and page
+  numbers.
+
+Only wkhtmltopdf is used for the parts, since heading pages are read back from
+the outline it writes.
+"""
+
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import md_to_pdf
+import render_pool
+
+DEFAULT_SECTIONS_PER_PART = 200
+DEFAULT_TIMEOUT = render_pool.DEFAULT_TIMEOUT
+MODES = ('merge', 'volumes')
+
+# Outline depth of the part renders; deep enough that every heading gets its page
+PART_OUTLINE_DEPTH = 6
+
+# A failed part is rendered again this many times before the conversion fails
+PART_RETRIES = 1
+
+# How often (seconds) a multi-part render checks whether its conversion was cancelled
+CANCEL_POLL_INTERVAL = 0.5
+
+# Page numbers stamped on the merged PDF, placed where the wkhtmltopdf footer would be
+PAGE_NUMBER_FONT = '/FPageNo'
+PAGE_NUMBER_SIZE = 9
+MM = 72 / 25.4
+
+TOC_PAGE_CSS = """
+    .toc-page { float: right; color: #7f8c8d; }
+    """
+
+NON_WORD = re.compile(r'\W+')
+
+# A slice of the document: its headers (in document order) and its anchored markdown
+Part = namedtuple('Part', ['headers', 'content'])
+
+
+def split_document(document, sections_per_part):
+    """Split a ParsedDocument before every sections_per_part-th top-level heading.
+
+    Text before the first top-level heading stays with the first part."""
+    headers = document.headers
+    lines = document.anchored_content.split('\n')
+    top_level = [i for i, header in enumerate(headers) if header.level == 1]
+    starts = top_level[sections_per_part::sections_per_part]
+    header_bounds = [0] + starts + [len(headers)]
+    line_bounds = [0] + [headers[i].line_index for i in starts] + [len(lines)]
+    return [Part(headers[header_bounds[k]:header_bounds[k + 1]],
+                 '\n'.join(lines[line_bounds[k]:line_bounds[k + 1]]))
+            for k in range(len(starts) + 1)]
+
+
+def _render_part(prefix_html, content, output_file, options, wkhtmltopdf, timeout):
+    """Process pool task: convert one part to HTML and render it with the wkhtmltopdf binary at that path."""
+    import markdown2
+    import pdfkit
+    body = markdown2.markdown(content, extras=md_to_pdf.MARKDOWN_EXTRAS)
+    html = md_to_pdf.html_page(prefix_html, body)
+    backend = render_pool.WkhtmltopdfBackend(pdfkit.configuration(wkhtmltopdf=wkhtmltopdf))
+    return backend.render(html, output_file, options, timeout)
+
+
+def _title_key(text):
+    """Compare heading texts without markdown emphasis, punctuation or spacing."""
+    return NON_WORD.sub('', text).lower()
+
+
+def _outline_entries(reader):
+    """(title key, page index) of every outline item of a PDF, in document order."""
+    entries = []
+
+    def walk(items):
+        for item in items:
+            if isinstance(item, list):
+                walk(item)
+            else:
+                entries.append((_title_key(item.title), reader.get_destination_page_number(item)))
+
+    walk(reader.outline)
+    return entries
+
+
+def header_pages(headers, outline):
+    """Page index of every header within its part, matched in order against the part's outline.
+
+    A header that is not in the outline (e.g. its text was rendered differently) gets the page of
+    the header before it."""
+    pages = []
+    page = 0
+    position = 0
+    for header in headers:
+        key = _title_key(header.text)
+        for k in range(position, len(outline)):
+            if outline[k][0] == key:
+                page = outline[k][1]
+                position = k + 1
+                break
+        pages.append(page)
+    return pages
+
+
+def toc_with_pages(headers, highlighted, pages):
+    """HTML table of contents listing the page number of every header (for the merged PDF)."""
+    toc_html = ["<h1>目录</h1>", "<ul class='toc'>"]
+    for (level, text, _, _), highlight, page in zip(headers, highlighted, pages):
+        indent = "  " * (level - 1)
+        css_class = " class='highlight'" if highlight else ""
+        toc_html.append(f"{indent}<li><a{css_class}>{text}</a><span class='toc-page'>{page}</span></li>")
+    toc_html.append("</ul>")
+    return "\n".join(toc_html)
+
+
+def _page_number_overlay(page, text, font):
+    """A blank page of page's size with text right-aligned at the bottom right, like the wkhtmltopdf footer."""
+    from pypdf import PageObject
+    from pypdf.generic import ContentStream, DictionaryObject, NameObject
+
+    box = page.mediabox
+    # Helvetica digits and "/" are about 0.556 and 0.278 em wide
+    width = sum(0.278 if char == '/' else 0.556 for char in text) * PAGE_NUMBER_SIZE
+    x = float(box.right) - 20 * MM - width
+    y = float(box.bottom) + 20 * MM - 5 * MM - PAGE_NUMBER_SIZE
+    overlay = PageObject.create_blank_page(width=box.width, height=box.height)
+    overlay[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/Font'): DictionaryObject({NameObject(PAGE_NUMBER_FONT): font}),
+    })
+    stream = ContentStream(None, None)
+    stream.set_data(f"BT {PAGE_NUMBER_FONT} {PAGE_NUMBER_SIZE} Tf {x:.2f} {y:.2f} Td ({text}) Tj ET".encode('latin-1'))
+    overlay.replace_contents(stream)
+    return overlay
+
+
+def stamp_page_numbers(writer):
+    """Add "page/total" to every page of a PdfWriter.
+
+    Each page is merged with an overlay page holding only the number; merge_page keeps the page's
+    own graphics state from moving the number and renames the font if the page already uses the name."""
+    from pypdf.generic import DictionaryObject, NameObject
+
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    total = len(writer.pages)
+    for number, page in enumerate(writer.pages, 1):
+        page.merge_page(_page_number_overlay(page, f"{number}/{total}", font))
+
+
+class PartRenderer:
+    """Renders documents with more than sections_per_part top-level sections in parts, in parallel."""
+
+    def __init__(self, sections_per_part=DEFAULT_SECTIONS_PER_PART, workers=None, volumes=False,
+                 timeout=DEFAULT_TIMEOUT, configuration=None):
+        self.sections_per_part = max(1, sections_per_part)
+        self.workers = workers or os.cpu_count() or 1
+        self.volumes = volumes
+        self.timeout = timeout
+        self.configuration = configuration
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        """The process pool shared by all conversions, started at the first one."""
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context('spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _discard(self, executor):
+        """Drop a pool whose processes died; the next conversion starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def close(self):
+        """Stop the render processes; the next conversion starts a new pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def applies(self, document):
+        """Whether the document is large enough to be split."""
+        return sum(1 for header in document.headers if header.level == 1) > self.sections_per_part
+
+    def render(self, document, highlighted, title, output_file, options, progress_callback=None,
+               cancel_event=None):
+        """Render the document in parts. Returns output_file when merging, or the list of volume files.
+
+        highlighted holds the HighlightMatcher flags of document.headers; options are the wkhtmltopdf
+        options of a single-file conversion. When cancel_event is set, parts not rendered yet are
+        dropped and md_to_pdf.ConversionCancelled is raised."""
+        configuration = self.configuration or md_to_pdf.wkhtmltopdf_configuration()
+        parts = split_document(document, self.sections_per_part)
+        remaining = iter(highlighted)
+        part_flags = [[next(remaining) for _ in part.headers] for part in parts]
+
+        if self.volumes:
+            base = os.path.splitext(output_file)[0]
+            targets = [f"{base}_part{k:0{max(2, len(str(len(parts))))}d}.pdf" for k in range(1, len(parts) + 1)]
+            prefixes = [f'<div class="main-title">{title} ({k}/{len(parts)})</div>' +
+                        md_to_pdf.generate_toc_with_highlights(part.headers, [], flags)
+                        for k, (part, flags) in enumerate(zip(parts, part_flags), 1)]
+            self._render_parts(parts, prefixes, targets, options, configuration, progress_callback, cancel_event)
+            md_to_pdf.report(f"[{md_to_pdf.CONVERSION_STAGES}/{md_to_pdf.CONVERSION_STAGES}] "
+                             f"Rendered {len(parts)} volumes: {targets[0]} ... {targets[-1]}", progress_callback)
+            return targets
+
+        try:
+            from pypdf import PdfReader, PdfWriter
+        except ImportError:
+            raise RuntimeError("Merging PDF parts needs pypdf (pip install -r requirements-optional.txt); "
+                               "set part_mode = volumes in [Render] to write separate files instead") from None
+
+        part_options = {key: value for key, value in options.items() if not key.startswith('footer-')}
+        part_options.update({'outline': None, 'outline-depth': PART_OUTLINE_DEPTH})
+        work_dir = tempfile.mkdtemp(prefix='pdf_parts_')
+        try:
+            targets = [os.path.join(work_dir, f"part{k:04d}.pdf") for k in range(len(parts))]
+            self._render_parts(parts, [''] * len(parts), targets, part_options, configuration, progress_callback,
+                               cancel_event)
+            md_to_pdf.check_cancelled(cancel_event)
+
+            # Page of every header within the merged body
+            readers = [PdfReader(target) for target in targets]
+            pages = []
+            offset = 0
+            for part, reader in zip(parts, readers):
+                pages.extend(offset + page for page in header_pages(part.headers, _outline_entries(reader)))
+                offset += len(reader.pages)
+
+            toc_reader = self._render_toc(document.headers, highlighted, pages, title, work_dir,
+                                          part_options, configuration)
+            toc_pages = len(toc_reader.pages)
+
+            writer = PdfWriter()
+            writer.append(toc_reader, import_outline=False)
+            for reader in readers:
+                writer.append(reader, import_outline=False)
+            writer.add_outline_item("目录", 0)
+            depth = int(options.get('outline-depth', 3))
+            parents = []
+            for header, page in zip(document.headers, pages):
+                if header.level > depth:
+                    continue
+                while parents and parents[-1][0] >= header.level:
+                    parents.pop()
+                item = writer.add_outline_item(header.text, toc_pages + page,
+                                               parent=parents[-1][1] if parents else None)
+                parents.append((header.level, item))
+            writer.page_mode = '/UseOutlines'
+            stamp_page_numbers(writer)
+            with open(output_file, 'wb') as f:
+                writer.write(f)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        md_to_pdf.report(f"[{md_to_pdf.CONVERSION_STAGES}/{md_to_pdf.CONVERSION_STAGES}] "
+                         f"Merged {len(parts)} parts into {toc_pages + offset} pages", progress_callback)
+        return output_file
+
+    def _render_toc(self, headers, highlighted, pages, title, work_dir, options, configuration):
+        """Render the table of contents part. Its page numbers count its own pages, so it is rendered
+        again until the number of TOC pages it assumed is the number it took."""
+        from pypdf import PdfReader
+
+        options = {key: value for key, value in options.items() if not key.startswith('outline')}
+        toc_pages = 1
+        for attempt in range(3):
+            toc_html = toc_with_pages(headers, highlighted, [toc_pages + page + 1 for page in pages])
+            html = md_to_pdf.html_page(f'<div class="main-title">{title}</div>', toc_html, css=md_to_pdf.PDF_CSS + TOC_PAGE_CSS)
+            output_file = os.path.join(work_dir, f"toc{attempt}.pdf")
+            render_pool.WkhtmltopdfBackend(configuration).render(html, output_file, options, self.timeout)
+            reader = PdfReader(output_file)
+            if len(reader.pages) == toc_pages:
+                break
+            toc_pages = len(reader.pages)
+        return reader
+
+    def _render_parts(self, parts, prefixes, targets, options, configuration, progress_callback, cancel_event=None):
+        md_to_pdf.report(f"Rendering {len(parts)} parts with {min(self.workers, len(parts))} processes...",
+                         progress_callback)
+        executor = self._pool()
+
+        # The configuration holds os.environ and cannot be pickled; the workers rebuild it
+        def submit(k):
+            return executor.submit(_render_part, prefixes[k], parts[k].content, targets[k],
+                                   options, configuration.wkhtmltopdf, self.timeout)
+
+        futures = {submit(k): (k, 0) for k in range(len(parts))}
+        done = 0
+        try:
+            while futures:
+                md_to_pdf.check_cancelled(cancel_event)
+                finished, _ = wait(futures, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    k, attempt = futures.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        if attempt >= PART_RETRIES:
+                            raise render_pool.RenderError(f"Part {k + 1}/{len(parts)} failed: {e}") from e
+                        md_to_pdf.report(f"Part {k + 1}/{len(parts)} failed ({e}), rendering it again",
+                                         progress_callback)
+                        futures[submit(k)] = (k, attempt + 1)
+                        continue
+                    done += 1
+                    md_to_pdf.report(f"Rendered part {k + 1} ({done}/{len(parts)} done)", progress_callback)
+        except BrokenProcessPool as e:
+            self._discard(executor)
+            raise render_pool.RenderError(f"A render process died: {e}") from e
+        finally:
+            # Parts of a failed or cancelled conversion that have not started yet do not hold up other conversions
+            for pending in futures:
+                pending.cancel()
+        md_to_pdf.report(f"[3/{md_to_pdf.CONVERSION_STAGES}] Rendered {len(parts)} parts", progress_callback)
+
+
+def from_config(config, wkhtmltopdf_configuration=None):
+    """Create the part renderer from the [Render] section of config.txt; None when part_sections is 0."""
+    sections = config.getint("Render", "part_sections", fallback=0)
+    if sections <= 0:
+        return None
+    mode = config.get("Render", "part_mode", fallback="merge")
+    if mode not in MODES:
+        raise ValueError(f"Unknown part_mode: {mode} (expected one of {', '.join(MODES)})")
+    return PartRenderer(
+        sections_per_part=sections,
+        workers=config.getint("Render", "part_workers", fallback=0),
+        volumes=mode == 'volumes',
+        timeout=config.getfloat("Render", "timeout_seconds", fallback=DEFAULT_TIMEOUT),
+        configuration=wkhtmltopdf_configuration,
+    )
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一步完成 URL -> Markdown -> PDF：在同一进程中先运行 collect_to_md.main，再把合并后的 Markdown
+直接交给 md_to_pdf 转换，不需要下载 .md 文件再重新上传。
+
+摘要按顺序写入输出文件的同时会送入 md_to_pdf.DocumentBuilder，标题模型和带锚点的正文
+在采集过程中就逐步建立好，采集结束后直接进入目录、HTML 和 PDF 渲染阶段，
+整个过程只有一个进度流，最终得到 .md 和 .pdf（以及 _with_toc.md）两份结果。
+"""
+
+import argparse
+import configparser
+import os
+
+import collect_to_md
+import md_to_pdf
+import metrics
+import pdf_parts
+import render_cache
+
+
+def run(input_txt, output_md=None, output_pdf=None, highlight_file=None, progress_callback=None,
+        use_cache=True, refresh=False, resume=None, cancel_event=None, llm_slots=None,
+        pdf_cache=None, pool=None, parts=None, budget=None):
+    """
+    采集并转换为 PDF，返回 (Markdown 路径, PDF 路径, 带目录的 Markdown 路径)。
+    没有得到任何内容时返回 None；任务被取消时只返回已生成的 Markdown，PDF 部分为 None。
+
+    参数:
+        input_txt, output_md, progress_callback, use_cache, refresh, resume, cancel_event, llm_slots:
+            同 collect_to_md.main
+        output_pdf: 输出的 PDF 路径（可选），默认与 Markdown 同名
+        highlight_file: 可选的高亮标题文件；URL 包含其中任一标题关键词时优先采集（见 deadline.py）
+        pdf_cache: 可选的 render_cache.RenderCache
+        pool: 可选的 render_pool.RenderPool，不指定时直接调用 wkhtmltopdf
+        parts: 可选的 pdf_parts.PartRenderer，超大摘要分段并行渲染；分卷模式下 PDF 路径为各分卷路径的列表
+        budget: 可选的采集阶段时间预算（秒），同 collect_to_md.main；PDF 转换的时间不计在内
+    """
+    builder = md_to_pdf.DocumentBuilder()
+    # 采集和转换共用一份运行指标，PDF 各阶段耗时补充到采集阶段写出的运行报告中
+    run_metrics = metrics.RunMetrics()
+    md_path = collect_to_md.main(input_txt, output_md, progress_callback, use_cache=use_cache,
+                                 refresh=refresh, resume=resume, cancel_event=cancel_event,
+                                 llm_slots=llm_slots, on_markdown=builder.add, run_metrics=run_metrics,
+                                 budget=budget, priority_file=highlight_file)
+    if not md_path:
+        return None
+    if cancel_event is not None and cancel_event.is_set():
+        return md_path, None, None
+
+    if output_pdf is None:
+        output_pdf = os.path.splitext(md_path)[0] + ".pdf"
+    # 转换阶段的进度形如 "PDF [2/4] ..."，与采集阶段的 "[k/N]" 区分开
+    try:
+        pdf_path, md_with_toc_path = md_to_pdf.convert_markdown_to_pdf(
+            builder.content, output_pdf, highlight_file, cache=pdf_cache, pool=pool,
+            progress_callback=lambda message: collect_to_md.report(f"PDF {message}", progress_callback),
+            document=builder.document(), parts=parts, run_metrics=run_metrics, cancel_event=cancel_event)
+    except md_to_pdf.ConversionCancelled:
+        return md_path, None, None
+    pdf_files = ", ".join(pdf_path) if isinstance(pdf_path, list) else pdf_path
+    run_metrics.info.update(pdf=pdf_path, md_with_toc=md_with_toc_path)
+    run_metrics.write_report(metrics.report_path(md_path))
+    collect_to_md.report(f"已生成PDF文件：{pdf_files}", progress_callback)
+    return md_path, pdf_path, md_with_toc_path
+
+
+if __name__ == "__main__":
+    """
+    命令行用法示例:
+        python pipeline.py input_urls.txt [output.md] [--highlight highlight_headers.txt] [--pdf output.pdf]
+        python pipeline.py --resume AI_news_summary_yyyymmdd_hhmmss
+    """
+    parser = argparse.ArgumentParser(
+        description="从URL列表一步生成AI新闻摘要Markdown和带目录的PDF",
+        epilog="如果不指定输出文件，则使用默认路径：./output/AI_news_summary_yyyymmdd_hhmmss.md 和同名 .pdf")
+    parser.add_argument("input_txt", nargs="?", help="包含URL列表的文本文件，每行一个URL")
+    parser.add_argument("output_md", nargs="?", default=None, help="输出的Markdown文件路径（可选）")
+    parser.add_argument("--pdf", metavar="PATH", help="输出的PDF文件路径（可选）")
+    parser.add_argument("--highlight", metavar="FILE", help="需要在目录中高亮显示的标题列表（每行一个）")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入摘要缓存")
+    parser.add_argument("--refresh", action="store_true", help="忽略已有缓存重新请求，并用新结果更新缓存")
+    parser.add_argument("--resume", metavar="JOB",
+                        help="继续中断的任务：任务ID（输出文件名去掉扩展名）、输出的 .md 路径或 .journal.jsonl 路径")
+    parser.add_argument("--budget", type=float, metavar="SECONDS",
+                        help="采集阶段的时间预算（秒）：快用完时不再发起新请求，未完成的URL写入 .skipped.txt")
+    args = parser.parse_args()
+    if not args.input_txt and not args.resume:
+        parser.error("需要指定 input_txt，或使用 --resume 继续已有任务")
+    if args.highlight and not os.path.exists(args.highlight):
+        parser.error(f"高亮标题文件 {args.highlight} 不存在")
+
+    config = configparser.ConfigParser()
+    config.read("config.txt")
+    run(args.input_txt, args.output_md, args.pdf, args.highlight, use_cache=not args.no_cache,
+        refresh=args.refresh, resume=args.resume, pdf_cache=render_cache.from_config(config),
+        parts=pdf_parts.from_config(config), budget=args.budget)
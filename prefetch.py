@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地预取：调用 LLM 之前先在本地下载网页并提取正文，把正文连同 URL 发给模型，
+而不是只发送 URL、由远端 Bot 自行抓取网页。
+
+- 下载：所有请求共用一个带 keep-alive 的 httpx 连接池，并按主机限制同时进行的请求数（max_per_host），
+  同一站点的大量链接不会同时涌向一台服务器。响应以流式读取：状态码和 Content-Type 不合适时不读取正文，
+  最多读取 max_bytes 字节（超出部分丢弃，截断的页面不缓存），整个下载不超过 timeout 秒
+  （设置了时间预算时不超过剩余时间）；
+- HTTP 缓存：响应保存在本地 SQLite 文件中。再次请求带 ETag / Last-Modified 的页面时发送
+  If-None-Match / If-Modified-Since 条件请求，服务器返回 304 时直接使用缓存的页面；
+  Cache-Control max-age 有效期内的页面不发请求，no-store 的响应不缓存；
+- 正文提取：只用标准库 html.parser，去掉脚本、样式、导航、页眉页脚等，优先取 <article> / <main> 中的文字，
+  按段落拼成纯文本并截断到 max_chars 个字符；
+- 失败处理：404 / 410 视为失效链接，直接判定失败，不再调用 LLM；其他错误（超时、连接失败、403 等）、
+  非 HTML 内容或提取出的正文少于 min_chars 个字符（多为需要脚本渲染的页面）时回退为只发送 URL。
+
+在 config.txt 的 [Prefetch] 段中设置 enabled = true 启用（两种引擎均支持，合并请求时不预取）。
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager, contextmanager
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+from url_utils import normalize_url
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "http.sqlite3")
+DEFAULT_MAX_SIZE_MB = 500
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_MAX_CONNECTIONS = 50
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_CHARS = 12000
+DEFAULT_MIN_CHARS = 200
+USER_AGENT = "Mozilla/5.0 (compatible; AI_News_Summarizer)"
+
+DEAD_STATUSES = (404, 410)
+HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+Article = namedtuple("Article", ["title", "text"])
+
+
+class DeadLink(Exception):
+    """链接已失效（404 / 410），无需再调用 LLM。"""
+
+    def __init__(self, url, status):
+        super().__init__(f"链接已失效（HTTP {status}），未调用 LLM: {url}")
+        self.url = url
+        self.status = status
+
+
+# ========== 正文提取 ==========
+
+# 其中的文字不属于正文
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "nav", "header", "footer",
+             "aside", "form", "button", "select", "textarea", "menu"}
+# 结束一个段落的标签
+BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr", "td",
+              "th", "blockquote", "pre", "figure", "figcaption", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6"}
+# 没有结束标签，不能计入嵌套深度
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class _TextExtractor(HTMLParser):
+    """把 HTML 拆成段落列表，记录每段是否位于 <article> / <main> 之内。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.og_title = ""
+        self.blocks = []          # (段落文字, 位于 article 内, 位于 main 内)
+        self._buffer = []
+        self._skip = 0
+        self._in_title = False
+        self._depth = {"article": 0, "main": 0}
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            if attrs.get("property") == "og:title" and attrs.get("content"):
+                self.og_title = attrs["content"].strip()
+            return
+        if tag in VOID_TAGS:
+            if tag in BLOCK_TAGS:
+                self._flush()
+            return
+        if tag == "title":
+            self._in_title = True
+        elif tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in self._depth:
+            self._flush()
+            self._depth[tag] += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        # <svg/> 之类的自闭合标签不改变嵌套深度
+        if tag == "meta":
+            self.handle_starttag(tag, attrs)
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self._depth:
+            self._flush()
+            self._depth[tag] = max(0, self._depth[tag] - 1)
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip:
+            self._buffer.append(data)
+
+    def _flush(self):
+        text = " ".join("".join(self._buffer).split())
+        self._buffer = []
+        if text:
+            self.blocks.append((text, self._depth["article"] > 0, self._depth["main"] > 0))
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def extract_article(html, max_chars=DEFAULT_MAX_CHARS):
+    """提取网页标题和正文：有 <article> 时只取其中的段落，其次是 <main>，否则取整个页面（已去掉导航等）。"""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    blocks = [text for text, in_article, _ in parser.blocks if in_article]
+    if not blocks:
+        blocks = [text for text, _, in_main in parser.blocks if in_main]
+    if not blocks:
+        blocks = [text for text, _, _ in parser.blocks]
+    text = "\n\n".join(blocks)
+    if len(text) > max_chars:
+        # 尽量在段落边界截断
+        cut = text.rfind("\n\n", 0, max_chars)
+        text = text[:cut if cut > max_chars // 2 else max_chars].rstrip() + "\n\n……（正文过长，已截断）"
+    title = " ".join(parser.title.split()) or parser.og_title
+    return Article(title, text)
+
+
+def decode_body(content, content_type):
+    """按 Content-Type 或页面 <meta charset> 声明的编码解码，都没有时按 UTF-8。"""
+    match = re.search(r"charset=[\"']?([\w-]+)", content_type or "", re.I)
+    if match is None:
+        match = re.search(rb"<meta[^>]+charset=[\"']?([\w-]+)", content[:4096], re.I)
+    encoding = match.group(1) if match else "utf-8"
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode("ascii")
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
+def build_prompt(url, article):
+    """发给模型的内容：URL、提取的标题和正文。"""
+    lines = [url, "", "以下是该网页的正文（已在本地下载并提取），请直接根据正文撰写摘要，无需再访问链接。"]
+    if article.title:
+        lines += ["", f"标题：{article.title}"]
+    lines += ["", article.text]
+    return "\n".join(lines)
+
+
+# ========== HTTP 缓存 ==========
+
+def cache_key(url):
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def freshness(headers):
+    """
+    由响应头得到缓存策略：返回 (是否可缓存, 有效期截止时间或 None)。
+    no-store 不缓存；max-age 给出有效期；no-cache 或没有 max-age 时每次都发条件请求。
+    """
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control:
+        return False, None
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match and "no-cache" not in cache_control and int(match.group(1)) > 0:
+        return True, time.time() + int(match.group(1))
+    # 没有验证器也没有有效期的响应无法复用
+    return bool(headers.get("etag") or headers.get("last-modified")), None
+
+
+class HttpCache:
+    """线程安全的网页缓存（SQLite），保存页面、验证器（ETag / Last-Modified）和有效期，按总大小 LRU 淘汰。"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb and max_size_mb > 0 else None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT NOT NULL,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages (accessed_at)")
+        self._conn.commit()
+
+    def get(self, url):
+        """返回缓存的条目（dict），不存在时返回 None。"""
+        key = cache_key(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_type, body, expires_at FROM pages WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return dict(zip(("etag", "last_modified", "content_type", "body", "expires_at"), row))
+
+    def put(self, url, headers, content_type, body, expires_at):
+        """写入（或覆盖）一个页面，并在超出大小上限时淘汰最久未使用的条目。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (key, url, etag, last_modified, content_type, body, size, expires_at, "
+                "fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key(url), normalize_url(url), headers.get("etag"), headers.get("last-modified"),
+                 content_type, body, len(body.encode("utf-8")), expires_at, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def revalidated(self, url, headers, expires_at):
+        """304 之后更新有效期和服务器给出的新验证器。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), "
+                "expires_at = ?, fetched_at = ? WHERE key = ?",
+                (headers.get("etag"), headers.get("last-modified"), expires_at, time.time(), cache_key(url)))
+            self._conn.commit()
+
+    def _evict(self):
+        if self.max_size_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM pages ORDER BY accessed_at").fetchall():
+            if total <= self.max_size_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ========== 预取 ==========
+
+class Prefetcher:
+    """
+    下载网页并生成发给模型的内容。线程引擎调用 prompt，协程引擎调用 prompt_async（共用缓存和统计）。
+    线程安全；协程连接池绑定到当前事件循环，用完后调用 aclose。
+    """
+
+    def __init__(self, cache=None, max_per_host=DEFAULT_MAX_PER_HOST, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 timeout=DEFAULT_TIMEOUT, max_chars=DEFAULT_MAX_CHARS, min_chars=DEFAULT_MIN_CHARS,
+                 max_bytes=DEFAULT_MAX_BYTES, user_agent=USER_AGENT):
+        self.cache = cache
+        self.max_per_host = max(1, max_per_host)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.user_agent = user_agent
+        self.counts = {"fetched": 0, "fresh": 0, "not_modified": 0, "dead": 0, "fallback": 0}
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._host_slots = {}
+        self._async_host_slots = {}
+
+    def _client_kwargs(self):
+        return {
+            "limits": httpx.Limits(max_connections=self.max_connections,
+                                   max_keepalive_connections=self.max_connections),
+            "timeout": httpx.Timeout(self.timeout),
+            "follow_redirects": True,
+            "headers": {"User-Agent": self.user_agent},
+        }
+
+    def _count(self, result):
+        with self._lock:
+            self.counts[result] += 1
+        metrics.REGISTRY.inc("ai_news_prefetch_requests_total", result=result)
+
+    # ----- 请求与响应 -----
+
+    def _lookup(self, url):
+        """返回 (缓存条目, 条件请求头)；缓存仍在有效期内时请求头为 None（无需请求）。"""
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is None:
+            return None, {}
+        if cached["expires_at"] is not None and cached["expires_at"] > time.time():
+            return cached, None
+        headers = {}
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return cached, headers
+
+    def _timeout(self, timeout):
+        """本次下载的总时限：timeout_seconds 与调用方给出的剩余时间中较小者。"""
+        return self.timeout if timeout is None else min(self.timeout, timeout)
+
+    def _wants_body(self, url, response, cached):
+        """只看状态码和响应头决定是否读取正文：200 且是 HTML 时读取；失效链接抛出 DeadLink。"""
+        status = response.status_code
+        if status == 304 and cached is not None:
+            return False
+        if status in DEAD_STATUSES:
+            raise DeadLink(url, status)
+        content_type = response.headers.get("content-type", "")
+        return status == 200 and content_type.lower().startswith(HTML_TYPES)
+
+    def _handle(self, url, response, cached, content=None, complete=True):
+        """处理响应，返回页面 HTML（不可用时返回 None）；content 为已读取的正文，complete 表示是否读完。"""
+        if response.status_code == 304 and cached is not None:
+            if self.cache is not None:
+                self.cache.revalidated(url, response.headers, freshness(response.headers)[1])
+            self._count("not_modified")
+            return cached["body"]
+        if content is None:
+            return None
+        content_type = response.headers.get("content-type", "")
+        body = decode_body(content[:self.max_bytes], content_type)
+        cacheable, expires_at = freshness(response.headers)
+        if self.cache is not None and cacheable and complete:
+            self.cache.put(url, response.headers, content_type, body, expires_at)
+        self._count("fetched")
+        return body
+
+    def _prompt(self, url, body):
+        """由页面生成发给模型的内容；没有可用的正文时回退为 URL。"""
+        article = extract_article(body, self.max_chars) if body else None
+        if article is None or len(article.text) < self.min_chars:
+            self._count("fallback")
+            prompt = url
+        else:
+            prompt = build_prompt(url, article)
+        with self._lock:
+            self.prompt_chars += len(prompt)
+        return prompt
+
+    # ----- 线程引擎 -----
+
+    @contextmanager
+    def _host_slot(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_kwargs())
+            slot = self._host_slots.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with slot:
+            yield self._client
+
+    def fetch(self, url, timeout=None):
+        """
+        下载（或从缓存取得）页面 HTML；不可用时返回 None，失效链接抛出 DeadLink。
+        timeout 为调用方剩余的时间（秒），下载不超过它与 timeout_seconds 中较小者。
+        """
+        cached, headers = self._lookup(url)
+        if headers is None:
+            self._count("fresh")
+            return cached["body"]
+        timeout = self._timeout(timeout)
+        ends_at = time.monotonic() + timeout
+        with self._host_slot(url) as client, \
+                client.stream("GET", url, headers=headers, timeout=httpx.Timeout(timeout)) as response:
+            if not self._wants_body(url, response, cached):
+                return self._handle(url, response, cached)
+            chunks, received, complete = [], 0, True
+            for chunk in response.iter_bytes():
+                chunks.append(chunk)
+                received += len(chunk)
+                # 超过 max_bytes 或时限时停止读取，只使用已收到的部分
+                if received > self.max_bytes or time.monotonic() > ends_at:
+                    complete = False
+                    break
+        return self._handle(url, response, cached, b"".join(chunks), complete)
+
+    def prompt(self, url, timeout=None):
+        """
+        发给模型的内容：提取到正文时为 URL、标题和正文，否则为 URL 本身；失效链接抛出 DeadLink。
+        timeout 同 fetch。
+        """
+        try:
+            body = self.fetch(url, timeout)
+        except DeadLink:
+            self._count("dead")
+            raise
+        except Exception:
+            body = None     # 超时、连接失败等：回退为只发送 URL
+        return self._prompt(url, body)
+
+    # ----- 协程引擎 -----
+
+    @asynccontextmanager
+    async def _async_host_slot(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_kwargs())
+        slot = self._async_host_slots.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        async with slot:
+            yield self._async_client
+
+    async def fetch_async(self, url, timeout=None):
+        """fetch 的协程版本。"""
+        cached, headers = self._lookup(url)
+        if headers is None:
+            self._count("fresh")
+            return cached["body"]
+        timeout = self._timeout(timeout)
+        ends_at = time.monotonic() + timeout
+        async with self._async_host_slot(url) as client, \
+                client.stream("GET", url, headers=headers, timeout=httpx.Timeout(timeout)) as response:
+            if not self._wants_body(url, response, cached):
+                return self._handle(url, response, cached)
+            chunks, received, complete = [], 0, True
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                received += len(chunk)
+                # 超过 max_bytes 或时限时停止读取，只使用已收到的部分
+                if received > self.max_bytes or time.monotonic() > ends_at:
+                    complete = False
+                    break
+        return self._handle(url, response, cached, b"".join(chunks), complete)
+
+    async def prompt_async(self, url, timeout=None):
+        """prompt 的协程版本。"""
+        try:
+            body = await self.fetch_async(url, timeout)
+        except DeadLink:
+            self._count("dead")
+            raise
+        except Exception:
+            body = None     # 超时、连接失败等：回退为只发送 URL
+        return self._prompt(url, body)
+
+    async def aclose(self):
+        """关闭协程连接池（每次 asyncio.run 结束前调用）。"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self._async_client = None
+        self._async_host_slots = {}
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+        if self.cache is not None:
+            self.cache.close()
+
+    # ----- 统计 -----
+
+    def stats_text(self):
+        with self._lock:
+            counts, chars = dict(self.counts), self.prompt_chars
+        sent = counts["fetched"] + counts["fresh"] + counts["not_modified"] + counts["fallback"]
+        average = chars / sent if sent else 0.0
+        return (f"网页预取：下载 {counts['fetched']} 个，缓存有效 {counts['fresh']} 个，304 未修改 "
+                f"{counts['not_modified']} 个，失效链接 {counts['dead']} 个（未调用 LLM），回退为只发送 URL "
+                f"{counts['fallback']} 个，发送内容平均 {average:.0f} 字符")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, prompt_chars=self.prompt_chars)
+
+
+def from_config(config):
+    """根据 config.txt 的 [Prefetch] 段创建 Prefetcher；未启用时返回 None。"""
+    if not config.getboolean("Prefetch", "enabled", fallback=False):
+        return None
+    cache = None
+    if config.getboolean("Prefetch", "cache", fallback=True):
+        cache = HttpCache(path=config.get("Prefetch", "cache_path", fallback=DEFAULT_CACHE_PATH),
+                          max_size_mb=config.getfloat("Prefetch", "cache_max_size_mb", fallback=DEFAULT_MAX_SIZE_MB))
+    return Prefetcher(
+        cache=cache,
+        max_per_host=config.getint("Prefetch", "max_per_host", fallback=DEFAULT_MAX_PER_HOST),
+        max_connections=config.getint("Prefetch", "max_connections", fallback=DEFAULT_MAX_CONNECTIONS),
+        timeout=config.getfloat("Prefetch", "timeout_seconds", fallback=DEFAULT_TIMEOUT),
+        max_chars=config.getint("Prefetch", "max_chars", fallback=DEFAULT_MAX_CHARS),
+        min_chars=config.getint("Prefetch", "min_chars", fallback=DEFAULT_MIN_CHARS),
+        max_bytes=int(config.getfloat("Prefetch", "max_size_mb", fallback=DEFAULT_MAX_BYTES / 1024 / 1024)
+                      * 1024 * 1024),
+    )
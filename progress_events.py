@@ -0,0 +1,149 @@
+"""
+Per-job progress event log backing the /progress/<task_id> SSE stream.
+
+Every progress message is stored in SQLite with a sequence number, so any
+process can serve the stream and a browser that reconnects with
+Last-Event-ID picks up exactly where it left off. Viewers wait on a
+condition variable (with a short poll as fallback for events written by
+other processes) instead of sleeping, and a background reaper deletes the
+events of finished jobs once they are older than the retention period.
+
+Live previews of summaries being generated (STREAM: messages, see
+streaming.py) each carry the whole preview of one URL so far, so appending
+one replaces the previous preview of that URL: a job stores at most one
+preview row per URL however many tokens are streamed.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Messages that end a job's stream
+TERMINAL_PREFIXES = ('COMPLETED:', 'ERROR:')
+
+# Messages that supersede the job's earlier message with the same key (see coalesce_key)
+PREVIEW_PREFIX = 'STREAM:'
+
+POLL_INTERVAL = 1.0
+
+
+def is_terminal(message):
+    return message.startswith(TERMINAL_PREFIXES)
+
+
+def coalesce_key(message):
+    """Key of a message that replaces earlier ones with the same key (the URL index of a preview), else None."""
+    if not message.startswith(PREVIEW_PREFIX):
+        return None
+    try:
+        return f"preview:{json.loads(message[len(PREVIEW_PREFIX):])['idx']}"
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class EventLog:
+    """Append-only, replayable progress events keyed by job id."""
+
+    def __init__(self, db_path, retention_seconds=3600, reap_interval=300):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.retention_seconds = retention_seconds
+        self.reap_interval = reap_interval
+        self._lock = threading.Lock()
+        self._new_event = threading.Condition(self._lock)
+        self._reaper = None
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                terminal INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                coalesce_key TEXT
+            )
+        """)
+        # Logs created before previews were coalesced lack the key column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(events)")}
+        if 'coalesce_key' not in columns:
+            self._conn.execute("ALTER TABLE events ADD COLUMN coalesce_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_events_job ON events (job_id, seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_events_key ON events (job_id, coalesce_key)")
+        self._conn.commit()
+
+    def append(self, job_id, message):
+        """
+        Record a progress message and wake up anyone streaming this job. Returns its sequence number.
+        A message with a coalesce_key replaces the job's earlier message with that key.
+        """
+        key = coalesce_key(message)
+        with self._new_event:
+            if key is not None:
+                self._conn.execute("DELETE FROM events WHERE job_id = ? AND coalesce_key = ?", (job_id, key))
+            cursor = self._conn.execute(
+                "INSERT INTO events (job_id, message, terminal, created_at, coalesce_key) VALUES (?, ?, ?, ?, ?)",
+                (job_id, message, int(is_terminal(message)), time.time(), key))
+            self._conn.commit()
+            self._new_event.notify_all()
+            return cursor.lastrowid
+
+    def exists(self, job_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM events WHERE job_id = ? LIMIT 1", (job_id,)).fetchone() is not None
+
+    def read(self, job_id, after=0):
+        """Events of job_id with a sequence number greater than after, as [(seq, message)]."""
+        with self._lock:
+            return self._read(job_id, after)
+
+    def _read(self, job_id, after):
+        return self._conn.execute(
+            "SELECT seq, message FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after)).fetchall()
+
+    def wait(self, job_id, after=0, timeout=15.0):
+        """Block until job_id has events after `after` or the timeout expires; returns them (possibly [])."""
+        deadline = time.monotonic() + timeout
+        with self._new_event:
+            while True:
+                events = self._read(job_id, after)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                # Notified by append() in this process; the poll interval covers other processes
+                self._new_event.wait(min(remaining, POLL_INTERVAL))
+
+    def reap(self):
+        """Delete all events of jobs that finished more than retention_seconds ago."""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            self._conn.execute("""
+                DELETE FROM events WHERE job_id IN (
+                    SELECT job_id FROM events WHERE terminal = 1 AND created_at < ?
+                )
+            """, (cutoff,))
+            self._conn.commit()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap()
+
+    def start_reaper(self):
+        """Start the background reaper once; safe to call repeatedly."""
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, daemon=True, name="event-reaper")
+        self._reaper.start()
+
+
+def format_sse(seq, message):
+    """Format one event for text/event-stream; multi-line messages become several data: lines."""
+    data = "\n".join(f"data: {line}" for line in message.split("\n"))
+    return f"id: {seq}\n{data}\n\n"
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 请求的限流与重试：
+
+- 令牌桶：按 config.txt 中的每分钟请求数（RPM）和每分钟 token 数（TPM）控制发送速率；
+- 重试：遇到 429、5xx、连接错误和超时时按指数退避加随机抖动重试，优先遵守服务端返回的 Retry-After；
+- AIMD 并发控制：每次成功缓慢增加允许的并发数，遇到 429 时减半，
+  使吞吐量自动贴近服务商配额上限，而无需手动调低 batch_size。
+
+相关参数在 config.txt 的 [RateLimit] 段中设置。
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 60.0
+DEFAULT_ESTIMATED_TOKENS = 1000
+
+
+class TokenBucket:
+    """
+    每分钟补充 rate_per_minute 个令牌的令牌桶。默认容量只有一秒的额度，
+    使请求均匀发出，而不是在开头集中突发。
+    reserve 立即扣除令牌（允许透支），并返回调用方需要等待的秒数，
+    因此同一个桶既可用于线程也可用于协程。
+    """
+
+    def __init__(self, rate_per_minute, burst_seconds=1.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1.0):
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, delta):
+        """用实际消耗修正预估值：delta > 0 表示多扣，< 0 表示退还。"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AIMDController:
+    """
+    加性增、乘性减的并发上限控制：每次成功 limit += 1/limit（约每轮 +1），
+    遇到 429 时 limit 减半；cooldown 秒内的连续 429 只减一次，避免一次突发把并发压到底。
+    """
+
+    def __init__(self, max_concurrency, min_concurrency=1, cooldown=2.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.cooldown = cooldown
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def current_limit(self):
+        return int(self.limit)
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            grown = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            if int(grown) > int(self.limit):
+                self._cond.notify()
+            self.limit = grown
+
+    def on_throttle(self):
+        """返回减小后的并发上限；冷却期内返回 None。"""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return None
+            self._last_decrease = now
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            return int(self.limit)
+
+
+class EndpointsUnavailable(Exception):
+    """所有端点都处于熔断中（见 endpoints.py）；retry_after 为最早恢复的剩余秒数。"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"所有端点均已熔断，{retry_after:.1f} 秒后恢复")
+        self.retry_after = retry_after
+
+
+def classify_error(exc):
+    """返回 (是否可重试, 是否为 429 限流, Retry-After 秒数或 None)。"""
+    # 只在请求失败时用到，此时 SDK 早已导入；不在模块顶部导入，以免导入本模块就加载 openai
+    import openai
+    if isinstance(exc, EndpointsUnavailable):
+        return True, False, exc.retry_after
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True, False, None
+    if isinstance(exc, openai.APIStatusError):
+        status = exc.status_code
+        retry_after = None
+        headers = getattr(exc.response, "headers", None) or {}
+        value = headers.get("retry-after")
+        if value:
+            try:
+                retry_after = max(0.0, float(value))
+            except ValueError:
+                retry_after = None
+        if status == 429:
+            return True, True, retry_after
+        if status >= 500 or status == 408:
+            return True, False, retry_after
+    return False, False, None
+
+
+class RateLimiter:
+    """把令牌桶、AIMD 并发控制和重试策略组合在一起，包装单次 LLM 调用。"""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0,
+                 estimated_tokens=DEFAULT_ESTIMATED_TOKENS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                 max_concurrency=10, min_concurrency=1, on_event=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.estimated_tokens = estimated_tokens
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = AIMDController(max_concurrency, min_concurrency)
+        self.on_event = on_event
+        self.retries = 0
+        self.throttled = 0
+
+    def _emit(self, message):
+        if self.on_event:
+            self.on_event(message)
+
+    def _budget_delay(self):
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            delay = max(delay, self.token_bucket.reserve(self.estimated_tokens))
+        return delay
+
+    def _settle(self, completion):
+        usage = getattr(completion, "usage", None)
+        if self.token_bucket is not None and usage is not None and getattr(usage, "total_tokens", None):
+            self.token_bucket.adjust(usage.total_tokens - self.estimated_tokens)
+        self.concurrency.on_success()
+
+    def _retry_delay(self, exc, attempt):
+        """可重试时返回等待秒数，否则返回 None。"""
+        retryable, throttled, retry_after = classify_error(exc)
+        if not retryable or attempt >= self.max_retries:
+            return None
+        self.retries += 1
+        if throttled:
+            self.throttled += 1
+            new_limit = self.concurrency.on_throttle()
+            if new_limit is not None:
+                self._emit(f"收到 429 限流，并发上限降至 {new_limit}")
+        # 指数退避 + 全抖动；服务端给出 Retry-After 时以其为下限
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self._emit(f"请求失败（{exc.__class__.__name__}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+        return delay
+
+    def call(self, request):
+        """在线程中执行 request()，按限流规则等待并在可重试的错误上重试。"""
+        attempt = 0
+        while True:
+            self.concurrency.acquire()
+            try:
+                delay = self._budget_delay()
+                if delay > 0:
+                    time.sleep(delay)
+                completion = request()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._settle(completion)
+                return completion
+            finally:
+                self.concurrency.release()
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, request):
+        """call 的协程版本，request() 返回可等待对象。"""
+        attempt = 0
+        while True:
+            while not self.concurrency.try_acquire():
+                await asyncio.sleep(0.05)
+            try:
+                delay = self._budget_delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                completion = await request()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._settle(completion)
+                return completion
+            finally:
+                self.concurrency.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats_text(self):
+        return f"重试 {self.retries} 次（其中 429 限流 {self.throttled} 次），当前并发上限 {self.concurrency.current_limit}"
+
+
+def from_config(config, max_concurrency, on_event=None):
+    """根据 config.txt 的 [RateLimit] 段创建限流器；enabled = false 时返回 None。"""
+    if not config.getboolean("RateLimit", "enabled", fallback=True):
+        return None
+    return RateLimiter(
+        requests_per_minute=config.getint("RateLimit", "requests_per_minute", fallback=0),
+        tokens_per_minute=config.getint("RateLimit", "tokens_per_minute", fallback=0),
+        estimated_tokens=config.getint("RateLimit", "estimated_tokens_per_request",
+                                       fallback=DEFAULT_ESTIMATED_TOKENS),
+        max_retries=config.getint("RateLimit", "max_retries", fallback=DEFAULT_MAX_RETRIES),
+        backoff_base=config.getfloat("RateLimit", "backoff_base", fallback=DEFAULT_BACKOFF_BASE),
+        backoff_max=config.getfloat("RateLimit", "backoff_max", fallback=DEFAULT_BACKOFF_MAX),
+        max_concurrency=max_concurrency,
+        min_concurrency=config.getint("RateLimit", "min_concurrency", fallback=1),
+        on_event=on_event,
+    )
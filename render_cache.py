@@ -0,0 +1,136 @@
+"""
+On-disk cache for md_to_pdf renders.
+
+Two kinds of entries live in the cache directory (by default output/render_cache):
+
+- <key>.pdf and <key>_with_toc.md: a finished conversion, keyed by a hash of
+  the markdown, the highlight terms, the CSS, the wkhtmltopdf options and the
+  title. An identical request copies these out instead of rendering again.
+- <key>.body.html: the markdown2 output for a document, keyed by a hash of
+  the markdown and the markdown2 extras only. When just the highlight list
+  changes, the body is reused and only the TOC and the PDF are rebuilt.
+
+The directory is kept under max_size_mb by deleting the least recently used
+files (hits refresh a file's modification time).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join("output", "render_cache")
+DEFAULT_MAX_SIZE_MB = 500
+
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Size-bounded cache of rendered PDFs and markdown2 body HTML."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb and max_size_mb > 0 else None
+        self.hits = 0
+        self.body_hits = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def render_key(content, highlight_headers, css, options, title):
+        """Key of a finished conversion; the order of highlight terms does not matter."""
+        return _digest("render", content, sorted(set(highlight_headers)), css, options, title)
+
+    @staticmethod
+    def body_key(content, extras):
+        return _digest("body", content, extras)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def get_render(self, key, output_file, md_with_toc_file):
+        """Copy a cached conversion to the requested paths; returns False on a miss."""
+        pdf_path = self._path(f"{key}.pdf")
+        md_path = self._path(f"{key}_with_toc.md")
+        with self._lock:
+            if not (self._touch(pdf_path) and self._touch(md_path)):
+                return False
+            for output_dir in {os.path.dirname(output_file), os.path.dirname(md_with_toc_file)}:
+                if output_dir and not os.path.exists(output_dir):
+                    os.makedirs(output_dir)
+            shutil.copyfile(pdf_path, output_file)
+            shutil.copyfile(md_path, md_with_toc_file)
+            self.hits += 1
+        return True
+
+    def put_render(self, key, output_file, md_with_toc_file):
+        if not os.path.exists(output_file):
+            return
+        with self._lock:
+            shutil.copyfile(md_with_toc_file, self._path(f"{key}_with_toc.md"))
+            # Copy under a temporary name first so a concurrent reader never sees a partial PDF
+            tmp_path = self._path(f"{key}.pdf.tmp")
+            shutil.copyfile(output_file, tmp_path)
+            os.replace(tmp_path, self._path(f"{key}.pdf"))
+            self._evict()
+
+    def get_body(self, key):
+        path = self._path(f"{key}.body.html")
+        with self._lock:
+            if not self._touch(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                body = f.read()
+            self.body_hits += 1
+        return body
+
+    def put_body(self, key, html):
+        with self._lock:
+            tmp_path = self._path(f"{key}.body.html.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp_path, self._path(f"{key}.body.html"))
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used files until the directory fits in max_size_bytes. Caller holds the lock."""
+        if self.max_size_bytes is None:
+            return
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def from_config(config):
+    """Create the render cache from the [RenderCache] section of config.txt; None when disabled."""
+    if not config.getboolean("RenderCache", "enabled", fallback=True):
+        return None
+    return RenderCache(
+        directory=config.get("RenderCache", "path", fallback=DEFAULT_CACHE_DIR),
+        max_size_mb=config.getfloat("RenderCache", "max_size_mb", fallback=DEFAULT_MAX_SIZE_MB),
+    )
@@ -0,0 +1,238 @@
+"""
+Bounded HTML -> PDF rendering service used by md_to_pdf.
+
+A fixed number of render workers take jobs from a bounded queue. When the
+queue is full, submit() raises RenderQueueFull instead of piling up more
+heavyweight renders, and every render has a timeout after which its process
+is killed.
+
+The backend is pluggable:
+
+- "wkhtmltopdf" (default): runs the wkhtmltopdf binary for each render with the
+  same command line pdfkit builds, but under our control so it can be killed.
+- "weasyprint": a pure-Python backend. Each worker keeps one long-lived child
+  process with WeasyPrint imported and its fonts loaded, so small documents do
+  not pay the startup cost every time. wkhtmltopdf options do not apply; page
+  layout comes from the CSS.
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import threading
+from concurrent.futures import Future
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_TIMEOUT = 120.0
+
+
+class RenderError(Exception):
+    """A render failed."""
+
+
+class RenderTimeout(RenderError):
+    """A render took longer than the pool's timeout and was killed."""
+
+
+class RenderQueueFull(RenderError):
+    """All render workers are busy and the queue is full; try again later."""
+
+
+class WkhtmltopdfBackend:
+    """Render with the wkhtmltopdf binary, one process per render.
+
+    Without a pdfkit configuration the binary is looked up (md_to_pdf.wkhtmltopdf_configuration)
+    at the first render, not when the pool is created."""
+
+    name = "wkhtmltopdf"
+
+    def __init__(self, configuration=None):
+        self.configuration = configuration
+
+    def start_worker(self):
+        return self
+
+    def render(self, html, output_file, options, timeout):
+        from pdfkit.pdfkit import PDFKit
+        if self.configuration is None:
+            import md_to_pdf
+            self.configuration = md_to_pdf.wkhtmltopdf_configuration()
+        kit = PDFKit(html, 'string', options=options, configuration=self.configuration)
+        args = kit.command(output_file)
+        # Own process group on POSIX, so a timeout kills wrapper scripts together with their children
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=kit.environ,
+                                   start_new_session=hasattr(os, 'killpg'))
+        try:
+            stdout, stderr = process.communicate(input=html.encode('utf-8'), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if hasattr(os, 'killpg'):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            process.communicate()
+            raise RenderTimeout(f"wkhtmltopdf did not finish within {timeout:.0f}s")
+        stderr = (stderr or stdout or b"").decode('utf-8', errors='replace')
+        try:
+            kit.handle_error(process.returncode, stderr)
+        except IOError as e:
+            raise RenderError(str(e)) from e
+        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+            raise RenderError(f"wkhtmltopdf did not produce {output_file}: {stderr.strip()}")
+        return output_file
+
+    def close_worker(self, worker):
+        pass
+
+
+def _weasyprint_loop(conn):
+    """Child process of a WeasyPrint worker: render requests until the pipe closes."""
+    from weasyprint import HTML
+    conn.send(('ready', None))
+    while True:
+        try:
+            html, output_file = conn.recv()
+        except EOFError:
+            return
+        try:
+            HTML(string=html).write_pdf(output_file)
+        except Exception as e:
+            conn.send(('error', f"{e.__class__.__name__}: {e}"))
+        else:
+            conn.send(('ok', output_file))
+
+
+class _WeasyPrintWorker:
+    """One long-lived WeasyPrint process; restarted after a timeout kill or a crash."""
+
+    def __init__(self):
+        self.process = None
+        self.conn = None
+
+    def _spawn(self):
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_weasyprint_loop, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        status, _ = self._receive(60)
+        if status != 'ready':
+            raise RenderError("WeasyPrint worker failed to start (is weasyprint installed?)")
+
+    def _receive(self, timeout):
+        try:
+            if not self.conn.poll(timeout):
+                return 'timeout', None
+            return self.conn.recv()
+        except (EOFError, OSError):
+            return 'error', "WeasyPrint worker exited unexpectedly"
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def render(self, html, output_file, options, timeout):
+        if self.process is None or not self.process.is_alive():
+            self.kill()
+            self._spawn()
+        self.conn.send((html, output_file))
+        status, result = self._receive(timeout)
+        if status == 'timeout':
+            self.kill()
+            raise RenderTimeout(f"WeasyPrint did not finish within {timeout:.0f}s")
+        if status != 'ok':
+            if not self.process.is_alive():
+                self.kill()
+            raise RenderError(result)
+        return result
+
+
+class WeasyPrintBackend:
+    """Pure-Python rendering in persistent worker processes."""
+
+    name = "weasyprint"
+
+    def start_worker(self):
+        return _WeasyPrintWorker()
+
+    def close_worker(self, worker):
+        worker.kill()
+
+
+class RenderPool:
+    """A bounded queue of render jobs served by a fixed number of worker threads."""
+
+    def __init__(self, backend, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._jobs = queue.Queue(maxsize=max(0, queue_size))
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads once; safe to call repeatedly."""
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._work, daemon=True, name=f"render-worker-{i}")
+                             for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, html, output_file, options=None):
+        """Queue a render and return a Future for the output path. Raises RenderQueueFull when saturated."""
+        self.start()
+        future = Future()
+        try:
+            self._jobs.put_nowait((future, html, output_file, options))
+        except queue.Full:
+            raise RenderQueueFull("All PDF render workers are busy, please try again shortly") from None
+        return future
+
+    def render(self, html, output_file, options=None):
+        """Render and wait for the result; the wait is bounded by the queue wait plus the render timeout."""
+        return self.submit(html, output_file, options).result()
+
+    def _work(self):
+        worker = self.backend.start_worker()
+        try:
+            while True:
+                future, html, output_file, options = self._jobs.get()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = worker.render(html, output_file, options, self.timeout)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            self.backend.close_worker(worker)
+
+
+def create_backend(name, wkhtmltopdf_configuration=None):
+    if name == WkhtmltopdfBackend.name:
+        return WkhtmltopdfBackend(wkhtmltopdf_configuration)
+    if name == WeasyPrintBackend.name:
+        return WeasyPrintBackend()
+    raise ValueError(f"Unknown render backend: {name}")
+
+
+def from_config(config, wkhtmltopdf_configuration=None):
+    """Create the render pool from the [Render] section of config.txt."""
+    backend = create_backend(config.get("Render", "backend", fallback=WkhtmltopdfBackend.name),
+                             wkhtmltopdf_configuration)
+    return RenderPool(
+        backend,
+        workers=config.getint("Render", "workers", fallback=DEFAULT_WORKERS),
+        queue_size=config.getint("Render", "queue_size", fallback=DEFAULT_QUEUE_SIZE),
+        timeout=config.getfloat("Render", "timeout_seconds", fallback=DEFAULT_TIMEOUT),
+    )
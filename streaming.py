@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式摘要：以 stream=True 调用 LLM，把生成中的文本实时转发到进度流（Web 界面的 /progress/<task_id>）。
+
+- collect_stream / collect_stream_async：逐块读取流式回复，拼成与非流式调用相同的 completion 对象
+  （choices[0].message.content 与 usage），因此缓存、合并输出、限流器和指标记录都无需改动；
+  同时记录首个 token 的等待时间；
+- MarkdownStream：单个 URL 的预览流，在收到第一个 # 之前的说明文字直接丢弃（与 trim_leading_text 相同），
+  之后的文本交给转发器；
+- StreamForwarder：所有 URL 共用的转发器，保存每个 URL 当前这次尝试已生成的预览。每个 URL 的第一段文本立即发出，
+  之后每隔 flush_interval 秒发出一次有更新的预览；单个预览超过 max_preview_chars 个字符后丢弃新到的片段
+  （预览有损，最终 Markdown 不受影响）。
+
+每条转发的消息形如 STREAM:{"idx": 3, "url": "...", "text": "..."}，text 是该 URL 这次尝试到目前为止的全部预览
+（重试时从头开始），因此每条消息都取代同一 URL 之前的消息，进度流只需保存每个 URL 的最新一条
+（见 progress_events.py）。在 config.txt 的 [Processing] 段中设置 stream = true 启用。
+"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+STREAM_PREFIX = "STREAM:"
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_MAX_PREVIEW_CHARS = 8000
+
+
+def completion_from_text(content, usage=None):
+    """把流式回复拼成与非流式调用结构相同的 completion 对象。"""
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage)
+
+
+def _usage(chunk):
+    """流式回复最后一块中的 token 用量；SDK 不认识该字段时得到的是 dict。"""
+    usage = getattr(chunk, "usage", None)
+    return SimpleNamespace(**usage) if isinstance(usage, dict) else usage
+
+
+def _deltas(chunk):
+    for choice in getattr(chunk, "choices", None) or []:
+        delta = getattr(choice, "delta", None)
+        content = getattr(delta, "content", None) if delta is not None else None
+        if content:
+            yield content
+
+
+def collect_stream(chunks, view=None, started=None, run_metrics=None):
+    """
+    读取流式回复 chunks，把每段文本交给 view（MarkdownStream，可为 None），返回拼好的 completion。
+    started（time.monotonic() 时间）给出时，向 run_metrics 记录首个 token 的等待时间。
+    """
+    parts = []
+    usage = None
+    for chunk in chunks:
+        usage = _usage(chunk) or usage
+        for delta in _deltas(chunk):
+            if not parts and started is not None and run_metrics is not None:
+                run_metrics.observe_first_token(time.monotonic() - started)
+            parts.append(delta)
+            if view is not None:
+                view.feed(delta)
+    if view is not None:
+        view.close()
+    return completion_from_text("".join(parts), usage)
+
+
+async def collect_stream_async(chunks, view=None, started=None, run_metrics=None):
+    """collect_stream 的协程版本，chunks 为异步可迭代对象。"""
+    parts = []
+    usage = None
+    async for chunk in chunks:
+        usage = _usage(chunk) or usage
+        for delta in _deltas(chunk):
+            if not parts and started is not None and run_metrics is not None:
+                run_metrics.observe_first_token(time.monotonic() - started)
+            parts.append(delta)
+            if view is not None:
+                view.feed(delta)
+    if view is not None:
+        view.close()
+    return completion_from_text("".join(parts), usage)
+
+
+class MarkdownStream:
+    """单个 URL 一次请求的预览流：丢弃第一个 # 之前的文字，其余交给转发器。"""
+
+    def __init__(self, forwarder, idx, url):
+        self.forwarder = forwarder
+        self.idx = idx
+        self.url = url
+        self.started = False     # 是否已经遇到第一个 #
+
+    def feed(self, delta):
+        if not self.started:
+            start_hash = delta.find("#")
+            if start_hash == -1:
+                return
+            delta = delta[start_hash:]
+            self.started = True
+            self.forwarder.put(self.idx, self.url, delta, start=True)
+            return
+        self.forwarder.put(self.idx, self.url, delta)
+
+    def close(self):
+        self.forwarder.finish(self.idx)
+
+
+class StreamForwarder:
+    """多个 URL 共用的转发器，按时间间隔发出有更新的预览（每条都是该 URL 的完整预览）。线程安全。"""
+
+    def __init__(self, emit, flush_interval=DEFAULT_FLUSH_INTERVAL, max_preview_chars=DEFAULT_MAX_PREVIEW_CHARS):
+        self.emit = emit
+        self.flush_interval = flush_interval
+        self.max_preview_chars = max_preview_chars
+        self.dropped_chars = 0
+        self._previews = {}      # idx -> [url, 这次尝试到目前为止的预览]
+        self._updated = set()    # 上次发出后有新片段的 idx
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # 同一 URL 较旧的预览不能在较新的之后发出（进度流只保留最后一条）
+        self._emit_lock = threading.Lock()
+
+    def open(self, idx, url):
+        """开始一个 URL 的一次请求（重试时重新调用），返回其 MarkdownStream。"""
+        return MarkdownStream(self, idx, url)
+
+    def put(self, idx, url, text, start=False):
+        with self._lock:
+            entry = self._previews.get(idx)
+            if start or entry is None:
+                # 新的一次尝试：预览从头开始
+                entry = self._previews[idx] = [url, ""]
+            if len(entry[1]) + len(text) > self.max_preview_chars:
+                self.dropped_chars += len(text)
+            else:
+                entry[1] += text
+                self._updated.add(idx)
+            due = start or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """立即发出所有有更新的预览。"""
+        with self._emit_lock:
+            with self._lock:
+                updated, self._updated = self._updated, set()
+                payloads = [{"idx": idx, "url": self._previews[idx][0], "text": self._previews[idx][1]}
+                            for idx in sorted(updated) if idx in self._previews]
+                self._last_flush = time.monotonic()
+            for payload in payloads:
+                self.emit(STREAM_PREFIX + json.dumps(payload, ensure_ascii=False))
+
+    def finish(self, idx):
+        """一个 URL 的一次请求结束：发出它最后的预览，不再保存其文本。"""
+        self.flush()
+        with self._lock:
+            self._previews.pop(idx, None)
+
+
+def from_config(config, emit):
+    """[Processing] stream = true 时创建 StreamForwarder，把预览发给 emit；否则返回 None。"""
+    if not config.getboolean("Processing", "stream", fallback=False):
+        return None
+    return StreamForwarder(
+        emit,
+        flush_interval=config.getfloat("Processing", "stream_flush_seconds", fallback=DEFAULT_FLUSH_INTERVAL),
+        max_preview_chars=config.getint("Processing", "stream_buffer_chars", fallback=DEFAULT_MAX_PREVIEW_CHARS),
+    )
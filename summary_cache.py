@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按 (规范化 URL, model_id) 缓存每个 URL 的摘要结果，避免对前几天已经处理过的文章重复调用 LLM。
+
+缓存保存在 SQLite 文件中，支持过期时间（TTL）和按总大小的 LRU 淘汰。
+相关参数在 config.txt 的 [Cache] 段中设置。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from url_utils import normalize_url
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "summaries.sqlite3")
+DEFAULT_TTL_HOURS = 24 * 7
+DEFAULT_MAX_SIZE_MB = 200
+
+
+def cache_key(url, model_id):
+    """缓存键：规范化 URL 与 model_id 的 SHA-256 摘要。"""
+    return hashlib.sha256(f"{model_id}\n{normalize_url(url)}".encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """线程安全的摘要缓存，同时统计命中与未命中次数。"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_hours=DEFAULT_TTL_HOURS, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours and ttl_hours > 0 else None
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb and max_size_mb > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                markdown TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_accessed ON summaries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, url, model_id):
+        """返回缓存的 Markdown；不存在或已过期时返回 None。"""
+        key = cache_key(url, model_id)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT markdown, created_at FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, url, model_id, md_text):
+        """写入（或覆盖）一条缓存，并在超出大小上限时淘汰最久未使用的条目。"""
+        key = cache_key(url, model_id)
+        now = time.time()
+        size = len(md_text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, url, model_id, markdown, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_url(url), model_id, md_text, size, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_size_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM summaries ORDER BY accessed_at").fetchall():
+            if total <= self.max_size_bytes:
+                break
+            self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+            total -= size
+
+    def stats_text(self):
+        return f"缓存命中 {self.hits} 次，未命中 {self.misses} 次"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def from_config(config):
+    """根据 config.txt 的 [Cache] 段创建缓存；enabled = false 时返回 None。"""
+    if not config.getboolean("Cache", "enabled", fallback=True):
+        return None
+    return SummaryCache(
+        path=config.get("Cache", "path", fallback=DEFAULT_CACHE_PATH),
+        ttl_hours=config.getfloat("Cache", "ttl_hours", fallback=DEFAULT_TTL_HOURS),
+        max_size_mb=config.getfloat("Cache", "max_size_mb", fallback=DEFAULT_MAX_SIZE_MB),
+    )
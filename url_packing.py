@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并请求：把多个短 URL 打包进同一个 LLM 请求，减少每个请求固定的开销
+（往返延迟、Bot 系统提示词的 token、建立连接）。
+
+- 打包：按输入顺序把相邻的待请求 URL 组成一组，每组的估算 token（提示词 + 各 URL 的预计摘要长度）
+  不超过 token_budget，且 URL 数不超过 max_urls；
+- 解析：要求模型在每篇摘要前单独输出一行分隔标记 <<<URL 序号>>>，按标记把回复拆回各 URL 的 Markdown；
+- 回退：整个请求失败，或某个 URL 的摘要缺失、无法解析时，该 URL 改为单独请求（fetch_markdown）。
+
+在 config.txt 的 [Packing] 段中设置 enabled = true 即可由 collect_to_md.main 的线程引擎使用。
+"""
+
+import re
+import threading
+import time
+from contextlib import nullcontext
+
+from collect_to_md import fetch_markdown, trim_leading_text
+
+DEFAULT_MAX_URLS = 5
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_TOKENS_PER_SUMMARY = 800
+
+PACKED_PROMPT = (
+    "请分别阅读并总结下面的 {count} 个链接，每个链接单独输出一篇完整的 Markdown 摘要，格式与只发送一个链接时相同。\n"
+    "每篇摘要之前单独占一行写出分隔标记 <<<URL 序号>>>（序号为下面列表中的编号），除摘要外不要输出其他内容。\n\n"
+    "{urls}"
+)
+
+MARKER_PATTERN = re.compile(r"^[ \t]*<<<\s*URL\s*(\d+)\s*>>>[ \t]*$", re.MULTILINE)
+CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符各算一个，其余按每 4 个字符一个。"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def build_prompt(urls):
+    """生成合并请求的提示词，URL 按 1、2、3… 编号。"""
+    listing = "\n".join(f"{i}. {url}" for i, url in enumerate(urls, 1))
+    return PACKED_PROMPT.format(count=len(urls), urls=listing)
+
+
+def parse_reply(content, count):
+    """
+    按分隔标记拆分合并请求的回复，返回 {序号(从 1 开始): md_text}。
+    序号越界、重复出现或内容不以 # 开头（去掉前导说明文字后）的部分都会被丢弃。
+    """
+    sections = {}
+    markers = list(MARKER_PATTERN.finditer(content))
+    for k, marker in enumerate(markers):
+        number = int(marker.group(1))
+        end = markers[k + 1].start() if k + 1 < len(markers) else len(content)
+        md_text = trim_leading_text(content[marker.end():end].strip())
+        if 1 <= number <= count and number not in sections and md_text.startswith("#"):
+            sections[number] = md_text
+    return sections
+
+
+class UrlPacker:
+    """把待请求的 URL 打包为合并请求，并统计合并与回退的次数。"""
+
+    def __init__(self, max_urls=DEFAULT_MAX_URLS, token_budget=DEFAULT_TOKEN_BUDGET,
+                 tokens_per_summary=DEFAULT_TOKENS_PER_SUMMARY):
+        self.max_urls = max(1, max_urls)
+        self.token_budget = token_budget
+        self.tokens_per_summary = tokens_per_summary
+        self.packed_requests = 0
+        self.packed_urls = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def pack(self, items):
+        """把 (idx, url) 按顺序分组，返回各组组成的列表；单个 URL 超出预算时单独成组。"""
+        base = estimate_tokens(build_prompt([]))
+        groups = []
+        group, used = [], base
+        for idx, url in items:
+            cost = estimate_tokens(f"{len(group) + 1}. {url}\n<<<URL {len(group) + 1}>>>\n") + self.tokens_per_summary
+            if group and (len(group) >= self.max_urls or used + cost > self.token_budget):
+                groups.append(group)
+                group, used = [], base
+            group.append((idx, url))
+            used += cost
+        if group:
+            groups.append(group)
+        return groups
+
+    def fetch(self, client, model_id, group, group_idx, cache=None, limiter=None, llm_slots=None, run_metrics=None,
+              deadline=None):
+        """
+        发送一组 URL 的合并请求（只有一个 URL 时按普通请求发送），解析失败的 URL 逐个单独请求。
+        参数与 fetch_markdown 相同（group 代替 url），可直接交给 run_sliding_window。
+        缓存只写不读：命中缓存的 URL 应在打包之前就取出，不参与打包。
+        返回值： (group_idx, [(idx, md_text 或 None, 错误信息或 None), ...], None)
+        """
+        single = dict(cache=cache, refresh=True, limiter=limiter, llm_slots=llm_slots, run_metrics=run_metrics,
+                      deadline=deadline)
+        if len(group) == 1:
+            idx, url = group[0]
+            return (group_idx, [fetch_markdown(client, model_id, url, idx, **single)], None)
+
+        queued_at = time.monotonic()
+
+        def request():
+            nonlocal queued_at
+            with llm_slots or nullcontext():
+                def create():
+                    timeout = {} if deadline is None else {"timeout": deadline.call_timeout()}
+                    return client.chat.completions.create(
+                        model=model_id,
+                        messages=[{"role": "user", "content": build_prompt([url for _, url in group])}],
+                        **timeout,
+                    )
+                if run_metrics is None:
+                    return create()
+                waited_since, queued_at = queued_at, None
+                return run_metrics.call(create, waited_since)
+
+        if deadline is not None:
+            request = deadline.guard(request)
+        try:
+            completion = limiter.call(request) if limiter is not None else request()
+            sections = parse_reply(completion.choices[0].message.content or "", len(group))
+        except Exception:
+            sections = {}
+        with self._lock:
+            self.packed_requests += 1
+            self.packed_urls += len(sections)
+            self.fallbacks += len(group) - len(sections)
+
+        results = []
+        for number, (idx, url) in enumerate(group, 1):
+            md_text = sections.get(number)
+            if md_text is None:
+                # 该 URL 的摘要缺失或无法解析：改为单独请求
+                results.append(fetch_markdown(client, model_id, url, idx, **single))
+                continue
+            if cache is not None:
+                cache.put(url, model_id, md_text)
+            results.append((idx, md_text, None))
+        return (group_idx, results, None)
+
+    def stats_text(self):
+        return f"合并请求 {self.packed_requests} 次（覆盖 {self.packed_urls} 个URL），回退单独请求 {self.fallbacks} 个URL"
+
+
+def from_config(config):
+    """从 [Packing] 段创建 UrlPacker；未启用时返回 None。"""
+    if not config.getboolean("Packing", "enabled", fallback=False):
+        return None
+    return UrlPacker(
+        max_urls=config.getint("Packing", "max_urls_per_request", fallback=DEFAULT_MAX_URLS),
+        token_budget=config.getint("Packing", "token_budget", fallback=DEFAULT_TOKEN_BUDGET),
+        tokens_per_summary=config.getint("Packing", "tokens_per_summary", fallback=DEFAULT_TOKENS_PER_SUMMARY),
+    )
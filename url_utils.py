@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+URL 规范化与去重工具：把只在大小写、跟踪参数、片段、末尾斜杠等细节上不同的链接
+映射到同一个规范形式，用作缓存键，以及在调用 LLM 前合并同一篇文章的重复链接。
+"""
+
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 只用于统计来源、不影响文章内容的查询参数
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "spm", "ref", "ref_src", "from", "share_token", "_hsenc", "_hsmi",
+}
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMS
+
+
+def normalize_url(url):
+    """
+    返回 URL 的规范形式：去除首尾空白，scheme 和 host 转为小写，去掉默认端口、#片段、
+    utm_* 等跟踪参数和路径末尾的斜杠，其余查询参数按名称排序。
+    无法解析的输入原样（去空白后）返回。
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parts.path.rstrip("/") or "/"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not is_tracking_param(k))
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def dedupe_urls(urls):
+    """
+    按规范形式对 URL 去重。
+    返回 (unique_urls, positions)：unique_urls 为去重后的 URL（保留首次出现时的原始写法），
+    positions[i] 为 unique_urls[i] 在原列表中出现的所有下标（升序）。
+    """
+    unique_urls = []
+    positions = []
+    seen = {}
+    for idx, url in enumerate(urls):
+        key = normalize_url(url)
+        if key in seen:
+            positions[seen[key]].append(idx)
+            continue
+        seen[key] = len(unique_urls)
+        unique_urls.append(url)
+        positions.append([idx])
+    return unique_urls, positions